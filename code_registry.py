@@ -0,0 +1,193 @@
+"""
+Code Registry - in-memory index of discount, referral and trial codes
+Validasi (ada / expired / max_uses) dilayani dari memory; counter pemakaian tetap dijaga
+database lewat conditional UPDATE supaya dua checkout bersamaan tidak bisa melewati max_uses.
+"""
+import os
+import threading
+import time
+from datetime import datetime
+from types import MappingProxyType
+
+from db_handler import Database, APP_TIMEZONE, from_db_timestamp
+
+CODE_REGISTRY_TTL = float(os.getenv('CODE_REGISTRY_TTL', '300'))  # detik - full reload sebagai safety net
+CODE_NEGATIVE_TTL = float(os.getenv('CODE_NEGATIVE_TTL', '30'))  # kode yang tidak ada diingat selama ini
+CODE_NEGATIVE_MAX = int(os.getenv('CODE_NEGATIVE_MAX', '10000'))  # batas entry negative cache
+CODES_CHANNEL = 'codes_changed'  # NOTIFY channel antar proses (PostgreSQL), payload "kind:CODE"
+
+# kind -> (SELECT tanpa WHERE, kolom kode)
+CODE_QUERIES = {
+    'discount': ('SELECT code, discount_percent, max_uses, used_count, code_expiry_date FROM discount_codes', 'code'),
+    'referral': ('SELECT code, COALESCE(analyst_id, created_by), analyst_name FROM referral_codes', 'code'),
+    'trial': ('SELECT trial_code, duration_days, max_uses, used_count, code_expiry_date, status FROM trial_members', 'trial_code'),
+}
+
+# Conditional UPDATE: rowcount 0 berarti kode sudah penuh (atau hilang) - cek ulang di database, bukan di memory
+HAS_CAPACITY = '(max_uses IS NULL OR max_uses <= 0 OR COALESCE(used_count, 0) < max_uses)'
+CONSUME_DISCOUNT_SQL = ('UPDATE discount_codes SET used_count = COALESCE(used_count, 0) + 1 '
+                        f'WHERE code = ? AND {HAS_CAPACITY}')
+
+Database.register_statements({
+    f'{kind}_code_by_code': f'{query} WHERE {column} = ?'
+    for kind, (query, column) in CODE_QUERIES.items()
+})
+
+
+class CodeUnavailable(Exception):
+    """Code vanished, expired or ran out of uses between validation and the conditional UPDATE"""
+
+
+def _expiry(value):
+    try:
+        return from_db_timestamp(value)
+    except (ValueError, TypeError):
+        return None  # tanggal rusak → dianggap tanpa expiry (sama seperti sebelumnya)
+
+
+def _make_entry(kind, row):
+    if kind == 'discount':
+        code, percent, max_uses, used_count, expiry = row
+        entry = {'discount_percent': int(percent or 0), 'max_uses': int(max_uses or 0),
+                 'used_count': int(used_count or 0), 'expires_at': _expiry(expiry)}
+    elif kind == 'referral':
+        code, analyst_id, analyst_name = row
+        entry = {'analyst_id': analyst_id, 'analyst_name': analyst_name}
+    else:
+        code, duration_days, max_uses, used_count, expiry, status = row
+        entry = {'duration_days': int(duration_days or 1), 'max_uses': int(max_uses or 0),
+                 'used_count': int(used_count or 0), 'expires_at': _expiry(expiry), 'status': status}
+    entry['code'] = code
+    return MappingProxyType(entry)
+
+
+class CodeRegistry:
+    """Index {kind: {CODE: entry}} loaded from the three code tables, plus a negative cache for misses"""
+
+    def __init__(self, ttl=CODE_REGISTRY_TTL, negative_ttl=CODE_NEGATIVE_TTL):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        self._index = {kind: {} for kind in CODE_QUERIES}
+        self._negative = {}  # (kind, CODE) -> expires_at monotonic
+        self._expires = 0.0
+        self._generation = 0
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.loads = 0
+
+    def load(self):
+        """Full reload of every code table (startup, TTL, or after a missed broadcast)"""
+        while True:
+            generation = self._generation
+            index = {kind: {} for kind in CODE_QUERIES}
+            conn = Database.connect()
+            try:
+                c = conn.cursor()
+                for kind, (query, _) in CODE_QUERIES.items():
+                    c.execute(query)
+                    for row in c.fetchall():
+                        if row[0]:
+                            index[kind][str(row[0]).upper()] = _make_entry(kind, row)
+            finally:
+                conn.close()
+            with self._lock:
+                # Ada refresh per-kode selama load → snapshot ini mungkin sudah basi, ulangi
+                if generation != self._generation:
+                    continue
+                self._index = index
+                self._negative.clear()
+                self._expires = time.monotonic() + self.ttl
+                self.loads += 1
+            return sum(len(codes) for codes in index.values())
+
+    def lookup(self, kind, code):
+        """Entry for code (read-only) or None - memory first, then negative cache, then one point query"""
+        code = (code or '').strip().upper()
+        if time.monotonic() >= self._expires:
+            self.load()
+        entry = self._index[kind].get(code)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        expires = self._negative.get((kind, code))
+        if expires is not None and time.monotonic() < expires:
+            self.negative_hits += 1
+            return None
+        self.misses += 1
+        # Bisa jadi kode baru dari proses lain yang broadcast-nya belum sampai
+        return self.refresh(kind, code)
+
+    def refresh(self, kind, code):
+        """Re-read one code from the database into the index (or the negative cache)"""
+        code = (code or '').strip().upper()
+        row = Database.execute_prepared(f'{kind}_code_by_code', (code,), fetch_one=True, commit=False)
+        entry = _make_entry(kind, tuple(row)) if row else None
+        with self._lock:
+            self._generation += 1
+            if entry is not None:
+                self._index[kind][code] = entry
+                self._negative.pop((kind, code), None)
+            else:
+                self._index[kind].pop(code, None)
+                if len(self._negative) >= CODE_NEGATIVE_MAX:
+                    self._negative.clear()
+                self._negative[(kind, code)] = time.monotonic() + self.negative_ttl
+        return entry
+
+    def check(self, kind, code, now=None):
+        """(entry, reason) - reason None kalau bisa dipakai, selain itu 'not_found' / 'expired' / 'exhausted'"""
+        entry = self.lookup(kind, code)
+        if entry is None:
+            return None, 'not_found'
+        expires_at = entry.get('expires_at')
+        if expires_at is not None and (now or datetime.now(APP_TIMEZONE)) > expires_at:
+            return entry, 'expired'
+        if entry.get('max_uses', 0) > 0 and entry['used_count'] >= entry['max_uses']:
+            return entry, 'exhausted'
+        return entry, None
+
+    def record_use(self, kind, code):
+        """Mirror a committed used_count + 1 into memory"""
+        code = (code or '').strip().upper()
+        with self._lock:
+            entry = self._index[kind].get(code)
+            if entry is not None and 'used_count' in entry:
+                updated = dict(entry)
+                updated['used_count'] += 1
+                self._index[kind][code] = MappingProxyType(updated)
+
+    def invalidate(self, kind, code, broadcast=True):
+        """Admin created/deleted a code: refresh it here and (PostgreSQL) in every other process"""
+        self.refresh(kind, code)
+        if broadcast:
+            try:
+                Database.notify(CODES_CHANNEL, f"{kind}:{code.strip().upper()}")
+            except Exception as e:
+                print(f"⚠️ Code registry broadcast failed: {e}")
+
+    def _on_notify(self, payload):
+        kind, _, code = (payload or '').partition(':')
+        if kind in CODE_QUERIES and code:
+            self.refresh(kind, code)
+        else:
+            self._expires = 0.0  # reconnect / payload tidak dikenal → full reload saat lookup berikutnya
+
+    def listen(self):
+        return Database.listen(CODES_CHANNEL, self._on_notify)
+
+    def stats(self):
+        lookups = self.hits + self.negative_hits + self.misses
+        return {
+            'codes': {kind: len(codes) for kind, codes in self._index.items()},
+            'hits': self.hits,
+            'negative_hits': self.negative_hits,
+            'misses': self.misses,
+            'hit_rate': round((self.hits + self.negative_hits) / lookups * 100, 1) if lookups else 0.0,
+            'negative_entries': len(self._negative),
+            'loads': self.loads,
+        }
+
+
+code_registry = CodeRegistry()
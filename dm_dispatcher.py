@@ -0,0 +1,216 @@
+"""
+DM Dispatcher - satu antrian untuk semua DM keluar
+Priority lane (konfirmasi pembayaran duluan, reminder belakangan), token bucket yang ikut
+header rate limit Discord, worker terbatas, retry + backoff, dan cache user yang menutup DM.
+"""
+import os
+import time
+import random
+import asyncio
+import functools
+import itertools
+from collections import deque
+
+import discord
+
+DM_RATE_PER_SEC = float(os.getenv('DM_RATE_PER_SEC', '4'))  # rata-rata DM per detik
+DM_BURST = int(os.getenv('DM_BURST', '5'))  # DM yang boleh keluar sekaligus setelah idle
+DM_CONCURRENCY = int(os.getenv('DM_CONCURRENCY', '4'))  # worker paralel
+DM_MAX_RETRIES = int(os.getenv('DM_MAX_RETRIES', '4'))  # retry untuk error sementara (429 / 5xx / network)
+DM_BACKOFF_BASE = float(os.getenv('DM_BACKOFF_BASE', '1'))  # detik, dikali 2^attempt + jitter
+DM_CLOSED_TTL = float(os.getenv('DM_CLOSED_TTL', '86400'))  # user dengan DM tertutup di-skip selama ini
+
+PRIORITY_PAYMENT = 0  # checkout link, pembayaran berhasil
+PRIORITY_NOTICE = 1  # order kadaluarsa, trial aktif, kick
+PRIORITY_REMINDER = 2  # warning jatuh tempo, expired
+LANES = {PRIORITY_PAYMENT: 'payment', PRIORITY_NOTICE: 'notice', PRIORITY_REMINDER: 'reminder'}
+
+
+def _retry_after(exc):
+    """Seconds Discord asked us to wait (RateLimited or 429 headers), else None"""
+    if isinstance(exc, getattr(discord, 'RateLimited', ())):
+        return float(exc.retry_after)
+    headers = getattr(getattr(exc, 'response', None), 'headers', None) or {}
+    for name in ('Retry-After', 'X-RateLimit-Reset-After'):
+        try:
+            return float(headers[name])
+        except (KeyError, TypeError, ValueError):
+            continue
+    return None
+
+
+def _user_id(target):
+    return int(target) if isinstance(target, (int, str)) else target.id
+
+
+def _finish(future, value):
+    if not future.done():
+        future.set_result(value)
+
+
+class TokenBucket:
+    """rate tokens/sec with a burst capacity; pause_for() stops everything until a rate-limit window resets"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause_for(self, seconds):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class DMDispatcher:
+    """Queue every outbound DM through one paced, bounded, retrying pipeline
+
+    send() harus dipanggil dari event loop bot dan mengembalikan Future (True terkirim / False gagal
+    permanen) - caller tidak perlu menunggu. Dari thread lain (Flask webhook) pakai send_threadsafe().
+    """
+
+    def __init__(self, client, rate=DM_RATE_PER_SEC, burst=DM_BURST, concurrency=DM_CONCURRENCY,
+                 max_retries=DM_MAX_RETRIES, backoff_base=DM_BACKOFF_BASE, closed_ttl=DM_CLOSED_TTL):
+        self._client = client
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.closed_ttl = closed_ttl
+        self._bucket = None
+        self._queue = None
+        self._loop = None
+        self._workers = []
+        self._seq = itertools.count()
+        self._closed = {}  # user_id -> expires_at monotonic
+        self._queued = {lane: 0 for lane in LANES}
+        self._sent_by_lane = {lane: 0 for lane in LANES}
+        self._sent_times = deque(maxlen=10000)
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.rate_limited = 0
+        self.skipped_closed = 0
+        self._latency_total = 0.0
+
+    def start(self):
+        """Spawn the workers on the running loop (idempotent - on_ready bisa terpanggil berkali-kali)"""
+        if self._workers:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._bucket = TokenBucket(self.rate, self.burst)
+        self._queue = asyncio.PriorityQueue()
+        self._workers = [self._loop.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    def send(self, target, priority=PRIORITY_NOTICE, **message):
+        """Queue a DM to a User/Member or user id - message kwargs go to user.send() (embed=, content=)"""
+        self.start()
+        future = self._loop.create_future()
+        user_id = _user_id(target)
+        expires = self._closed.get(user_id)
+        if expires is not None:
+            if time.monotonic() < expires:
+                self.skipped_closed += 1
+                future.set_result(False)
+                return future
+            del self._closed[user_id]
+        self._put(priority, [target, message, future, 0, time.monotonic()])
+        return future
+
+    def send_threadsafe(self, target, priority=PRIORITY_NOTICE, **message):
+        """send() from a non-loop thread (fire and forget)"""
+        loop = self._loop or self._client.loop
+        loop.call_soon_threadsafe(functools.partial(self.send, target, priority, **message))
+
+    def _put(self, priority, job):
+        self._queued[priority] = self._queued.get(priority, 0) + 1
+        self._queue.put_nowait((priority, next(self._seq), job))
+
+    async def _resolve(self, target):
+        if hasattr(target, 'send'):
+            return target
+        user_id = _user_id(target)
+        return self._client.get_user(user_id) or await self._client.fetch_user(user_id)
+
+    async def _worker(self):
+        while True:
+            priority, _, job = await self._queue.get()
+            self._queued[priority] -= 1
+            target, message, future, attempts, enqueued_at = job
+            try:
+                if future.done():
+                    continue
+                await self._bucket.acquire()
+                user = await self._resolve(target)
+                await user.send(**message)
+                now = time.monotonic()
+                self.sent += 1
+                self._sent_by_lane[priority] = self._sent_by_lane.get(priority, 0) + 1
+                self._sent_times.append(now)
+                self._latency_total += now - enqueued_at
+                _finish(future, True)
+            except (discord.Forbidden, discord.NotFound) as e:
+                # DM ditutup / user tidak ada - retry tidak akan berhasil, skip user ini untuk sementara
+                self._closed[_user_id(target)] = time.monotonic() + self.closed_ttl
+                self.failed += 1
+                print(f"⚠️ DM to {_user_id(target)} failed permanently: {e}")
+                _finish(future, False)
+            except asyncio.CancelledError:
+                _finish(future, False)
+                raise
+            except Exception as e:
+                self._handle_transient(priority, job, e)
+            finally:
+                self._queue.task_done()
+
+    def _handle_transient(self, priority, job, exc):
+        target, _, future, attempts, _ = job
+        retry_after = _retry_after(exc)
+        status = getattr(exc, 'status', None)
+        if retry_after is not None or status == 429:
+            self.rate_limited += 1
+            self._bucket.pause_for(retry_after if retry_after is not None else self.backoff_base)
+        # 4xx selain 429 (mis. embed tidak valid) tidak akan sembuh dengan retry
+        transient = status is None or status == 429 or status >= 500
+        if transient and attempts < self.max_retries:
+            delay = retry_after if retry_after is not None else self.backoff_base * (2 ** attempts) * (0.5 + random.random())
+            job[3] = attempts + 1
+            self.retried += 1
+            self._loop.call_later(delay, self._put, priority, job)
+            return
+        self.failed += 1
+        print(f"⚠️ DM to {_user_id(target)} failed after {attempts + 1} attempts: {exc}")
+        _finish(future, False)
+
+    def stats(self):
+        now = time.monotonic()
+        per_minute = sum(1 for t in self._sent_times if now - t <= 60)
+        return {
+            'queued': {LANES.get(lane, lane): count for lane, count in self._queued.items()},
+            'sent_by_lane': {LANES.get(lane, lane): count for lane, count in self._sent_by_lane.items()},
+            'sent': self.sent,
+            'failed': self.failed,
+            'retried': self.retried,
+            'rate_limited': self.rate_limited,
+            'skipped_closed': self.skipped_closed,
+            'closed_users': len(self._closed),
+            'per_minute': per_minute,
+            'avg_latency_ms': round(self._latency_total / self.sent * 1000, 1) if self.sent else 0.0,
+        }
@@ -0,0 +1,337 @@
+"""
+Email Templates - template HTML notifikasi di templates/email/, di-compile sekali saat import
+Fragment statis disimpan sudah ter-encode UTF-8; render per penerima hanya mengisi variabel,
+lalu MIME multipart/alternative (plaintext + HTML) dirakit langsung sebagai bytes.
+
+Syntax: {{ name }} variabel (di-escape di HTML), {{# name }}...{{/ name }} hanya tampil kalau
+name truthy, {{> _partial }} menyisipkan templates/email/_partial.html saat compile.
+
+Benchmark: python email_templates.py bench [-n 2000]
+"""
+import os
+import re
+import sys
+import html
+import time
+import uuid
+import base64
+import argparse
+from html.parser import HTMLParser
+from email.utils import formatdate, make_msgid
+
+TEMPLATE_DIR = os.getenv('EMAIL_TEMPLATE_DIR',
+                         os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates', 'email'))
+
+# name -> subject (file: templates/email/<name>.html)
+EMAIL_SUBJECTS = {
+    'welcome': '✅ Welcome {{ member_name }} - {{ package_name }}',
+    'renewal_invoice': '🔄 Invoice Perpanjangan - {{ member_name }} ({{ package_name }})',
+    'admin_new_member': '🎯 New Member - {{ member_name }} (Order: {{ order_id }})',
+    'expiry_reminder': '⚠️ Membership Expired - {{ member_name }}',
+    'expiry_warning': '⚠️ Pemberitahuan Penting: Masa Aktif Membership Berakhir - {{ member_name }}',
+    'trial_expiry_warning': '⏳ Trial Akan Berakhir - {{ member_name }}',
+    'trial_welcome': '🎉 Trial Activated - {{ member_name }}',
+    'admin_kick': '🚨 KICK NOTIFICATION - {{ member_name }} ({{ reason }})',
+}
+
+_TAG = re.compile(r'\{\{\s*([#/>]?)\s*(\w+)\s*\}\}')
+_PARTIAL = re.compile(r'\{\{\s*>\s*(\w+)\s*\}\}')
+_BLOCK_TAGS = {'p', 'div', 'br', 'tr', 'table', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr', 'li', 'ul', 'ol'}
+_SKIP_TAGS = {'head', 'style', 'script', 'title'}
+_CRLF = b'\r\n'
+
+
+class TemplateError(Exception):
+    """Template tidak valid (section tidak ditutup, partial hilang) atau variabel tidak diisi"""
+
+
+def _resolve_partials(source, directory, depth=0):
+    if depth > 5:
+        raise TemplateError('partials nested too deep')
+
+    def include(match):
+        path = os.path.join(directory, f'{match.group(1)}.html')
+        try:
+            with open(path, encoding='utf-8') as f:
+                partial = f.read().rstrip('\n')
+        except OSError:
+            raise TemplateError(f'partial not found: {match.group(1)}')
+        return _resolve_partials(partial, directory, depth + 1)
+
+    return _PARTIAL.sub(include, source)
+
+
+def _compile(source):
+    """Source -> ops: bytes (fragment statis, sudah di-encode), str (variabel), (name, ops) (section)"""
+    root = []
+    stack, open_sections = [root], []
+    pos = 0
+    for match in _TAG.finditer(source):
+        if match.start() > pos:
+            stack[-1].append(source[pos:match.start()].encode('utf-8'))
+        kind, name = match.groups()
+        if kind == '#':
+            section = []
+            stack[-1].append((name, section))
+            stack.append(section)
+            open_sections.append(name)
+        elif kind == '/':
+            if not open_sections or open_sections.pop() != name:
+                raise TemplateError(f'unexpected {{{{/ {name} }}}}')
+            stack.pop()
+        else:
+            stack[-1].append(name)
+        pos = match.end()
+    if open_sections:
+        raise TemplateError(f'unclosed section: {open_sections[-1]}')
+    if pos < len(source):
+        root.append(source[pos:].encode('utf-8'))
+    return root
+
+
+def _variables(ops, found=None):
+    found = set() if found is None else found
+    for op in ops:
+        if isinstance(op, str):
+            found.add(op)
+        elif isinstance(op, tuple):
+            found.add(op[0])
+            _variables(op[1], found)
+    return found
+
+
+def _render(ops, values, escape, out):
+    for op in ops:
+        kind = op.__class__
+        if kind is bytes:
+            out.append(op)
+        elif kind is str:
+            value = values[op]
+            text = '' if value is None else str(value)  # None = kosong, bukan teks "None"
+            out.append((html.escape(text) if escape else text).encode('utf-8'))
+        elif values[op[0]]:
+            _render(op[1], values, escape, out)
+
+
+class _TextExtractor(HTMLParser):
+    """HTML template source -> plaintext template source (placeholder {{ }} ikut terbawa apa adanya)"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._skip = 0
+        self._href = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP_TAGS:
+            self._skip += 1
+        elif tag in _BLOCK_TAGS:
+            self.parts.append('\n')
+        elif tag == 'td':
+            self.parts.append(' ')
+        if tag == 'a':
+            self._href.append(dict(attrs).get('href'))
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS:
+            self._skip = max(0, self._skip - 1)
+        elif tag in _BLOCK_TAGS:
+            self.parts.append('\n')
+        elif tag == 'a' and self._href:
+            href = self._href.pop()
+            if href:
+                self.parts.append(f' ({href})')
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.parts.append(data)
+
+    def text(self):
+        lines = [' '.join(line.split()) for line in ''.join(self.parts).splitlines()]
+        out = []
+        for line in lines:
+            if line or (out and out[-1]):
+                out.append(line)
+        return '\n'.join(out).strip() + '\n'
+
+
+def html_to_text(source):
+    extractor = _TextExtractor()
+    extractor.feed(source)
+    extractor.close()
+    return extractor.text()
+
+
+def _clean_address(value):
+    return str(value or '').replace('\r', '').replace('\n', '').strip()
+
+
+def _encoded_words(value):
+    """RFC 2047 base64 encoded-words, tiap word <= 75 char dan tidak memotong karakter UTF-8"""
+    words, chunk, size = [], [], 0
+    for char in value:
+        encoded = char.encode('utf-8')
+        if size + len(encoded) > 45:
+            words.append(b'=?utf-8?b?' + base64.b64encode(b''.join(chunk)) + b'?=')
+            chunk, size = [], 0
+        chunk.append(encoded)
+        size += len(encoded)
+    if chunk:
+        words.append(b'=?utf-8?b?' + base64.b64encode(b''.join(chunk)) + b'?=')
+    return b'\r\n '.join(words)
+
+
+def _encode_header(name, value):
+    try:
+        line = f'{name}: {value}'.encode('ascii')
+    except UnicodeEncodeError:
+        # email.header.Header menghitung panjang quoted-printable per karakter - jauh lebih lambat
+        line = f'{name}: '.encode('ascii') + _encoded_words(value)
+    return line + _CRLF
+
+
+def _body_part(content_type, body):
+    # base64 (binascii, C) - aman untuk emoji / UTF-8 tanpa perlu 8BITMIME di server
+    return (b'Content-Type: ' + content_type + b'; charset="utf-8"\r\n'
+            b'Content-Transfer-Encoding: base64\r\n\r\n'
+            + base64.encodebytes(body).replace(b'\n', _CRLF))
+
+
+class EmailTemplate:
+    """One compiled template: subject, HTML body and a plaintext alternative derived from the HTML"""
+
+    def __init__(self, name, subject, source, directory=TEMPLATE_DIR):
+        self.name = name
+        source = _resolve_partials(source, directory)
+        self._subject = _compile(subject)
+        self._html = _compile(source)
+        self._text = _compile(html_to_text(source))
+        self.variables = frozenset(_variables(self._subject) | _variables(self._html))
+
+    def render(self, **values):
+        """(subject str, html bytes, text bytes)"""
+        missing = self.variables.difference(values)
+        if missing:
+            raise TemplateError(f"{self.name}: missing {', '.join(sorted(missing))}")
+        subject, html_out, text_out = [], [], []
+        _render(self._subject, values, False, subject)
+        _render(self._html, values, True, html_out)
+        _render(self._text, values, False, text_out)
+        return b''.join(subject).decode('utf-8'), b''.join(html_out), b''.join(text_out)
+
+    def message(self, sender, to, **values):
+        """RenderedEmail siap untuk mailer.send() - render + MIME terjadi di as_bytes() (worker thread mailer)"""
+        missing = self.variables.difference(values)
+        if missing:
+            raise TemplateError(f"{self.name}: missing {', '.join(sorted(missing))}")
+        return RenderedEmail(self, sender, to, values)
+
+
+class RenderedEmail:
+    """Lazy multipart/alternative message; duck-types the bits of email.message.Message mailer uses"""
+
+    def __init__(self, template, sender, to, values):
+        self.template = template
+        self.sender = _clean_address(sender)
+        self.to = _clean_address(to)
+        self.values = values
+
+    def __getitem__(self, header):
+        header = header.lower()
+        if header == 'to':
+            return self.to
+        if header == 'from':
+            return self.sender
+        if header == 'subject':
+            return self.template.render(**self.values)[0]
+        return None
+
+    def as_bytes(self):
+        subject, html_body, text_body = self.template.render(**self.values)
+        boundary = f'=_dc_{uuid.uuid4().hex}'.encode('ascii')  # '_' tidak ada di alfabet base64
+        domain = self.sender.rpartition('@')[2] or 'localhost'
+        return b''.join((
+            _encode_header('Subject', subject),
+            _encode_header('From', self.sender),
+            _encode_header('To', self.to),
+            _encode_header('Date', formatdate(localtime=True)),
+            _encode_header('Message-ID', make_msgid(domain=domain)),
+            b'MIME-Version: 1.0\r\n',
+            b'Content-Type: multipart/alternative; boundary="', boundary, b'"\r\n\r\n',
+            b'--', boundary, _CRLF, _body_part(b'text/plain', text_body),
+            b'--', boundary, _CRLF, _body_part(b'text/html', html_body),
+            b'--', boundary, b'--\r\n',
+        ))
+
+
+def load_templates(directory=TEMPLATE_DIR, subjects=EMAIL_SUBJECTS):
+    templates = {}
+    for name, subject in subjects.items():
+        with open(os.path.join(directory, f'{name}.html'), encoding='utf-8') as f:
+            templates[name] = EmailTemplate(name, subject, f.read(), directory)
+    return templates
+
+
+email_templates = load_templates()
+
+
+# ============ BENCHMARK ============
+
+SAMPLE_VALUES = {
+    'member_name': 'Budi <Warrior>', 'member_email': 'budi@example.com', 'package_name': 'The Warrior 3 Bulan',
+    'member_avatar': 'https://cdn.discordapp.com/avatars/1/abc.png?size=128&x=1', 'order_id': 'DC-123456789',
+    'start_date': '01 January 2025 10:00', 'end_date': '01 April 2025 10:00', 'referral_code': 'ANALYST10',
+    'old_end_date': '01 April 2025', 'new_end_date': '01 July 2025', 'price': '299,000',
+    'discount_info': 'HEMAT10 (10%)', 'referral_info': '', 'trial_start': '01 January 2025 10:00',
+    'trial_end': '02 January 2025 10:00', 'duration_text': '1 Hari', 'grace_period_end': '03 January 2025',
+    'reason': 'Membership Expired', 'sent_at': '01 January 2025 10:00 WIB',
+}
+
+
+def _rate(fn, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    elapsed = time.perf_counter() - started
+    return iterations / elapsed if elapsed > 0 else float('inf')
+
+
+def benchmark(iterations=2000):
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+
+    print(f"{'template':<22}{'render/s':>12}{'message/s':>12}{'stdlib MIME/s':>15}")
+    for name, template in email_templates.items():
+        values = {key: SAMPLE_VALUES[key] for key in template.variables}
+
+        def stdlib_mime():
+            subject, html_body, text_body = template.render(**values)
+            msg = MIMEMultipart('alternative')
+            msg['Subject'] = subject
+            msg['From'] = 'bot@example.com'
+            msg['To'] = 'member@example.com'
+            msg.attach(MIMEText(text_body.decode('utf-8'), 'plain', 'utf-8'))
+            msg.attach(MIMEText(html_body.decode('utf-8'), 'html', 'utf-8'))
+            return msg.as_bytes()
+
+        message = template.message('bot@example.com', 'member@example.com', **values)
+        print(f"{name:<22}{_rate(lambda: template.render(**values), iterations):>12,.0f}"
+              f"{_rate(message.as_bytes, iterations):>12,.0f}"
+              f"{_rate(stdlib_mime, max(1, iterations // 4)):>15,.0f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Email template tools')
+    sub = parser.add_subparsers(dest='command', required=True)
+    bench = sub.add_parser('bench', help='renders/sec per template')
+    bench.add_argument('-n', '--iterations', type=int, default=2000)
+    preview = sub.add_parser('preview', help='print the rendered plaintext of a template')
+    preview.add_argument('name', choices=sorted(EMAIL_SUBJECTS))
+    args = parser.parse_args()
+
+    if args.command == 'bench':
+        benchmark(args.iterations)
+    else:
+        template = email_templates[args.name]
+        subject, _, text_body = template.render(**{key: SAMPLE_VALUES[key] for key in template.variables})
+        sys.stdout.write(f"Subject: {subject}\n\n{text_body.decode('utf-8')}")
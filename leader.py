@@ -0,0 +1,131 @@
+"""
+Leader Election - hanya satu replica yang menjalankan background task terjadwal
+PostgreSQL: pg_try_advisory_lock di koneksi khusus (lock hilang otomatis kalau koneksi/proses mati).
+SQLite: lease di tabel leader_leases yang diperpanjang tiap LEADER_RENEW_SECONDS.
+Replica lain standby dan mencoba ambil alih tiap LEADER_RENEW_SECONDS.
+"""
+import os
+import uuid
+import socket
+import asyncio
+import hashlib
+import time
+
+import psycopg2
+
+from db_handler import Database, DATABASE_URL, USE_POSTGRES
+
+LEADER_LEASE_SECONDS = float(os.getenv('LEADER_LEASE_SECONDS', '15'))  # lease SQLite kadaluarsa setelah ini tanpa renew
+LEADER_RENEW_SECONDS = float(os.getenv('LEADER_RENEW_SECONDS', '5'))  # interval renew / coba ambil alih
+
+# Upsert hanya menang kalau lease milik kita atau sudah kadaluarsa; RETURNING kosong = dipegang replica lain
+ACQUIRE_LEASE_SQL = '''INSERT INTO leader_leases (name, holder, expires_at) VALUES (?, ?, ?)
+                       ON CONFLICT (name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at
+                       WHERE leader_leases.holder = excluded.holder OR leader_leases.expires_at < ?
+                       RETURNING holder'''
+
+
+def _lock_key(name):
+    """Stable signed 64-bit advisory lock key per lease name"""
+    return int.from_bytes(hashlib.sha1(f'warrior:{name}'.encode()).digest()[:8], 'big', signed=True)
+
+
+class LeaderElection:
+    """run(on_elected, on_demoted) loops forever; callbacks are async and called on every transition"""
+
+    def __init__(self, name='scheduler', lease_seconds=LEADER_LEASE_SECONDS, renew_seconds=LEADER_RENEW_SECONDS):
+        self.name = name
+        self.lease_seconds = lease_seconds
+        self.renew_seconds = renew_seconds
+        self.identity = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.is_leader = False
+        self._conn = None  # PostgreSQL: koneksi yang memegang advisory lock
+        self._since = None
+        self.elections = 0
+        self.demotions = 0
+        self.errors = 0
+
+    # ---- PostgreSQL ----
+    def _hold_advisory_lock(self):
+        if self._conn is not None:
+            try:
+                # Heartbeat: koneksi hidup = lock masih dipegang
+                with self._conn.cursor() as c:
+                    c.execute('SELECT 1')
+                return True
+            except psycopg2.Error:
+                self._close_conn()
+                raise
+        conn = psycopg2.connect(DATABASE_URL, connect_timeout=5)
+        conn.autocommit = True
+        try:
+            with conn.cursor() as c:
+                c.execute('SELECT pg_try_advisory_lock(%s)', (_lock_key(self.name),))
+                acquired = c.fetchone()[0]
+        except Exception:
+            conn.close()
+            raise
+        if acquired:
+            self._conn = conn
+        else:
+            conn.close()
+        return acquired
+
+    def _close_conn(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            try:
+                conn.close()  # advisory lock ikut dilepas oleh server
+            except psycopg2.Error:
+                pass
+
+    # ---- SQLite ----
+    def _hold_lease(self):
+        now = time.time()
+        row = Database.execute(ACQUIRE_LEASE_SQL, (self.name, self.identity, now + self.lease_seconds, now),
+                               fetch_one=True)
+        return bool(row) and row[0] == self.identity
+
+    def try_acquire(self):
+        """Acquire or renew leadership (blocking - call via Database.arun)"""
+        return self._hold_advisory_lock() if USE_POSTGRES else self._hold_lease()
+
+    def release(self):
+        if USE_POSTGRES:
+            self._close_conn()
+        else:
+            Database.execute('DELETE FROM leader_leases WHERE name = ? AND holder = ?', (self.name, self.identity))
+
+    async def run(self, on_elected, on_demoted):
+        while True:
+            try:
+                held = await Database.arun(self.try_acquire)
+            except Exception as e:
+                self.errors += 1
+                print(f"⚠️ Leader election '{self.name}' error: {e}")
+                held = False
+            if held and not self.is_leader:
+                self.is_leader = True
+                self._since = time.time()
+                self.elections += 1
+                print(f"👑 {self.identity} is now leader for '{self.name}'")
+                await on_elected()
+            elif not held and self.is_leader:
+                # Lease hilang (DB putus / replica lain ambil alih) → hentikan task sebelum leader baru mulai
+                self.is_leader = False
+                self._since = None
+                self.demotions += 1
+                print(f"⚠️ {self.identity} lost leadership for '{self.name}'")
+                await on_demoted()
+            await asyncio.sleep(self.renew_seconds)
+
+    def stats(self):
+        return {
+            'identity': self.identity,
+            'backend': 'advisory_lock' if USE_POSTGRES else 'lease_table',
+            'is_leader': self.is_leader,
+            'leader_for_s': round(time.time() - self._since) if self._since else 0,
+            'elections': self.elections,
+            'demotions': self.demotions,
+            'errors': self.errors,
+        }
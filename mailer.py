@@ -0,0 +1,349 @@
+"""
+Mailer - antrian email dengan pool sesi SMTP yang tetap login
+Caller cukup enqueue (tidak blocking); worker thread memegang satu sesi SMTP masing-masing,
+reconnect kalau sesi putus, dan mengirim backlog berturut-turut di sesi yang sama.
+
+Local stand-in untuk development:
+    python mailer.py serve --port 1025
+    SMTP_HOST=localhost SMTP_PORT=1025 SMTP_USE_SSL=0 python main.py
+"""
+import os
+import sys
+import time
+import queue
+import random
+import smtplib
+import argparse
+import threading
+import socketserver
+from concurrent.futures import Future
+from email import message_from_bytes
+
+SMTP_HOST = os.getenv('SMTP_HOST', 'smtp.gmail.com')
+SMTP_PORT = int(os.getenv('SMTP_PORT', '465'))
+SMTP_USE_SSL = os.getenv('SMTP_USE_SSL', '1') == '1'  # 0 = plain SMTP (+ STARTTLS kalau server menawarkan)
+SMTP_POOL_SIZE = int(os.getenv('SMTP_POOL_SIZE', '2'))  # sesi SMTP / worker thread
+SMTP_TIMEOUT = float(os.getenv('SMTP_TIMEOUT', '30'))  # detik per operasi socket
+SMTP_MAX_RETRIES = int(os.getenv('SMTP_MAX_RETRIES', '3'))  # retry untuk error sementara (putus, 4xx)
+SMTP_IDLE_SECONDS = float(os.getenv('SMTP_IDLE_SECONDS', '120'))  # sesi idle lebih lama dari ini dicek NOOP dulu
+
+
+class SMTPSession:
+    """One authenticated SMTP connection, opened lazily and reopened after a failure"""
+
+    def __init__(self, host, port, use_ssl, user, password, timeout):
+        self.host = host
+        self.port = port
+        self.use_ssl = use_ssl
+        self.user = user
+        self.password = password
+        self.timeout = timeout
+        self._server = None
+        self._last_used = 0.0
+        self.connects = 0
+
+    def _open(self):
+        if self.use_ssl:
+            server = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            server.ehlo()
+            if server.has_extn('starttls'):
+                server.starttls()
+                server.ehlo()
+        if self.user and self.password:
+            server.login(self.user, self.password)
+        self.connects += 1
+        return server
+
+    def ensure(self, idle_seconds):
+        """Open the session, or NOOP-check one that sat idle (server bisa menutup sesi idle diam-diam)"""
+        if self._server is not None and time.monotonic() - self._last_used > idle_seconds:
+            try:
+                if self._server.noop()[0] != 250:
+                    self.close()
+            except (smtplib.SMTPException, OSError):
+                self.close()
+        if self._server is None:
+            self._server = self._open()
+        return self._server
+
+    def send(self, sender, recipients, payload, idle_seconds):
+        server = self.ensure(idle_seconds)
+        refused = server.sendmail(sender, recipients, payload)
+        self._last_used = time.monotonic()
+        return refused
+
+    def close(self):
+        server, self._server = self._server, None
+        if server is None:
+            return
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            try:
+                server.close()
+            except OSError:
+                pass
+
+    @property
+    def is_open(self):
+        return self._server is not None
+
+
+def _is_transient(exc):
+    """Putus / timeout / 4xx layak di-retry; auth gagal, 5xx dan recipient ditolak tidak"""
+    if isinstance(exc, (smtplib.SMTPAuthenticationError, smtplib.SMTPRecipientsRefused)):
+        return False
+    if isinstance(exc, smtplib.SMTPResponseException):
+        return 400 <= exc.smtp_code < 500
+    return isinstance(exc, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, OSError))
+
+
+class Mailer:
+    """Queue of outgoing messages drained by pool_size worker threads, one SMTP session each
+
+    send() aman dipanggil dari thread mana pun (event loop bot, Flask webhook) dan langsung return
+    Future (True terkirim / False gagal permanen).
+    """
+
+    def __init__(self, sender, password, host=SMTP_HOST, port=SMTP_PORT, use_ssl=SMTP_USE_SSL,
+                 pool_size=SMTP_POOL_SIZE, timeout=SMTP_TIMEOUT, max_retries=SMTP_MAX_RETRIES,
+                 idle_seconds=SMTP_IDLE_SECONDS):
+        self.sender = sender
+        self.password = password
+        self.host = host
+        self.port = port
+        self.use_ssl = use_ssl
+        self.pool_size = max(1, pool_size)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.idle_seconds = idle_seconds
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._workers = []
+        self._sessions = []
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self._send_total = 0.0
+        self._latency_total = 0.0
+
+    @property
+    def configured(self):
+        return bool(self.sender and self.password)
+
+    def start(self):
+        """Spawn the worker threads (idempotent)"""
+        with self._lock:
+            if self._workers:
+                return
+            for i in range(self.pool_size):
+                session = SMTPSession(self.host, self.port, self.use_ssl, self.sender, self.password, self.timeout)
+                worker = threading.Thread(target=self._worker, args=(session,), name=f'smtp-{i}', daemon=True)
+                self._sessions.append(session)
+                self._workers.append(worker)
+                worker.start()
+
+    def send(self, msg, recipients=None):
+        """Queue a MIME message; recipients default to msg['To']"""
+        self.start()
+        future = Future()
+        if recipients is None:
+            recipients = [addr.strip() for addr in (msg['To'] or '').split(',') if addr.strip()]
+        elif isinstance(recipients, str):
+            recipients = [recipients]
+        self._queue.put((msg, list(recipients), future, time.monotonic()))
+        return future
+
+    def _worker(self, session):
+        try:
+            while True:
+                job = self._queue.get()
+                if job is None:
+                    return
+                # Sesi tetap login di antara email - backlog keluar tanpa handshake TLS + AUTH per email
+                self._deliver(session, *job)
+        finally:
+            session.close()
+
+    def _deliver(self, session, msg, recipients, future, enqueued_at):
+        try:
+            payload = msg.as_bytes()
+        except Exception as e:
+            self._fail(future, recipients, e)
+            return
+        for attempt in range(self.max_retries + 1):
+            started = time.monotonic()
+            try:
+                session.send(self.sender, recipients, payload, self.idle_seconds)
+            except Exception as e:
+                session.close()
+                if not _is_transient(e) or attempt >= self.max_retries:
+                    self._fail(future, recipients, e, attempt + 1)
+                    return
+                with self._lock:
+                    self.retried += 1
+                if attempt or not isinstance(e, smtplib.SMTPServerDisconnected):
+                    # Sesi lama yang diputus server langsung reconnect; selain itu backoff + jitter
+                    time.sleep(min(30.0, 2 ** attempt) * (0.5 + random.random()))
+                continue
+            now = time.monotonic()
+            with self._lock:
+                self.sent += 1
+                self._send_total += now - started
+                self._latency_total += now - enqueued_at
+            future.set_result(True)
+            return
+
+    def _fail(self, future, recipients, exc, attempts=1):
+        with self._lock:
+            self.failed += 1
+        print(f"❌ Email to {', '.join(recipients)} failed after {attempts} attempts: {exc}")
+        future.set_result(False)
+
+    def stop(self, timeout=30):
+        """Drain the queue, then close every session (shutdown)"""
+        with self._lock:
+            workers = list(self._workers)
+            self._workers = []
+        for _ in workers:
+            self._queue.put(None)
+        deadline = time.monotonic() + timeout
+        for worker in workers:
+            worker.join(max(0.0, deadline - time.monotonic()))
+        self._sessions = []
+
+    def stats(self):
+        with self._lock:
+            sent = self.sent
+            return {
+                'queued': self._queue.qsize(),
+                'sent': sent,
+                'failed': self.failed,
+                'retried': self.retried,
+                'sessions_open': sum(1 for session in self._sessions if session.is_open),
+                'connects': sum(session.connects for session in self._sessions),
+                'avg_send_ms': round(self._send_total / sent * 1000, 1) if sent else 0.0,
+                'avg_latency_ms': round(self._latency_total / sent * 1000, 1) if sent else 0.0,
+            }
+
+
+# ============ LOCAL SMTP STAND-IN ============
+
+class _StandInHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP (EHLO, AUTH PLAIN/LOGIN, MAIL, RCPT, DATA, NOOP, RSET, QUIT) for smtplib"""
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def readline(self):
+        line = self.rfile.readline()
+        if not line:
+            raise ConnectionError('client closed')
+        return line.rstrip(b'\r\n')
+
+    def handle(self):
+        server = self.server
+        self.reply('220 localhost stand-in SMTP ready')
+        sender, recipients, delivered = None, [], 0
+        try:
+            while True:
+                line = self.readline().decode('utf-8', 'replace')
+                verb, _, arg = line.partition(' ')
+                verb = verb.upper()
+                if verb in ('EHLO', 'HELO'):
+                    if verb == 'EHLO':
+                        self.reply('250-localhost')
+                        self.reply('250-8BITMIME')
+                        self.reply('250 AUTH PLAIN LOGIN')
+                    else:
+                        self.reply('250 localhost')
+                elif verb == 'AUTH':
+                    mechanism, _, initial = arg.partition(' ')
+                    if mechanism.upper() == 'LOGIN':
+                        for prompt in ('VXNlcm5hbWU6', 'UGFzc3dvcmQ6'):
+                            if initial:
+                                initial = ''
+                                continue
+                            self.reply(f'334 {prompt}')
+                            self.readline()
+                    elif not initial:
+                        self.reply('334 ')
+                        self.readline()
+                    self.reply('235 2.7.0 Authentication successful')
+                elif verb == 'MAIL':
+                    sender, recipients = arg.partition(':')[2].split()[0].strip('<>'), []
+                    self.reply('250 OK')
+                elif verb == 'RCPT':
+                    recipients.append(arg.partition(':')[2].strip().strip('<>'))
+                    self.reply('250 OK')
+                elif verb == 'DATA':
+                    self.reply('354 End data with <CR><LF>.<CR><LF>')
+                    lines = []
+                    while True:
+                        data = self.readline()
+                        if data == b'.':
+                            break
+                        lines.append(data[1:] if data.startswith(b'..') else data)
+                    server.record(sender, recipients, b'\r\n'.join(lines))
+                    delivered += 1
+                    self.reply('250 OK queued')
+                    if server.drop_after and delivered >= server.drop_after:
+                        return  # simulasi server memutus sesi → client harus reconnect
+                elif verb == 'NOOP':
+                    self.reply('250 OK')
+                elif verb == 'RSET':
+                    sender, recipients = None, []
+                    self.reply('250 OK')
+                elif verb == 'QUIT':
+                    self.reply('221 Bye')
+                    return
+                else:
+                    self.reply('502 Command not implemented')
+        except (ConnectionError, OSError):
+            return
+
+
+class LocalSMTPServer(socketserver.ThreadingTCPServer):
+    """In-process SMTP sink for development - received messages end up in .messages"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=1025, drop_after=0, verbose=False):
+        super().__init__((host, port), _StandInHandler)
+        self.drop_after = drop_after
+        self.verbose = verbose
+        self.messages = []
+        self._lock = threading.Lock()
+
+    def record(self, sender, recipients, data):
+        msg = message_from_bytes(data)
+        with self._lock:
+            self.messages.append((sender, recipients, msg))
+        if self.verbose:
+            print(f"📨 {sender} → {', '.join(recipients)}: {msg['Subject']}")
+
+    def start(self):
+        """Serve on a daemon thread; returns the bound port"""
+        threading.Thread(target=self.serve_forever, name='smtp-stand-in', daemon=True).start()
+        return self.server_address[1]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local SMTP stand-in for the bot mailer')
+    sub = parser.add_subparsers(dest='command', required=True)
+    serve = sub.add_parser('serve', help='print every received message')
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=1025)
+    serve.add_argument('--drop-after', type=int, default=0, help='close each session after N messages')
+    args = parser.parse_args()
+
+    stand_in = LocalSMTPServer(args.host, args.port, drop_after=args.drop_after, verbose=True)
+    print(f"📬 SMTP stand-in listening on {args.host}:{args.port} (SMTP_USE_SSL=0)")
+    try:
+        stand_in.serve_forever()
+    except KeyboardInterrupt:
+        stand_in.server_close()
+        sys.exit(0)
@@ -7,17 +7,26 @@ import pytz
 import requests
 from flask import Flask, request
 import threading
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 import json
 import asyncio
 import random
 from enum import Enum
+from types import MappingProxyType
 from typing import Optional, Dict, List, Tuple
 import urllib.parse
-import midtransclient
-from db_handler import Database, USE_POSTGRES
+from db_handler import Database, USE_POSTGRES, DB_SLOW_QUERY_MS, to_db_timestamp, from_db_timestamp, format_db_timestamp
+from migrations import run_migrations
+from code_registry import code_registry, CodeUnavailable, CONSUME_DISCOUNT_SQL, HAS_CAPACITY
+from scheduler import DeadlineScheduler
+from dm_dispatcher import DMDispatcher, PRIORITY_PAYMENT, PRIORITY_NOTICE, PRIORITY_REMINDER
+from mailer import Mailer
+from email_templates import email_templates
+from role_service import RoleService
+from leader import LeaderElection
+from outbox import Outbox
+from webhook_ingest import WebhookIngest, NOTIFICATION_KIND
+from webhook_server import WebhookServer, WEBHOOK_SERVER, WEBHOOK_HOST, WEBHOOK_PORT, local_url
+from payment_gateway import MidtransSnap, PaymentGatewayError, MIDTRANS_TIMEOUT
 
 # ============ CONFIG ============
 DISCORD_TOKEN = os.getenv('DISCORD_TOKEN')
@@ -44,155 +53,62 @@ bot = commands.Bot(command_prefix='/', intents=intents)
 bot.is_synced = False
 tree = bot.tree
 
-# Midtrans setup
-midtrans_client = midtransclient.Snap(
-    is_production=False,
-    server_key=MIDTRANS_SERVER_KEY,
-    client_key=MIDTRANS_CLIENT_KEY
-)
+# Deadline expiry / reminder / order timeout (handler didaftarkan di DEADLINE HANDLERS)
+scheduler = DeadlineScheduler()
+dm_dispatcher = DMDispatcher(bot)
+
+# Role name → Role index (di-update event role) + batch perubahan role
+role_service = RoleService()
+role_service.register(bot)
+
+# Email keluar: antrian + pool sesi SMTP (lihat mailer.py, SMTP_* env)
+mailer = Mailer(GMAIL_SENDER, GMAIL_PASSWORD)
+
+# Side effect aktivasi pembayaran (role, DM, email) - ditulis di transaksi yang sama, dijalankan worker outbox
+outbox = Outbox()
+# /webhook/midtrans: validasi + simpan notifikasi ke outbox, aktivasi jalan di worker (lihat webhook_ingest.py)
+webhook_ingest = WebhookIngest(outbox, MIDTRANS_SERVER_KEY)
+
+HOME_PAGE = '''
+<html>
+    <head><title>Diary Crypto Payment Bot</title></head>
+    <body style="font-family: Arial; text-align: center; padding: 50px;">
+        <h1>🤖 Diary Crypto Payment Bot - Running</h1>
+        <p>Bot Status: <b>ONLINE ✅</b></p>
+        <p>Discord Guild: Diary Crypto</p>
+        <p>Payment Gateway: Midtrans SANDBOX</p>
+    </body>
+</html>
+'''
+
+# WEBHOOK_SERVER=aiohttp: / dan /webhook/midtrans dilayani di event loop bot (tanpa thread Flask)
+webhook_server = WebhookServer(webhook_ingest, HOME_PAGE)
+
+# Midtrans Snap - client async dengan pool keep-alive, deadline, retry + circuit breaker (MIDTRANS_* env)
+payment_gateway = MidtransSnap(MIDTRANS_SERVER_KEY)
 
 # ============ DATABASE SETUP ============
 def init_db():
-    """Initialize database - Only for SQLite (development)
-    PostgreSQL databases are created via migrate_to_postgres.py on Render"""
-    if USE_POSTGRES:
-        print("ℹ️ PostgreSQL mode detected - skipping SQLite init_db()")
-        print("✅ Database tables will be created by migration script on Render")
-        return
-    
-    # SQLite initialization (development only)
-    conn = Database.connect()
-    c = conn.cursor()
-    
-    c.execute('''CREATE TABLE IF NOT EXISTS subscriptions (
-                    order_id TEXT PRIMARY KEY,
-                    discord_id TEXT NOT NULL,
-                    discord_username TEXT,
-                    nama TEXT,
-                    email TEXT,
-                    package_type TEXT,
-                    payment_method TEXT,
-                    status TEXT DEFAULT "pending",
-                    start_date TEXT,
-                    end_date TEXT,
-                    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                    referral_code TEXT,
-                    referrer_id TEXT,
-                    expiry_reminder_count INTEGER DEFAULT 0
-                )''')
-    
-    # Add missing column if it doesn't exist (migration for existing databases)
-    try:
-        c.execute('ALTER TABLE subscriptions ADD COLUMN expiry_reminder_count INTEGER DEFAULT 0')
-        print("✅ Migration: Added expiry_reminder_count column to subscriptions table")
-    except Exception as e:
-        if "duplicate column" in str(e) or "already exists" in str(e):
-            pass  # Column already exists, skip
-        else:
-            print(f"⚠️ Migration warning: {e}")
-    
-    c.execute('''CREATE TABLE IF NOT EXISTS pending_orders (
-                    order_id TEXT PRIMARY KEY,
-                    discord_id TEXT,
-                    discord_username TEXT,
-                    nama TEXT,
-                    email TEXT,
-                    package_type TEXT,
-                    price REAL DEFAULT 0,
-                    payment_url TEXT,
-                    status TEXT DEFAULT "pending",
-                    created_at TEXT DEFAULT CURRENT_TIMESTAMP
-                )''')
-    
-    c.execute('''CREATE TABLE IF NOT EXISTS trial_members (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    trial_code TEXT UNIQUE,
-                    discord_id TEXT,
-                    discord_username TEXT,
-                    email TEXT,
-                    username TEXT,
-                    trial_started TEXT,
-                    trial_end TEXT,
-                    status TEXT,
-                    created_at TEXT,
-                    created_by TEXT,
-                    duration_days INTEGER DEFAULT 1,
-                    validity_days INTEGER DEFAULT 1,
-                    code_expiry_date TEXT,
-                    max_uses INTEGER DEFAULT 1,
-                    used_count INTEGER DEFAULT 0
-                )''')
-    
-    c.execute('''CREATE TABLE IF NOT EXISTS referral_codes (
-                    code TEXT PRIMARY KEY,
-                    created_by TEXT,
-                    created_date TEXT DEFAULT CURRENT_TIMESTAMP,
-                    uses INT DEFAULT 0,
-                    max_uses INT
-                )''')
-    
-    c.execute('''CREATE TABLE IF NOT EXISTS commissions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    analyst_id TEXT,
-                    referred_member_id TEXT,
-                    commission_amount REAL,
-                    package_type TEXT,
-                    earned_date TEXT DEFAULT CURRENT_TIMESTAMP,
-                    status TEXT DEFAULT "pending"
-                )''')
-    
-    c.execute('''CREATE TABLE IF NOT EXISTS packages (
-                    package_id TEXT PRIMARY KEY,
-                    package_name TEXT,
-                    price REAL,
-                    duration_days REAL,
-                    duration_text TEXT,
-                    role_name TEXT DEFAULT "The Warrior",
-                    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                    created_by TEXT
-                )''')
-    
-    c.execute('''CREATE TABLE IF NOT EXISTS closed_periods (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    year_month TEXT UNIQUE,
-                    total_revenue REAL,
-                    total_members INTEGER,
-                    total_transactions INTEGER,
-                    closed_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                    closed_by TEXT
-                )''')
-    
-    c.execute('''CREATE TABLE IF NOT EXISTS renewals (
-                    order_id TEXT PRIMARY KEY,
-                    discord_id TEXT,
-                    discord_username TEXT,
-                    package_type TEXT,
-                    old_end_date TEXT,
-                    new_end_date TEXT,
-                    renewal_price REAL,
-                    discount_applied TEXT,
-                    referral_applied TEXT,
-                    status TEXT DEFAULT "pending",
-                    created_at TEXT
-                )''')
-    
-    # Insert default packages jika table kosong
-    c.execute('SELECT COUNT(*) FROM packages')
-    if c.fetchone()[0] == 0:
-        default_packages = [
-            ('warrior_15min', 'The Warrior 15 Minutes', 200000, 15/1440, '15 menit', WARRIOR_ROLE_NAME, None),
-            ('warrior_1hour', 'The Warrior 1 Hour', 50000, 1/24, '1 jam', WARRIOR_ROLE_NAME, None),
-            ('warrior_1month', 'The Warrior 1 Month', 299000, 30, '1 bulan', WARRIOR_ROLE_NAME, None),
-            ('warrior_3month', 'The Warrior 3 Months', 649000, 90, '3 bulan', WARRIOR_ROLE_NAME, None)
-        ]
-        c.executemany(
-            'INSERT INTO packages (package_id, package_name, price, duration_days, duration_text, role_name, created_by) VALUES (?, ?, ?, ?, ?, ?, ?)',
-            default_packages
-        )
+    """Initialize database - apply schema migrations (SQLite & PostgreSQL), lalu seed default packages"""
+    run_migrations()
+    
+    def seed_packages(conn, c):
+        # Insert default packages jika table kosong
+        c.execute('SELECT COUNT(*) FROM packages')
+        if c.fetchone()[0] == 0:
+            default_packages = [
+                ('warrior_15min', 'The Warrior 15 Minutes', 200000, 15/1440, '15 menit', WARRIOR_ROLE_NAME, None),
+                ('warrior_1hour', 'The Warrior 1 Hour', 50000, 1/24, '1 jam', WARRIOR_ROLE_NAME, None),
+                ('warrior_1month', 'The Warrior 1 Month', 299000, 30, '1 bulan', WARRIOR_ROLE_NAME, None),
+                ('warrior_3month', 'The Warrior 3 Months', 649000, 90, '3 bulan', WARRIOR_ROLE_NAME, None)
+            ]
+            c.executemany(
+                'INSERT INTO packages (package_id, package_name, price, duration_days, duration_text, role_name, created_by) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                default_packages
+            )
     
-    conn.commit()
-    conn.close()
-    print("✅ SQLite database initialized")
+    Database.write(seed_packages)
+    print("✅ Database initialized")
 
 init_db()
 
@@ -223,31 +139,110 @@ def format_jakarta_datetime_full(date_str):
     return jakarta_dt.strftime('%d %B %Y')
 
 # ============ PACKAGES ============
-def get_all_packages():
-    """Load semua packages dari database"""
+# Katalog paket jarang berubah (hanya lewat /manage_packages) tapi dibaca di setiap /buy, webhook dan loop expiry
+PACKAGE_CACHE_TTL = float(os.getenv('PACKAGE_CACHE_TTL', '300'))  # detik - safety net kalau invalidasi terlewat
+PACKAGES_CHANNEL = 'packages_changed'  # NOTIFY channel antar proses (PostgreSQL)
+
+def load_packages():
+    """Query packages table → read-only mapping {package_id: read-only package}"""
+    conn = Database.connect()
     try:
-        conn = Database.connect()
         c = conn.cursor()
-        
         c.execute('SELECT package_id, package_name, price, duration_days, duration_text, role_name FROM packages ORDER BY created_at')
         rows = c.fetchall()
+    finally:
         conn.close()
-        
-        packages = {}
-        for row in rows:
-            pkg_id, pkg_name, price, duration_days, duration_text, role_name = row
-            packages[pkg_id] = {
-                'name': pkg_name,
-                'price': int(price),
-                'duration_days': float(duration_days),
-                'duration_text': duration_text,
-                'role_name': role_name
-            }
-        
-        return packages if packages else {}
+    
+    packages = {}
+    for row in rows:
+        pkg_id, pkg_name, price, duration_days, duration_text, role_name = row
+        packages[pkg_id] = MappingProxyType({
+            'name': pkg_name,
+            'price': int(price),
+            'duration_days': float(duration_days),
+            'duration_text': duration_text,
+            'role_name': role_name
+        })
+    return MappingProxyType(packages)
+
+class PackageCatalog:
+    """In-process cache of the package catalog - explicit invalidation plus TTL
+    
+    Objek yang dikembalikan immutable (MappingProxyType), jadi caller tidak bisa mengubah copy di cache.
+    """
+    
+    def __init__(self, loader, ttl=PACKAGE_CACHE_TTL):
+        self._loader = loader
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entry = None  # (packages, expires_at monotonic)
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+    
+    def get(self):
+        entry = self._entry
+        if entry is not None and time.monotonic() < entry[1]:
+            self.hits += 1
+            return entry[0]
+        with self._lock:
+            entry = self._entry
+            if entry is not None and time.monotonic() < entry[1]:
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            generation = self._generation
+            packages = self._loader()
+            # Invalidate yang datang selama load berarti hasil ini mungkin sudah basi - jangan disimpan
+            if generation == self._generation:
+                self._entry = (packages, time.monotonic() + self.ttl)
+            return packages
+    
+    def invalidate(self, broadcast=True):
+        """Drop the cached catalog; broadcast=True also tells other processes (PostgreSQL NOTIFY)"""
+        self._generation += 1
+        self._entry = None
+        self.invalidations += 1
+        if broadcast:
+            try:
+                Database.notify(PACKAGES_CHANNEL)
+            except Exception as e:
+                print(f"⚠️ Package cache broadcast failed: {e}")
+    
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups * 100, 1) if lookups else 0.0,
+            'invalidations': self.invalidations,
+            'ttl': self.ttl,
+        }
+
+package_catalog = PackageCatalog(load_packages)
+# Proses lain (replica / worker) yang ubah paket → buang cache di proses ini juga
+Database.listen(PACKAGES_CHANNEL, lambda payload: package_catalog.invalidate(broadcast=False))
+
+def get_all_packages():
+    """Semua packages (cached, read-only) - {} kalau database error"""
+    try:
+        return package_catalog.get()
     except Exception as e:
         print(f"Error loading packages: {e}")
-        return {}
+        return MappingProxyType({})
+
+# ============ PREPARED STATEMENTS ============
+# Query paling sering jalan: di PostgreSQL di-PREPARE sekali per koneksi lalu cukup EXECUTE
+Database.register_statements({
+    'pending_order_by_id': 'SELECT order_id, discord_id, discord_username, nama, email, package_type, payment_url, status, created_at FROM pending_orders WHERE order_id = ?',
+    'active_subscription_by_member': 'SELECT package_type, end_date FROM subscriptions WHERE discord_id = ? AND status = "active"',
+    'active_subscription_detail_by_member': 'SELECT email, nama, start_date, end_date FROM subscriptions WHERE discord_id = ? AND status = "active"',
+})
+
+# Kode diskon / referral / trial divalidasi dari memory (lihat code_registry.py)
+code_registry.load()
+code_registry.listen()
 
 # ============ HELPER FUNCTIONS ============
 def is_commission_manager(interaction: discord.Interaction):
@@ -255,34 +250,18 @@ def is_commission_manager(interaction: discord.Interaction):
     return interaction.user.id == interaction.guild.owner_id or interaction.user.guild_permissions.administrator
 
 def verify_discount_code(code: str) -> Dict:
-    """Verify dan get discount code details"""
+    """Verify dan get discount code details (dari code registry)"""
     try:
-        conn = Database.connect()
-        c = conn.cursor()
-        
-        # Create table jika belum exist
-        c.execute('''CREATE TABLE IF NOT EXISTS discount_codes (
-            code TEXT PRIMARY KEY,
-            discount_percent INTEGER,
-            max_uses INTEGER,
-            used_count INTEGER DEFAULT 0,
-            created_at TEXT,
-            created_by TEXT
-        )''')
-        
-        c.execute('SELECT discount_percent, max_uses, used_count FROM discount_codes WHERE code = ?', (code.upper(),))
-        result = c.fetchone()
-        conn.close()
+        entry, reason = code_registry.check('discount', code)
         
-        if not result:
+        if reason == 'not_found':
             return {"valid": False, "message": "Kode diskon tidak ditemukan"}
+        if reason == 'expired':
+            return {"valid": False, "message": "Kode diskon sudah expired"}
+        if reason == 'exhausted':
+            return {"valid": False, "message": f"Kode diskon sudah mencapai batas penggunaan ({entry['used_count']}/{entry['max_uses']})"}
         
-        discount_percent, max_uses, used_count = result
-        
-        # Check max uses
-        if max_uses > 0 and used_count >= max_uses:
-            return {"valid": False, "message": f"Kode diskon sudah mencapai batas penggunaan ({used_count}/{max_uses})"}
-        
+        discount_percent = entry['discount_percent']
         return {
             "valid": True,
             "discount_percent": discount_percent,
@@ -294,26 +273,12 @@ def verify_discount_code(code: str) -> Dict:
 def verify_referral_code(code: str) -> Dict:
     """Verify dan get referral code details - 30% komisi untuk analyst"""
     try:
-        conn = Database.connect()
-        c = conn.cursor()
+        entry, reason = code_registry.check('referral', code)
         
-        # Create table jika belum exist
-        c.execute('''CREATE TABLE IF NOT EXISTS referral_codes (
-            code TEXT PRIMARY KEY,
-            analyst_id TEXT,
-            analyst_name TEXT,
-            commission_percent INTEGER DEFAULT 30,
-            created_at TEXT
-        )''')
-        
-        c.execute('SELECT analyst_id, analyst_name FROM referral_codes WHERE code = ?', (code.upper(),))
-        result = c.fetchone()
-        conn.close()
-        
-        if not result:
+        if reason:
             return {"valid": False, "message": "Kode referral tidak ditemukan"}
         
-        analyst_id, analyst_name = result
+        analyst_id, analyst_name = entry['analyst_id'], entry['analyst_name']
         return {
             "valid": True,
             "analyst_id": analyst_id,
@@ -329,14 +294,10 @@ def generate_referral_code(member_id):
     return code
 
 def get_pending_order(order_id):
-    conn = Database.connect()
-    c = conn.cursor()
-    c.execute('SELECT order_id, discord_id, discord_username, nama, email, package_type, payment_url, status, created_at FROM pending_orders WHERE order_id = ?', (order_id,))
-    order = c.fetchone()
-    conn.close()
-    return order
+    order = Database.execute_prepared('pending_order_by_id', (order_id,), fetch_one=True, commit=False)
+    return tuple(order) if order else None
 
-def generate_snap_token(order_id, price, customer_name, customer_email):
+async def generate_snap_token(order_id, price, customer_name, customer_email):
     """Generate Midtrans Snap Token dengan redirect URL untuk payment page"""
     try:
         transaction_details = {
@@ -354,7 +315,7 @@ def generate_snap_token(order_id, price, customer_name, customer_email):
             "customer_details": customer_details
         }
         
-        snap_response = midtrans_client.create_transaction(payload)
+        snap_response = await payment_gateway.create_transaction(payload)
         
         # Ambil redirect_url dari response (ini adalah URL yang benar dari Midtrans)
         redirect_url = snap_response.get('redirect_url')
@@ -369,42 +330,117 @@ def generate_snap_token(order_id, price, customer_name, customer_email):
         else:
             print(f"❌ Error in response: {snap_response}")
             return None
-    except Exception as e:
+    except PaymentGatewayError as e:
         print(f"❌ Error generating payment link: {e}")
         return None
 
-def save_pending_order(order_id, discord_id, username, nama, email, package_type, payment_url):
-    conn = Database.connect()
-    c = conn.cursor()
-    created_at = get_jakarta_datetime().strftime('%Y-%m-%d %H:%M:%S')
-    c.execute('''INSERT OR REPLACE INTO pending_orders 
-                (order_id, discord_id, discord_username, nama, email, package_type, payment_url, created_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
-             (order_id, discord_id, username, nama, email, package_type, payment_url, created_at))
-    conn.commit()
-    conn.close()
-
-def save_subscription(order_id, discord_id, username, nama, email, package_type, referral_code=None, referrer_id=None):
+async def _gateway_down(interaction):
+    """Circuit breaker Midtrans open → tolak checkout sebelum order/diskon dicatat"""
+    if payment_gateway.available():
+        return False
+    embed = discord.Embed(
+        title="⏳ Pembayaran Sedang Gangguan",
+        description="Payment gateway Midtrans sedang tidak merespons. Order Anda **belum** dibuat dan kode diskon tidak terpakai.",
+        color=0xff4444
+    )
+    embed.add_field(name="💡 Saran", value=f"Silakan coba lagi dalam ±{max(1, round(payment_gateway.breaker.retry_in()))} detik", inline=False)
+    embed.set_footer(text="Diary Crypto Payment Bot • Real Time WIB")
+    await interaction.followup.send(embed=embed, ephemeral=True)
+    return True
+
+# Checkout ulang (double click / buka /buy lagi) dengan paket, harga akhir dan referral yang sama → pakai order yang masih hidup
+PAYMENT_LINK_REUSE_MIN_LEFT = timedelta(minutes=2)  # sisa waktu minimal supaya link lama masih sempat dibayar
+PAYMENT_LINK_PENDING_GRACE = timedelta(seconds=MIDTRANS_TIMEOUT + 15)  # order tanpa link lebih tua dari ini = Snap gagal
+checkout_metrics = {'created': 0, 'reused': 0}
+
+# payment_url NULL = link masih dibuat checkout sebelumnya (submit ganda); komisi ikut kunci reuse
+OPEN_CHECKOUT_SQL = '''SELECT p.order_id, p.payment_url, p.created_at FROM pending_orders p
+                       LEFT JOIN commissions c ON c.order_id = p.order_id
+                       WHERE p.discord_id = ? AND p.package_type = ? AND p.price = ? AND p.order_id LIKE ?
+                         AND p.status = "pending" AND p.created_at > ? AND COALESCE(c.analyst_id, '') = ?
+                         AND (p.payment_url IS NOT NULL OR p.created_at > ?)
+                       ORDER BY p.created_at DESC LIMIT 1'''
+
+def find_open_checkout(tx, discord_id, package_id, price, prefix, analyst_id=None):
+    """Di dalam unit checkout, sebelum order baru dicatat: (order_id, payment_url, expires_at) order identik, atau None
+
+    Cek + INSERT dalam satu unit: di SQLite unit antre di writer thread, di PostgreSQL checkout member +
+    paket yang sama antre di advisory lock transaksi - submit bersamaan selalu melihat order yang pertama.
+    """
+    if USE_POSTGRES:
+        tx.fetchone('SELECT pg_advisory_xact_lock(hashtext(?))', (f'checkout:{discord_id}:{package_id}',))
+    now = get_jakarta_datetime()
+    row = tx.fetchone(OPEN_CHECKOUT_SQL, (discord_id, package_id, price, f'{prefix}_%',
+                                          to_db_timestamp(now - ORDER_TIMEOUT + PAYMENT_LINK_REUSE_MIN_LEFT),
+                                          str(analyst_id or ''), to_db_timestamp(now - PAYMENT_LINK_PENDING_GRACE)))
+    if not row:
+        return None
+    order_id, payment_url, created_at = row
+    return order_id, payment_url, from_db_timestamp(created_at) + ORDER_TIMEOUT
+
+async def send_open_checkout(interaction, pkg, final_price, open_checkout):
+    order_id, payment_link, expires_at = open_checkout
+    checkout_metrics['reused'] += 1
+    embed = discord.Embed(
+        title="🔁 Checkout Masih Aktif",
+        description="Anda sudah punya order yang belum dibayar untuk paket & harga yang sama - silakan lanjutkan pembayaran dengan link ini.",
+        color=0xf7931a
+    )
+    embed.add_field(name="📦 Paket", value=f"**{pkg['name']}**", inline=True)
+    embed.add_field(name="💳 Harga Akhir", value=f"Rp **{final_price:,}**", inline=True)
+    embed.add_field(name="📋 Order ID", value=f"`{order_id}`", inline=False)
+    embed.add_field(name="⏰ Berlaku Sampai", value=format_jakarta_datetime(expires_at), inline=False)
+    if payment_link:
+        embed.add_field(name="🔗 Link Pembayaran", value=f"[Klik di sini untuk bayar]({payment_link})", inline=False)
+    else:
+        # Submit ganda: checkout pertama masih menunggu Midtrans dan mengirim link lewat DM
+        embed.add_field(name="🔗 Link Pembayaran", value="Sedang dibuat - link dikirim lewat DM sebentar lagi", inline=False)
+    embed.set_footer(text="Diary Crypto Payment Bot • Real Time WIB")
+    await interaction.followup.send(embed=embed, ephemeral=True)
+    print(f"🔁 Open checkout {order_id} reused for {interaction.user}")
+
+def save_pending_order(order_id, discord_id, username, nama, email, package_type, payment_url, price=0, tx=None):
+    """Simpan pending order; kalau ada tx, INSERT ikut unit-of-work checkout"""
+    created_at = to_db_timestamp(get_jakarta_datetime())
+    query = '''INSERT OR REPLACE INTO pending_orders 
+                (order_id, discord_id, discord_username, nama, email, package_type, payment_url, price, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)'''
+    params = (order_id, discord_id, username, nama, email, package_type, payment_url, price, created_at)
+    due = from_db_timestamp(created_at) + ORDER_TIMEOUT
+    if tx is not None:
+        tx.defer(query, params)
+        tx.after_commit(scheduler.schedule, 'order_timeout', order_id, due)  # rollback → tidak ada timer hantu
+    else:
+        Database.execute(query, params)
+        scheduler.schedule('order_timeout', order_id, due)
+
+def save_subscription(order_id, discord_id, username, nama, email, package_type, referral_code=None, referrer_id=None, tx=None):
+    """Aktifkan subscription; return (start_date, end_date) string WIB, atau False kalau paket tidak ada"""
     packages = get_all_packages()
     package = packages.get(package_type)
     if not package:
         return False
     
-    conn = Database.connect()
-    c = conn.cursor()
-    
     start = get_jakarta_datetime()
     end = start + timedelta(days=package['duration_days'])
+    start_str = start.strftime('%Y-%m-%d %H:%M:%S')
     
-    c.execute('''INSERT OR REPLACE INTO subscriptions 
+    query = '''INSERT OR REPLACE INTO subscriptions 
                 (order_id, discord_id, discord_username, nama, email, package_type, status, start_date, end_date, referral_code, referrer_id)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-             (order_id, discord_id, username, nama, email, package_type, 'active',
-              start.strftime('%Y-%m-%d %H:%M:%S'), end.strftime('%Y-%m-%d %H:%M:%S'), referral_code, referrer_id))
-    
-    conn.commit()
-    conn.close()
-    return True
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'''
+    params = (order_id, discord_id, username, nama, email, package_type, 'active',
+              start_str, to_db_timestamp(end), referral_code, referrer_id)
+    if tx is not None:
+        tx.defer(query, params)
+        tx.after_commit(schedule_subscription, order_id, end)
+    else:
+        Database.execute(query, params)
+        schedule_subscription(order_id, end)
+    return start_str, end.strftime('%Y-%m-%d %H:%M:%S')
+
+def _queue_email(template, to, **values):
+    """Render lazily di worker thread mailer - caller (event loop / webhook) hanya enqueue"""
+    return mailer.send(email_templates[template].message(GMAIL_SENDER, to, **values), to)
 
 def send_welcome_email(member_name, email, package_name, order_id, start_date, end_date, referral_code, member_avatar):
     if not GMAIL_SENDER or not GMAIL_PASSWORD:
@@ -412,111 +448,9 @@ def send_welcome_email(member_name, email, package_name, order_id, start_date, e
         return False
     
     try:
-        html_content = f"""
-        <html>
-            <head>
-                <meta charset="UTF-8">
-                <meta name="viewport" content="width=device-width, initial-scale=1.0">
-                <style>
-                    @media (max-width: 480px) {{
-                        .header {{ padding: 20px 15px !important; }}
-                        .header h1 {{ font-size: 24px !important; }}
-                        .header h2 {{ font-size: 14px !important; }}
-                        .content {{ padding: 20px !important; }}
-                        .info-box {{ padding: 12px !important; }}
-                    }}
-                </style>
-            </head>
-            <body style="font-family: 'Segoe UI', Arial, sans-serif; background: linear-gradient(135deg, #f5f5f5 0%, #e8e8e8 100%); margin: 0; padding: 20px;">
-                <div style="max-width: 600px; margin: 0 auto; border-radius: 12px; overflow: hidden; box-shadow: 0 4px 15px rgba(0,0,0,0.1);">
-                    
-                    <!-- Orange Gradient Header -->
-                    <div class="header" style="background: linear-gradient(135deg, #f7931a 0%, #ff7f00 100%); padding: 25px 20px; text-align: center; color: white;">
-                        <h1 style="margin: 0 0 5px 0; font-size: 28px; font-weight: bold;">🎉 SELAMAT!</h1>
-                        <h2 style="margin: 0; font-size: 16px; font-weight: 400; letter-spacing: 0.5px;">{member_name}</h2>
-                    </div>
-                    
-                    <!-- White Content Area -->
-                    <div style="background-color: white; padding: 30px;">
-                        
-                        <!-- Avatar -->
-                        <div style="text-align: center; margin-bottom: 20px;">
-                            <img src="{member_avatar}" alt="Avatar" style="width: 100px; height: 100px; border-radius: 50%; border: 4px solid #f7931a; box-shadow: 0 2px 8px rgba(247,147,26,0.3);">
-                        </div>
-                        
-                        <!-- Title -->
-                        <h3 style="text-align: center; color: #f7931a; font-size: 20px; margin: 0 0 20px 0;">✨ Membership Aktif ✨</h3>
-                        
-                        <!-- Info Box -->
-                        <div style="background: linear-gradient(135deg, #fff9f0 0%, #fffbf5 100%); border-left: 4px solid #f7931a; padding: 15px; border-radius: 4px; margin-bottom: 20px;">
-                            
-                            <!-- Paket -->
-                            <div style="display: flex; justify-content: space-between; margin-bottom: 12px; padding-bottom: 12px; border-bottom: 1px solid #ffe8cc;">
-                                <span style="color: #666; font-weight: 600;">🎁 Paket:</span>
-                                <span style="color: #f7931a; font-weight: bold;">{package_name}</span>
-                            </div>
-                            
-                            <!-- Berakhir -->
-                            <div style="display: flex; justify-content: space-between; margin-bottom: 12px; padding-bottom: 12px; border-bottom: 1px solid #ffe8cc;">
-                                <span style="color: #666; font-weight: 600;">📅 Berakhir:</span>
-                                <span style="color: #333; font-weight: bold;">{end_date}</span>
-                            </div>
-                            
-                            <!-- Status -->
-                            <div style="display: flex; justify-content: space-between;">
-                                <span style="color: #666; font-weight: 600;">💚 Status:</span>
-                                <span style="background-color: #00ff00; color: white; padding: 4px 12px; border-radius: 20px; font-weight: bold; font-size: 12px;">AKTIF</span>
-                            </div>
-                        </div>
-                        
-                        <!-- Message -->
-                        <div style="text-align: center; background-color: #f7f7f7; padding: 15px; border-radius: 4px; margin-bottom: 20px;">
-                            <p style="color: #f7931a; font-style: italic; margin: 0;">✨ Nikmati akses eksklusif The Warrior! ✨</p>
-                        </div>
-                        
-                        <!-- Details Table -->
-                        <table style="width: 100%; border-collapse: collapse; margin-bottom: 20px;">
-                            <tr style="background-color: #f9f9f9;">
-                                <td style="padding: 10px; border: 1px solid #e0e0e0; color: #666;"><strong>Order ID:</strong></td>
-                                <td style="padding: 10px; border: 1px solid #e0e0e0; color: #333; font-family: monospace;">{order_id}</td>
-                            </tr>
-                            <tr>
-                                <td style="padding: 10px; border: 1px solid #e0e0e0; color: #666;"><strong>Mulai:</strong></td>
-                                <td style="padding: 10px; border: 1px solid #e0e0e0; color: #333;">{start_date}</td>
-                            </tr>
-                            <tr style="background-color: #f9f9f9;">
-                                <td style="padding: 10px; border: 1px solid #e0e0e0; color: #666;"><strong>Kode Referral:</strong></td>
-                                <td style="padding: 10px; border: 1px solid #e0e0e0; color: #f7931a; font-weight: bold; font-size: 14px;">{referral_code}</td>
-                            </tr>
-                        </table>
-                        
-                        <!-- Footer Message -->
-                        <p style="text-align: center; color: #f7931a; font-size: 14px; margin-top: 20px;">
-                            💡 Jika ada pertanyaan, hubungi admin kami!
-                        </p>
-                    </div>
-                    
-                    <!-- Orange Footer -->
-                    <div style="background: linear-gradient(135deg, #f7931a 0%, #ff7f00 100%); padding: 20px; text-align: center; color: white; font-size: 12px;">
-                        © 2025 DiaryCrypto - The Warrior Membership
-                    </div>
-                </div>
-            </body>
-        </html>
-        """
-        
-        msg = MIMEMultipart('alternative')
-        msg['Subject'] = f"✅ Welcome {member_name} - {package_name}"
-        msg['From'] = GMAIL_SENDER
-        msg['To'] = email
-        
-        msg.attach(MIMEText(html_content, 'html'))
-        
-        with smtplib.SMTP_SSL('smtp.gmail.com', 465) as server:
-            server.login(GMAIL_SENDER, GMAIL_PASSWORD)
-            server.sendmail(GMAIL_SENDER, email, msg.as_string())
-        
-        print(f"✅ Welcome email sent to {email}")
+        _queue_email('welcome', email, member_name=member_name, package_name=package_name, order_id=order_id,
+                     start_date=start_date, end_date=end_date, referral_code=referral_code, member_avatar=member_avatar)
+        print(f"✅ Welcome email queued for {email}")
         return True
     except Exception as e:
         print(f"❌ Error sending welcome email: {e}")
@@ -529,113 +463,12 @@ def send_renewal_invoice_email(member_name, email, package_name, order_id, old_e
         return False
     
     try:
-        html_content = f"""
-        <html>
-            <head>
-                <meta charset="UTF-8">
-                <meta name="viewport" content="width=device-width, initial-scale=1.0">
-                <style>
-                    @media (max-width: 480px) {{
-                        .header {{ padding: 20px 15px !important; }}
-                        .content {{ padding: 20px !important; }}
-                    }}
-                </style>
-            </head>
-            <body style="font-family: 'Segoe UI', Arial, sans-serif; background: linear-gradient(135deg, #f5f5f5 0%, #e8e8e8 100%); margin: 0; padding: 20px;">
-                <div style="max-width: 600px; margin: 0 auto; border-radius: 12px; overflow: hidden; box-shadow: 0 4px 15px rgba(0,0,0,0.1);">
-                    
-                    <!-- Orange Gradient Header -->
-                    <div class="header" style="background: linear-gradient(135deg, #f7931a 0%, #ff7f00 100%); padding: 25px 20px; text-align: center; color: white;">
-                        <h1 style="margin: 0 0 5px 0; font-size: 28px; font-weight: bold;">🔄 PERPANJANGAN BERHASIL!</h1>
-                        <h2 style="margin: 0; font-size: 16px; font-weight: 400; letter-spacing: 0.5px;">Invoice Perpanjangan Membership</h2>
-                    </div>
-                    
-                    <!-- White Content Area -->
-                    <div class="content" style="background-color: white; padding: 30px;">
-                        
-                        <!-- Avatar -->
-                        <div style="text-align: center; margin-bottom: 20px;">
-                            <img src="{member_avatar}" alt="Avatar" style="width: 100px; height: 100px; border-radius: 50%; border: 4px solid #f7931a; box-shadow: 0 2px 8px rgba(247,147,26,0.3);">
-                        </div>
-                        
-                        <!-- Title -->
-                        <h3 style="text-align: center; color: #f7931a; font-size: 20px; margin: 0 0 20px 0;">✨ Membership Diperpanjang ✨</h3>
-                        
-                        <!-- Info Box -->
-                        <div style="background: linear-gradient(135deg, #fff9f0 0%, #fffbf5 100%); border-left: 4px solid #f7931a; padding: 15px; border-radius: 4px; margin-bottom: 20px;">
-                            
-                            <!-- Paket -->
-                            <div style="display: flex; justify-content: space-between; margin-bottom: 12px; padding-bottom: 12px; border-bottom: 1px solid #ffe8cc;">
-                                <span style="color: #666; font-weight: 600;">📦 Paket:</span>
-                                <span style="color: #f7931a; font-weight: bold;">{package_name}</span>
-                            </div>
-                            
-                            <!-- Old End Date -->
-                            <div style="display: flex; justify-content: space-between; margin-bottom: 12px; padding-bottom: 12px; border-bottom: 1px solid #ffe8cc;">
-                                <span style="color: #666; font-weight: 600;">📅 Perpanjang Dari:</span>
-                                <span style="color: #333; font-weight: bold;">{old_end_date}</span>
-                            </div>
-                            
-                            <!-- New End Date -->
-                            <div style="display: flex; justify-content: space-between; margin-bottom: 12px; padding-bottom: 12px; border-bottom: 1px solid #ffe8cc;">
-                                <span style="color: #666; font-weight: 600;">📅 Sampai:</span>
-                                <span style="color: #333; font-weight: bold;">{new_end_date}</span>
-                            </div>
-                            
-                            <!-- Status -->
-                            <div style="display: flex; justify-content: space-between;">
-                                <span style="color: #666; font-weight: 600;">💚 Status:</span>
-                                <span style="background-color: #00ff00; color: white; padding: 4px 12px; border-radius: 20px; font-weight: bold; font-size: 12px;">AKTIF</span>
-                            </div>
-                        </div>
-                        
-                        <!-- Invoice Details Table -->
-                        <table style="width: 100%; border-collapse: collapse; margin-bottom: 20px;">
-                            <tr style="background-color: #f9f9f9;">
-                                <td style="padding: 10px; border: 1px solid #e0e0e0; color: #666;"><strong>Order ID:</strong></td>
-                                <td style="padding: 10px; border: 1px solid #e0e0e0; color: #333; font-family: monospace;">{order_id}</td>
-                            </tr>
-                            <tr>
-                                <td style="padding: 10px; border: 1px solid #e0e0e0; color: #666;"><strong>Harga Paket:</strong></td>
-                                <td style="padding: 10px; border: 1px solid #e0e0e0; color: #333; font-weight: bold;">Rp {price:,}</td>
-                            </tr>
-                            <tr style="background-color: #fff9f0; border: 1px solid #f7931a;">
-                                <td style="padding: 10px; border: 1px solid #f7931a; color: #f7931a; font-weight: bold;"><strong>Total Invoice:</strong></td>
-                                <td style="padding: 10px; border: 1px solid #f7931a; color: #f7931a; font-weight: bold; font-size: 16px;">Rp {price:,}</td>
-                            </tr>
-                        </table>
-
-                        {f'<p style="color: #f7931a; font-size: 14px; margin: 0 0 10px 0;"><strong>Diskon Diterapkan:</strong> {discount_info}</p>' if discount_info != 'none' else ''}
-                        {f'<p style="color: #f7931a; font-size: 14px; margin: 0;"><strong>Referral:</strong> {referral_info}</p>' if referral_info != 'none' else ''}
-                        
-                        <!-- Footer Message -->
-                        <p style="text-align: center; color: #f7931a; font-size: 14px; margin-top: 20px; line-height: 1.8; font-weight: 600;">
-                            ✨ Terimakasih Atas Loyalitas Nya Ke Diary Crypto ✨<br>
-                            <span style="color: #666; font-size: 12px;">Akses eksklusif Anda telah diperbarui dan siap digunakan.</span>
-                        </p>
-                    </div>
-                    
-                    <!-- Orange Footer -->
-                    <div style="background: linear-gradient(135deg, #f7931a 0%, #ff7f00 100%); padding: 20px; text-align: center; color: white; font-size: 12px;">
-                        © 2025 DiaryCrypto - The Warrior Membership
-                    </div>
-                </div>
-            </body>
-        </html>
-        """
-        
-        msg = MIMEMultipart('alternative')
-        msg['Subject'] = f"🔄 Invoice Perpanjangan - {member_name} ({package_name})"
-        msg['From'] = GMAIL_SENDER
-        msg['To'] = email
-        
-        msg.attach(MIMEText(html_content, 'html'))
-        
-        with smtplib.SMTP_SSL('smtp.gmail.com', 465) as server:
-            server.login(GMAIL_SENDER, GMAIL_PASSWORD)
-            server.sendmail(GMAIL_SENDER, email, msg.as_string())
-        
-        print(f"✅ Renewal invoice email sent to {email}")
+        _queue_email('renewal_invoice', email, member_name=member_name, package_name=package_name, order_id=order_id,
+                     old_end_date=old_end_date, new_end_date=new_end_date, price=f"{price:,}",
+                     discount_info=discount_info if discount_info != 'none' else '',
+                     referral_info=referral_info if referral_info != 'none' else '',
+                     member_avatar=member_avatar)
+        print(f"✅ Renewal invoice email queued for {email}")
         return True
     except Exception as e:
         print(f"❌ Error sending renewal invoice email: {e}")
@@ -647,58 +480,9 @@ def send_admin_new_member_notification(member_name, order_id, package_name, memb
         return False
     
     try:
-        html_content = f"""
-        <html>
-            <body style="font-family: Arial, sans-serif; background-color: #f5f5f5;">
-                <div style="max-width: 600px; margin: 0 auto; background-color: white; padding: 20px; border-radius: 8px;">
-                    <h2 style="color: #00aa00; text-align: center;">✅ NEW MEMBER JOINED</h2>
-                    <hr style="border: 1px solid #ddd;">
-                    
-                    <p><strong>Informasi Member Baru:</strong></p>
-                    
-                    <table style="width: 100%; border-collapse: collapse; margin: 20px 0;">
-                        <tr style="background-color: #f9f9f9;">
-                            <td style="padding: 10px; border: 1px solid #ddd;"><strong>Member:</strong></td>
-                            <td style="padding: 10px; border: 1px solid #ddd;">{member_name}</td>
-                        </tr>
-                        <tr>
-                            <td style="padding: 10px; border: 1px solid #ddd;"><strong>Email:</strong></td>
-                            <td style="padding: 10px; border: 1px solid #ddd;">{member_email}</td>
-                        </tr>
-                        <tr style="background-color: #f9f9f9;">
-                            <td style="padding: 10px; border: 1px solid #ddd;"><strong>Paket:</strong></td>
-                            <td style="padding: 10px; border: 1px solid #ddd;">{package_name}</td>
-                        </tr>
-                        <tr>
-                            <td style="padding: 10px; border: 1px solid #ddd;"><strong>Order ID:</strong></td>
-                            <td style="padding: 10px; border: 1px solid #ddd;">{order_id}</td>
-                        </tr>
-                        <tr style="background-color: #f9f9f9;">
-                            <td style="padding: 10px; border: 1px solid #ddd;"><strong>Waktu:</strong></td>
-                            <td style="padding: 10px; border: 1px solid #ddd;">{format_jakarta_datetime(datetime.now())}</td>
-                        </tr>
-                    </table>
-                    
-                    <p style="color: #666; font-size: 12px; margin-top: 20px; text-align: center;">
-                        Email ini dikirim otomatis oleh sistem
-                    </p>
-                </div>
-            </body>
-        </html>
-        """
-        
-        msg = MIMEMultipart('alternative')
-        msg['Subject'] = f"🎯 New Member - {member_name} (Order: {order_id})"
-        msg['From'] = GMAIL_SENDER
-        msg['To'] = ADMIN_EMAIL
-        
-        msg.attach(MIMEText(html_content, 'html'))
-        
-        with smtplib.SMTP_SSL('smtp.gmail.com', 465) as server:
-            server.login(GMAIL_SENDER, GMAIL_PASSWORD)
-            server.sendmail(GMAIL_SENDER, ADMIN_EMAIL, msg.as_string())
-        
-        print(f"✅ Admin notification sent to {ADMIN_EMAIL}")
+        _queue_email('admin_new_member', ADMIN_EMAIL, member_name=member_name, member_email=member_email,
+                     package_name=package_name, order_id=order_id, sent_at=format_jakarta_datetime(datetime.now()))
+        print(f"✅ Admin notification queued for {ADMIN_EMAIL}")
         return True
     except Exception as e:
         print(f"❌ Error sending admin notification: {e}")
@@ -711,102 +495,9 @@ def send_expiry_reminder_email(member_name, email, package_name, end_date, membe
         return False
     
     try:
-        print(f"📧 Sending expiry email to {email}...")
-        html_content = f"""
-        <html>
-            <head>
-                <meta charset="UTF-8">
-                <meta name="viewport" content="width=device-width, initial-scale=1.0">
-                <style>
-                    @media (max-width: 480px) {{
-                        .header {{ padding: 20px 15px !important; }}
-                        .header h1 {{ font-size: 24px !important; }}
-                        .header h2 {{ font-size: 14px !important; }}
-                        .content {{ padding: 20px !important; }}
-                        .info-box {{ padding: 12px !important; }}
-                    }}
-                </style>
-            </head>
-            <body style="font-family: 'Segoe UI', Arial, sans-serif; background: linear-gradient(135deg, #f5f5f5 0%, #e8e8e8 100%); margin: 0; padding: 20px;">
-                <div style="max-width: 600px; margin: 0 auto; border-radius: 12px; overflow: hidden; box-shadow: 0 4px 15px rgba(0,0,0,0.1);">
-                    
-                    <!-- RED Gradient Header -->
-                    <div class="header" style="background: linear-gradient(135deg, #ff4444 0%, #cc0000 100%); padding: 25px 20px; text-align: center; color: white;">
-                        <h1 style="margin: 0 0 5px 0; font-size: 28px; font-weight: bold;">⚠️ MEMBERSHIP EXPIRED!</h1>
-                        <h2 style="margin: 0; font-size: 16px; font-weight: 400; letter-spacing: 0.5px;">{member_name}</h2>
-                    </div>
-                    
-                    <!-- White Content Area -->
-                    <div class="content" style="background-color: white; padding: 25px;">
-                        
-                        <!-- Avatar -->
-                        <div style="text-align: center; margin-bottom: 15px;">
-                            <img src="{member_avatar}" alt="Avatar" style="width: 80px; height: 80px; border-radius: 50%; border: 3px solid #ff4444; box-shadow: 0 2px 8px rgba(255,68,68,0.3);">
-                        </div>
-                        
-                        <!-- Title -->
-                        <h3 style="text-align: center; color: #cc0000; font-size: 18px; margin: 0 0 15px 0;">📛 Membership Berakhir 📛</h3>
-                        
-                        <!-- Info Box -->
-                        <div class="info-box" style="background: linear-gradient(135deg, #fff5f5 0%, #ffe8e8 100%); border-left: 4px solid #ff4444; padding: 12px; border-radius: 4px; margin-bottom: 15px;">
-                            
-                            <!-- Paket -->
-                            <div style="display: flex; justify-content: space-between; margin-bottom: 12px; padding-bottom: 12px; border-bottom: 1px solid #ffcccc;">
-                                <span style="color: #666; font-weight: 600;">📦 Paket:</span>
-                                <span style="color: #cc0000; font-weight: bold;">{package_name}</span>
-                            </div>
-                            
-                            <!-- Status -->
-                            <div style="display: flex; justify-content: space-between; margin-bottom: 12px; padding-bottom: 12px; border-bottom: 1px solid #ffcccc;">
-                                <span style="color: #666; font-weight: 600;">💥 Status:</span>
-                                <span style="background-color: #ff4444; color: white; padding: 4px 12px; border-radius: 20px; font-weight: bold; font-size: 12px;">EXPIRED</span>
-                            </div>
-                            
-                            <!-- End Date -->
-                            <div style="display: flex; justify-content: space-between;">
-                                <span style="color: #666; font-weight: 600;">📅 Berakhir:</span>
-                                <span style="color: #333; font-weight: bold;">{end_date}</span>
-                            </div>
-                        </div>
-                        
-                        <!-- Alert Message -->
-                        <div style="text-align: center; background-color: #fff5f5; padding: 15px; border-radius: 4px; margin-bottom: 20px; border: 2px dashed #ff4444;">
-                            <p style="color: #cc0000; font-weight: bold; margin: 0;">Membership Anda telah berakhir dan role telah dihapus.</p>
-                        </div>
-                        
-                        <!-- Action Button -->
-                        <div style="text-align: center; margin-bottom: 20px;">
-                            <p style="color: #666; margin: 0 0 10px 0;">Untuk melanjutkan akses The Warrior:</p>
-                            <p style="margin: 0; font-size: 14px; color: #f7931a; font-weight: bold;">Gunakan command <strong>/buy</strong> untuk perpanjang atau beli paket baru! 🚀</p>
-                        </div>
-                        
-                        <!-- Footer Message -->
-                        <p style="text-align: center; color: #999; font-size: 12px; margin-top: 20px;">
-                            💡 Hubungi admin jika ada pertanyaan
-                        </p>
-                    </div>
-                    
-                    <!-- RED Footer -->
-                    <div style="background: linear-gradient(135deg, #ff4444 0%, #cc0000 100%); padding: 20px; text-align: center; color: white; font-size: 12px;">
-                        © 2025 DiaryCrypto - The Warrior Membership
-                    </div>
-                </div>
-            </body>
-        </html>
-        """
-        
-        msg = MIMEMultipart('alternative')
-        msg['Subject'] = f"⚠️ Membership Expired - {member_name}"
-        msg['From'] = GMAIL_SENDER
-        msg['To'] = email
-        
-        msg.attach(MIMEText(html_content, 'html'))
-        
-        with smtplib.SMTP_SSL('smtp.gmail.com', 465) as server:
-            server.login(GMAIL_SENDER, GMAIL_PASSWORD)
-            server.sendmail(GMAIL_SENDER, email, msg.as_string())
-        
-        print(f"✅ Expiry reminder email sent to {email}")
+        _queue_email('expiry_reminder', email, member_name=member_name, package_name=package_name,
+                     end_date=end_date, member_avatar=member_avatar)
+        print(f"✅ Expiry reminder email queued for {email}")
         return True
     except Exception as e:
         print(f"❌ Error sending expiry email: {e}")
@@ -819,144 +510,9 @@ def send_3day_expiry_warning_email(member_name, email, package_name, end_date, m
         return False
     
     try:
-        print(f"📧 Sending 3-day warning email to {email}...")
         grace_period_end = (datetime.now(pytz.timezone('Asia/Jakarta')) + timedelta(days=2)).strftime("%d %B %Y")
-        
-        html_content = f"""
-        <html>
-            <head>
-                <meta charset="UTF-8">
-                <meta name="viewport" content="width=device-width, initial-scale=1.0">
-                <style>
-                    .step {{ margin-bottom: 12px; }}
-                    .step-number {{ display: inline-block; background: #ffc107; color: white; width: 28px; height: 28px; border-radius: 50%; text-align: center; line-height: 28px; font-weight: bold; margin-right: 10px; }}
-                    .step-text {{ display: inline-block; color: #333; font-size: 13px; line-height: 1.6; }}
-                </style>
-            </head>
-            <body style="font-family: 'Segoe UI', Arial, sans-serif; background: #f5f5f5; margin: 0; padding: 20px;">
-                <div style="max-width: 650px; margin: 0 auto;">
-                    
-                    <!-- YELLOW Gradient Header -->
-                    <div style="background: linear-gradient(135deg, #ffc107 0%, #ffb300 50%, #ff9800 100%); padding: 30px 20px; text-align: center; color: white; border-radius: 12px 12px 0 0; box-shadow: 0 4px 12px rgba(255, 152, 0, 0.3);">
-                        <h1 style="margin: 0 0 8px 0; font-size: 32px; font-weight: bold;">⚠️ PEMBERITAHUAN PENTING</h1>
-                        <p style="margin: 0; font-size: 16px; opacity: 0.95;">Masa Aktif Membership Berakhir</p>
-                    </div>
-                    
-                    <!-- White Content Area -->
-                    <div style="background-color: white; padding: 35px; box-shadow: 0 4px 15px rgba(0,0,0,0.1);">
-                        
-                        <!-- Avatar -->
-                        <div style="text-align: center; margin-bottom: 25px;">
-                            <img src="{member_avatar}" alt="Avatar" style="width: 85px; height: 85px; border-radius: 50%; border: 4px solid #ffc107; box-shadow: 0 4px 12px rgba(255,193,7,0.4);">
-                        </div>
-                        
-                        <!-- Greeting & Main Message -->
-                        <p style="font-size: 17px; color: #222; margin: 0 0 20px 0; line-height: 1.8; font-weight: 500;">Halo 👋 <strong>{member_name}</strong></p>
-                        
-                        <p style="font-size: 14px; color: #555; margin: 0 0 18px 0; line-height: 1.8;">
-                            Kami ingin menginformasikan bahwa masa aktif membership kamu di <strong style="color: #ff9800;">Diary Crypto</strong> telah berakhir hari ini.
-                        </p>
-                        
-                        <!-- Grace Period Highlight Box -->
-                        <div style="background: linear-gradient(135deg, #fffaf0 0%, #fff8e6 100%); border: 2px solid #ffc107; border-left: 6px solid #ffc107; padding: 18px; border-radius: 8px; margin-bottom: 25px;">
-                            <p style="font-size: 14px; color: #333; margin: 0 0 12px 0; line-height: 1.7;">
-                                ✨ Namun, sebagai bentuk kenyamanan dan apresiasi dari kami, kamu masih diberikan <strong>masa tenggang selama 2 hari</strong> ke depan agar tetap bisa mengakses channel dan seluruh konten eksklusif kami.
-                            </p>
-                            <div style="background: white; padding: 10px 12px; border-radius: 4px; text-align: center;">
-                                <p style="font-size: 13px; color: #ff9800; margin: 0; font-weight: bold;">
-                                    🗓️ Masa Tenggang Berakhir: <strong>{grace_period_end}</strong>
-                                </p>
-                            </div>
-                        </div>
-                        
-                        <!-- Important Warning -->
-                        <div style="background: #fff3cd; border-left: 4px solid #ff9800; padding: 12px 15px; border-radius: 4px; margin-bottom: 25px;">
-                            <p style="font-size: 13px; color: #856404; margin: 0; line-height: 1.6;">
-                                ⚠️ Setelah masa tenggang berakhir, akses kamu ke channel akan <strong>otomatis dinonaktifkan</strong> jika belum dilakukan perpanjangan.
-                            </p>
-                        </div>
-                        
-                        <!-- PROMINENT Renewal Instructions -->
-                        <div style="background: linear-gradient(135deg, #f7f7f7 0%, #fafafa 100%); border: 2px solid #ffc107; padding: 20px; border-radius: 8px; margin-bottom: 25px;">
-                            <h3 style="font-size: 16px; color: #ff9800; margin: 0 0 18px 0; font-weight: bold; text-align: center;">🔁 CARA PERPANJANG MEMBERSHIP</h3>
-                            
-                            <div class="step">
-                                <span class="step-number">1</span>
-                                <span class="step-text"><strong>Buka Discord</strong> dan gunakan command<br><span style="color: #ff9800; font-weight: bold; font-size: 14px;">/buy</span></span>
-                            </div>
-                            
-                            <div class="step">
-                                <span class="step-number">2</span>
-                                <span class="step-text"><strong>Pilih paket</strong> yang ingin kamu perpanjang<br>(The Warrior 1 Jam / 3 Bulan / etc)</span>
-                            </div>
-                            
-                            <div class="step">
-                                <span class="step-number">3</span>
-                                <span class="step-text"><strong>Lakukan pembayaran</strong> melalui link<br>Midtrans yang diberikan</span>
-                            </div>
-                            
-                            <div class="step" style="margin-bottom: 0;">
-                                <span class="step-number">4</span>
-                                <span class="step-text"><strong>Selesai!</strong> Membership akan otomatis<br>terupdate setelah pembayaran berhasil</span>
-                            </div>
-                        </div>
-                        
-                        <!-- Support Section -->
-                        <div style="background: #e3f2fd; border-left: 4px solid #2196F3; padding: 15px; border-radius: 6px; margin-bottom: 25px;">
-                            <p style="font-size: 14px; color: #1565c0; margin: 0 0 8px 0; font-weight: bold;">💬 Butuh Bantuan?</p>
-                            <p style="font-size: 13px; color: #1976d2; margin: 0; line-height: 1.6;">
-                                Jika ada masalah atau pertanyaan, jangan ragu untuk <strong>DM kami</strong> di Discord. Tim Diary Crypto siap membantu! 🚀
-                            </p>
-                        </div>
-                        
-                        <!-- Benefits Section -->
-                        <div style="margin-bottom: 25px;">
-                            <p style="font-size: 14px; color: #333; margin: 0 0 12px 0; font-weight: bold;">Dengan memperpanjang, akses kamu ke:</p>
-                            <div style="background: #f9f9f9; padding: 12px; border-radius: 6px;">
-                                <p style="font-size: 13px; color: #555; margin: 6px 0; line-height: 1.6;">✅ Insight market harian & update real-time</p>
-                                <p style="font-size: 13px; color: #555; margin: 6px 0; line-height: 1.6;">✅ Sinyal analisis & strategi crypto</p>
-                                <p style="font-size: 13px; color: #555; margin: 6px 0; line-height: 1.6;">✅ Materi edukasi jangka panjang</p>
-                                <p style="font-size: 13px; color: #555; margin: 6px 0; line-height: 1.6;">✅ Komunitas trader supportif untuk diskusi</p>
-                            </div>
-                        </div>
-                        
-                        <!-- Final CTA -->
-                        <div style="background: linear-gradient(135deg, #fff9e6 0%, #fffbf0 100%); padding: 18px; border-radius: 8px; text-align: center; margin-bottom: 20px; border: 1px solid #ffecb3;">
-                            <p style="font-size: 14px; color: #ff9800; margin: 0; font-weight: bold; line-height: 1.7;">
-                                🚀 Jangan sampai terputus dari informasi yang bisa bantu kamu ambil keputusan terbaik di dunia crypto!
-                            </p>
-                        </div>
-                        
-                        <!-- Thank You -->
-                        <div style="text-align: center; border-top: 1px solid #eee; padding-top: 20px;">
-                            <p style="font-size: 13px; color: #777; margin: 0; line-height: 1.8;">
-                                Terima kasih sudah menjadi bagian dari <strong>Diary Crypto</strong> 💎<br>
-                                <span style="color: #ff9800; font-weight: bold;">Tim Diary Crypto</span>
-                            </p>
-                        </div>
-                    </div>
-                    
-                    <!-- YELLOW Footer -->
-                    <div style="background: linear-gradient(135deg, #ffc107 0%, #ff9800 100%); padding: 18px; text-align: center; color: white; font-size: 12px; border-radius: 0 0 12px 12px; box-shadow: 0 4px 12px rgba(255, 152, 0, 0.3);">
-                        © 2025 DiaryCrypto - The Warrior Membership Platform
-                    </div>
-                </div>
-            </body>
-        </html>
-        """
-        
-        msg = MIMEMultipart('alternative')
-        msg['Subject'] = f"⚠️ Pemberitahuan Penting: Masa Aktif Membership Berakhir - {member_name}"
-        msg['From'] = GMAIL_SENDER
-        msg['To'] = email
-        
-        msg.attach(MIMEText(html_content, 'html'))
-        
-        with smtplib.SMTP_SSL('smtp.gmail.com', 465) as server:
-            server.login(GMAIL_SENDER, GMAIL_PASSWORD)
-            server.sendmail(GMAIL_SENDER, email, msg.as_string())
-        
-        print(f"✅ 3-day warning email sent to {email}")
+        _queue_email('expiry_warning', email, member_name=member_name, member_avatar=member_avatar, grace_period_end=grace_period_end)
+        print(f"✅ 3-day warning email queued for {email}")
         return True
     except Exception as e:
         print(f"❌ Error sending 3-day warning email: {e}")
@@ -969,91 +525,8 @@ def send_trial_expiry_warning_email(member_name, email, trial_end, member_avatar
         return False
     
     try:
-        print(f"📧 Sending trial expiry warning email to {email}...")
-        html_content = f"""
-        <html>
-            <head>
-                <meta charset="UTF-8">
-                <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            </head>
-            <body style="font-family: 'Segoe UI', Arial, sans-serif; background: #f5f5f5; margin: 0; padding: 20px;">
-                <div style="max-width: 600px; margin: 0 auto;">
-                    
-                    <!-- Orange Gradient Header -->
-                    <div style="background: linear-gradient(135deg, #f7931a 0%, #ff7f00 100%); padding: 30px 20px; text-align: center; color: white; border-radius: 12px 12px 0 0; box-shadow: 0 4px 12px rgba(247,147,26,0.3);">
-                        <h1 style="margin: 0 0 8px 0; font-size: 32px; font-weight: bold;">⏳ TRIAL AKAN BERAKHIR!</h1>
-                        <p style="margin: 0; font-size: 16px; opacity: 0.95;">Jangan Lewatkan Akses Eksklusif</p>
-                    </div>
-                    
-                    <!-- White Content Area -->
-                    <div style="background-color: white; padding: 35px; box-shadow: 0 4px 15px rgba(0,0,0,0.1);">
-                        
-                        <!-- Avatar -->
-                        <div style="text-align: center; margin-bottom: 25px;">
-                            <img src="{member_avatar}" alt="Avatar" style="width: 85px; height: 85px; border-radius: 50%; border: 4px solid #f7931a; box-shadow: 0 4px 12px rgba(247,147,26,0.4);">
-                        </div>
-                        
-                        <!-- Greeting -->
-                        <p style="font-size: 17px; color: #222; margin: 0 0 20px 0; line-height: 1.8; font-weight: 500;">Halo 👋 <strong>{member_name}</strong></p>
-                        
-                        <!-- Alert Box -->
-                        <div style="background: linear-gradient(135deg, #fff5e6 0%, #fff0d9 100%); border: 2px solid #f7931a; border-left: 6px solid #f7931a; padding: 18px; border-radius: 8px; margin-bottom: 25px;">
-                            <p style="font-size: 16px; color: #333; margin: 0 0 12px 0; font-weight: bold; line-height: 1.7;">
-                                ⚠️ Trial akses Anda ke The Warrior akan berakhir dalam <span style="color: #f7931a;">kurang dari 24 jam</span>!
-                            </p>
-                            <div style="background: white; padding: 12px; border-radius: 4px; text-align: center;">
-                                <p style="font-size: 14px; color: #f7931a; margin: 0; font-weight: bold;">
-                                    ⏰ Berakhir: <strong>{trial_end}</strong>
-                                </p>
-                            </div>
-                        </div>
-                        
-                        <!-- What You'll Lose -->
-                        <div style="background: #fff9f5; padding: 18px; border-radius: 8px; margin-bottom: 25px;">
-                            <p style="font-size: 14px; color: #333; margin: 0 0 12px 0; font-weight: bold;">Akses yang akan hilang:</p>
-                            <ul style="font-size: 13px; color: #555; margin: 0; padding-left: 20px; line-height: 1.8;">
-                                <li>❌ Insight market harian & update real-time</li>
-                                <li>❌ Sinyal analisis & strategi crypto</li>
-                                <li>❌ Materi edukasi jangka panjang</li>
-                                <li>❌ Komunitas trader supportif</li>
-                            </ul>
-                        </div>
-                        
-                        <!-- Call to Action -->
-                        <div style="background: linear-gradient(135deg, #fff5e6 0%, #fff0d9 100%); padding: 20px; border-radius: 8px; text-align: center; margin-bottom: 20px;">
-                            <p style="font-size: 15px; color: #f7931a; margin: 0; font-weight: bold; line-height: 1.8;">
-                                🚀 Perpanjang akses Anda sekarang dengan command<br><strong>/buy</strong><br>di Discord!
-                            </p>
-                        </div>
-                        
-                        <!-- Benefits -->
-                        <p style="font-size: 13px; color: #666; margin: 0; line-height: 1.8; text-align: center;">
-                            Jangan sampai kehilangan akses ke konten eksklusif dan insights penting dari Tim Diary Crypto!<br><br>
-                            <strong style="color: #f7931a;">Gunakan /buy sekarang untuk perpanjang! 💎</strong>
-                        </p>
-                    </div>
-                    
-                    <!-- Orange Footer -->
-                    <div style="background: linear-gradient(135deg, #f7931a 0%, #ff7f00 100%); padding: 18px; text-align: center; color: white; font-size: 12px; border-radius: 0 0 12px 12px; box-shadow: 0 4px 12px rgba(247,147,26,0.3);">
-                        © 2025 DiaryCrypto - The Warrior Trial Membership
-                    </div>
-                </div>
-            </body>
-        </html>
-        """
-        
-        msg = MIMEMultipart('alternative')
-        msg['Subject'] = f"⏳ Trial Akan Berakhir - {member_name}"
-        msg['From'] = GMAIL_SENDER
-        msg['To'] = email
-        
-        msg.attach(MIMEText(html_content, 'html'))
-        
-        with smtplib.SMTP_SSL('smtp.gmail.com', 465) as server:
-            server.login(GMAIL_SENDER, GMAIL_PASSWORD)
-            server.sendmail(GMAIL_SENDER, email, msg.as_string())
-        
-        print(f"✅ Trial expiry warning email sent to {email}")
+        _queue_email('trial_expiry_warning', email, member_name=member_name, trial_end=trial_end, member_avatar=member_avatar)
+        print(f"✅ Trial expiry warning email queued for {email}")
         return True
     except Exception as e:
         print(f"❌ Error sending trial expiry warning email: {e}")
@@ -1073,86 +546,9 @@ def send_trial_member_email(member_name, email, trial_start, trial_end, member_a
         else:
             duration_text = f"{int(duration_days)} Hari" if duration_days > 1 else "1 Hari"
         
-        print(f"📧 Sending trial member email to {email}...")
-        html_content = f"""
-        <html>
-            <head>
-                <meta charset="UTF-8">
-                <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            </head>
-            <body style="font-family: 'Segoe UI', Arial, sans-serif; background: linear-gradient(135deg, #f5f5f5 0%, #e8e8e8 100%); margin: 0; padding: 20px;">
-                <div style="max-width: 600px; margin: 0 auto; border-radius: 12px; overflow: hidden; box-shadow: 0 4px 15px rgba(0,0,0,0.1);">
-                    
-                    <!-- Orange Gradient Header -->
-                    <div style="background: linear-gradient(135deg, #f7931a 0%, #ff7f00 100%); padding: 25px 20px; text-align: center; color: white;">
-                        <h1 style="margin: 0 0 5px 0; font-size: 28px; font-weight: bold;">🎉 TRIAL AKTIF!</h1>
-                        <h2 style="margin: 0; font-size: 16px; font-weight: 400; letter-spacing: 0.5px;">{member_name}</h2>
-                    </div>
-                    
-                    <!-- White Content Area -->
-                    <div style="background-color: white; padding: 25px;">
-                        
-                        <!-- Avatar -->
-                        <div style="text-align: center; margin-bottom: 15px;">
-                            <img src="{member_avatar}" alt="Avatar" style="width: 80px; height: 80px; border-radius: 50%; border: 3px solid #f7931a; box-shadow: 0 2px 8px rgba(247,147,26,0.3);">
-                        </div>
-                        
-                        <!-- Title -->
-                        <h3 style="text-align: center; color: #f7931a; font-size: 18px; margin: 0 0 15px 0;">✨ Trial Member {duration_text} ✨</h3>
-                        
-                        <!-- Info Box -->
-                        <div style="background: linear-gradient(135deg, #fff5e6 0%, #fff0d9 100%); border-left: 4px solid #f7931a; padding: 12px; border-radius: 4px; margin-bottom: 15px;">
-                            
-                            <!-- Mulai -->
-                            <div style="display: flex; justify-content: space-between; margin-bottom: 10px; padding-bottom: 10px; border-bottom: 1px solid #ffe8cc;">
-                                <span style="color: #666; font-weight: 600;">📅 Mulai:</span>
-                                <span style="color: #f7931a; font-weight: bold;">{trial_start}</span>
-                            </div>
-                            
-                            <!-- Berakhir -->
-                            <div style="display: flex; justify-content: space-between;">
-                                <span style="color: #666; font-weight: 600;">⏰ Berakhir:</span>
-                                <span style="color: #f7931a; font-weight: bold;">{trial_end}</span>
-                            </div>
-                        </div>
-                        
-                        <!-- Message -->
-                        <div style="text-align: center; background-color: #f7f7f7; padding: 15px; border-radius: 4px; margin-bottom: 15px;">
-                            <p style="color: #f7931a; font-style: italic; margin: 0;">✨ Nikmati akses eksklusif The Warrior selama {duration_text}! ✨</p>
-                        </div>
-                        
-                        <!-- Alert -->
-                        <div style="text-align: center; background-color: #fff5e6; padding: 12px; border-radius: 4px; border: 2px dashed #f7931a; margin-bottom: 15px;">
-                            <p style="color: #f7931a; font-weight: bold; margin: 0;">⏳ Trial berakhir dalam {duration_text}, role akan otomatis dihapus</p>
-                        </div>
-                        
-                        <!-- Footer Message -->
-                        <p style="text-align: center; color: #999; font-size: 12px; margin-top: 15px;">
-                            💡 Untuk akses lebih lama, gunakan command /buy sekarang juga!
-                        </p>
-                    </div>
-                    
-                    <!-- Orange Footer -->
-                    <div style="background: linear-gradient(135deg, #f7931a 0%, #ff7f00 100%); padding: 20px; text-align: center; color: white; font-size: 12px;">
-                        © 2025 DiaryCrypto - The Warrior Trial Membership
-                    </div>
-                </div>
-            </body>
-        </html>
-        """
-        
-        msg = MIMEMultipart('alternative')
-        msg['Subject'] = f"🎉 Trial Activated - {member_name}"
-        msg['From'] = GMAIL_SENDER
-        msg['To'] = email
-        
-        msg.attach(MIMEText(html_content, 'html'))
-        
-        with smtplib.SMTP_SSL('smtp.gmail.com', 465) as server:
-            server.login(GMAIL_SENDER, GMAIL_PASSWORD)
-            server.sendmail(GMAIL_SENDER, email, msg.as_string())
-        
-        print(f"✅ Trial member email sent to {email}")
+        _queue_email('trial_welcome', email, member_name=member_name, trial_start=trial_start, trial_end=trial_end,
+                     member_avatar=member_avatar, duration_text=duration_text)
+        print(f"✅ Trial member email queued for {email}")
         return True
     except Exception as e:
         print(f"❌ Error sending trial email: {e}")
@@ -1165,58 +561,9 @@ def send_admin_kick_notification(member_name: str, member_email: str, package_na
         return False
     
     try:
-        html_content = f"""
-        <html>
-            <body style="font-family: Arial, sans-serif; background-color: #f5f5f5;">
-                <div style="max-width: 600px; margin: 0 auto; background-color: white; padding: 20px; border-radius: 8px;">
-                    <h2 style="color: #ff0000; text-align: center;">🚨 MEMBER ROLE REMOVED</h2>
-                    <hr style="border: 1px solid #ddd;">
-                    
-                    <p><strong>Informasi Pencopotan Role:</strong></p>
-                    
-                    <table style="width: 100%; border-collapse: collapse; margin: 20px 0;">
-                        <tr style="background-color: #f9f9f9;">
-                            <td style="padding: 10px; border: 1px solid #ddd;"><strong>Member:</strong></td>
-                            <td style="padding: 10px; border: 1px solid #ddd;">{member_name}</td>
-                        </tr>
-                        <tr>
-                            <td style="padding: 10px; border: 1px solid #ddd;"><strong>Email:</strong></td>
-                            <td style="padding: 10px; border: 1px solid #ddd;">{member_email}</td>
-                        </tr>
-                        <tr style="background-color: #f9f9f9;">
-                            <td style="padding: 10px; border: 1px solid #ddd;"><strong>Paket:</strong></td>
-                            <td style="padding: 10px; border: 1px solid #ddd;">{package_name}</td>
-                        </tr>
-                        <tr>
-                            <td style="padding: 10px; border: 1px solid #ddd;"><strong>Alasan:</strong></td>
-                            <td style="padding: 10px; border: 1px solid #ddd; color: #ff0000;"><strong>{reason}</strong></td>
-                        </tr>
-                        <tr style="background-color: #f9f9f9;">
-                            <td style="padding: 10px; border: 1px solid #ddd;"><strong>Waktu:</strong></td>
-                            <td style="padding: 10px; border: 1px solid #ddd;">{format_jakarta_datetime(datetime.now())}</td>
-                        </tr>
-                    </table>
-                    
-                    <p style="color: #666; font-size: 12px; margin-top: 20px; text-align: center;">
-                        Email ini dikirim otomatis oleh sistem
-                    </p>
-                </div>
-            </body>
-        </html>
-        """
-        
-        msg = MIMEMultipart('alternative')
-        msg['Subject'] = f"🚨 KICK NOTIFICATION - {member_name} ({reason})"
-        msg['From'] = GMAIL_SENDER
-        msg['To'] = ADMIN_EMAIL
-        
-        msg.attach(MIMEText(html_content, 'html'))
-        
-        with smtplib.SMTP_SSL('smtp.gmail.com', 465) as server:
-            server.login(GMAIL_SENDER, GMAIL_PASSWORD)
-            server.sendmail(GMAIL_SENDER, ADMIN_EMAIL, msg.as_string())
-        
-        print(f"✅ Admin kick notification sent to {ADMIN_EMAIL}")
+        _queue_email('admin_kick', ADMIN_EMAIL, member_name=member_name, member_email=member_email,
+                     package_name=package_name, reason=reason, sent_at=format_jakarta_datetime(datetime.now()))
+        print(f"✅ Admin kick notification queued for {ADMIN_EMAIL}")
         return True
     except Exception as e:
         print(f"❌ Error sending kick notification: {e}")
@@ -1554,162 +901,217 @@ async def auto_post_crypto_news():
             await asyncio.sleep(3600)
 
 
-async def cleanup_stale_orders():
-    await bot.wait_until_ready()
-    
-    while not bot.is_closed():
-        try:
-            conn = Database.connect()
-            c = conn.cursor()
-            
-            # Cek order yang pending lebih dari 10 MENIT dengan real time (Jakarta timezone)
-            now_jakarta = get_jakarta_datetime()
-            cutoff_time = (now_jakarta - timedelta(minutes=10)).strftime('%Y-%m-%d %H:%M:%S')
-            
-            c.execute('SELECT order_id, discord_id, discord_username, package_type FROM pending_orders WHERE status = "pending" AND created_at < ?', (cutoff_time,))
-            stale_orders = c.fetchall()
-            
-            if stale_orders:
-                print(f"🧹 Cleanup: Found {len(stale_orders)} expired orders (>10 menit) - Real time: {now_jakarta.strftime('%Y-%m-%d %H:%M:%S WIB')}")
-                
-                for (order_id, discord_id, discord_username, package_type) in stale_orders:
-                    try:
-                        # Hapus order yang expired
-                        c.execute('DELETE FROM pending_orders WHERE order_id = ?', (order_id,))
-                        
-                        # Kirim DM ke user
-                        user = await bot.fetch_user(int(discord_id))
-                        if user:
-                            dm_embed = discord.Embed(
-                                title="⏰ ORDER KADALUARSA!",
-                                description="Pembayaran Anda tidak selesai dalam 10 menit",
-                                color=0xff0000
-                            )
-                            dm_embed.add_field(name="❌ Status", value="Order Expired", inline=True)
-                            dm_embed.add_field(name="📋 Order ID", value=f"`{order_id}`", inline=True)
-                            dm_embed.add_field(name="📦 Paket", value=package_type, inline=False)
-                            dm_embed.add_field(name="🔄 Solusi", value="Gunakan `/buy` lagi untuk membuat order baru", inline=False)
-                            dm_embed.add_field(name="⏱️ Waktu Expire", value=format_jakarta_datetime(now_jakarta), inline=False)
-                            dm_embed.set_footer(text="Diary Crypto Payment Bot • Real Time WIB")
-                            
-                            await user.send(embed=dm_embed)
-                            print(f"✅ Expired notification sent to {discord_username}")
-                    except Exception as e:
-                        print(f"⚠️ Error sending expired notification: {e}")
-            
-            conn.commit()
-            conn.close()
-        except Exception as e:
-            # Silently handle database errors in background task
-            pass
-        
-        await asyncio.sleep(10)
+# ============ DEADLINE HANDLERS ============
+# Semua expiry / reminder / order timeout jalan lewat satu DeadlineScheduler (lihat scheduler.py).
+# Handler menerima key yang jatuh tempo, lalu cek ulang kondisinya di database sebelum bertindak.
+ORDER_TIMEOUT = timedelta(minutes=10)
+TRIAL_WARNING_BEFORE = timedelta(hours=24)
+EXPIRY_WARNING_DAYS = 3
 
+def _in_params(keys):
+    return '(' + ', '.join('?' for _ in keys) + ')'
 
-async def check_expired_subscriptions():
-    await bot.wait_until_ready()
-    
-    while not bot.is_closed():
+def _day_start(dt):
+    return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def _warning_due(end, reminder_count):
+    """Reminder ke-(n+1) mulai 00:00 WIB, (3 - n) hari sebelum hari expiry - None kalau sudah 3x"""
+    if reminder_count >= EXPIRY_WARNING_DAYS:
+        return None
+    return _day_start(end) - timedelta(days=EXPIRY_WARNING_DAYS - reminder_count)
+
+def schedule_subscription(order_id, end, reminder_count=0):
+    end = from_db_timestamp(end)
+    scheduler.schedule('subscription_expiry', order_id, end)
+    scheduler.schedule('subscription_warning', order_id, _warning_due(end, reminder_count))
+
+def schedule_trial(discord_id, trial_end):
+    trial_end = from_db_timestamp(trial_end)
+    scheduler.schedule('trial_expiry', discord_id, trial_end)
+    scheduler.schedule('trial_warning', discord_id, trial_end - TRIAL_WARNING_BEFORE)
+
+def _load_order_deadlines():
+    rows = Database.execute('SELECT order_id, created_at FROM pending_orders WHERE status = "pending"',
+                            fetch_all=True, commit=False)
+    return [(order_id, from_db_timestamp(created_at) + ORDER_TIMEOUT) for order_id, created_at in rows if created_at]
+
+def _load_subscription_expiry_deadlines():
+    rows = Database.execute('SELECT order_id, end_date FROM subscriptions WHERE status = "active"',
+                            fetch_all=True, commit=False)
+    return [(order_id, from_db_timestamp(end_date)) for order_id, end_date in rows if end_date]
+
+def _load_subscription_warning_deadlines():
+    rows = Database.execute('''SELECT order_id, end_date, expiry_reminder_count FROM subscriptions 
+                               WHERE status = "active" AND expiry_reminder_count < ?''',
+                            (EXPIRY_WARNING_DAYS,), fetch_all=True, commit=False)
+    return [(order_id, _warning_due(from_db_timestamp(end_date), count or 0)) for order_id, end_date, count in rows if end_date]
+
+def _load_trial_expiry_deadlines():
+    rows = Database.execute('SELECT discord_id, trial_end FROM trial_members WHERE status = "active"',
+                            fetch_all=True, commit=False)
+    return [(discord_id, from_db_timestamp(trial_end)) for discord_id, trial_end in rows if discord_id and trial_end]
+
+def _load_trial_warning_deadlines():
+    return [(discord_id, trial_end - TRIAL_WARNING_BEFORE) for discord_id, trial_end in _load_trial_expiry_deadlines()]
+
+def _require_guild():
+    guild = bot.get_guild(GUILD_ID)
+    if not guild:
+        # Scheduler menjadwal ulang semua key dan mencoba lagi nanti
+        raise RuntimeError("Guild not found")
+    return guild
+
+
+stale_order_metrics = {'passes': 0, 'expired': 0, 'dms_sent': 0, 'dms_failed': 0,
+                       'last_expired': 0, 'last_pass_ms': 0.0, 'max_pass_ms': 0.0}
+
+def _count_stale_order_dm(future):
+    stale_order_metrics['dms_sent' if future.result() else 'dms_failed'] += 1
+
+def _stale_order_embed(order_id, package_type, now_jakarta):
+    dm_embed = discord.Embed(
+        title="⏰ ORDER KADALUARSA!",
+        description="Pembayaran Anda tidak selesai dalam 10 menit",
+        color=0xff0000
+    )
+    dm_embed.add_field(name="❌ Status", value="Order Expired", inline=True)
+    dm_embed.add_field(name="📋 Order ID", value=f"`{order_id}`", inline=True)
+    dm_embed.add_field(name="📦 Paket", value=package_type, inline=False)
+    dm_embed.add_field(name="🔄 Solusi", value="Gunakan `/buy` lagi untuk membuat order baru", inline=False)
+    dm_embed.add_field(name="⏱️ Waktu Expire", value=format_jakarta_datetime(now_jakarta), inline=False)
+    dm_embed.set_footer(text="Diary Crypto Payment Bot • Real Time WIB")
+    return dm_embed
+
+async def expire_stale_orders(order_ids):
+    """Pending order yang tidak dibayar dalam 10 menit: hapus dan kabari user
+    
+    Pipeline: satu DELETE ... RETURNING pada range (status, created_at) yang ter-index - order lain
+    yang sudah lewat batas ikut terhapus di pass yang sama - lalu DM lewat dm_dispatcher (tidak ditunggu).
+    Tidak ada koneksi database yang ditahan selama await ke Discord.
+    """
+    started = time.perf_counter()
+    now_jakarta = get_jakarta_datetime()
+    cutoff_time = to_db_timestamp(now_jakarta - ORDER_TIMEOUT)
+    
+    stale_orders = await Database.aexecute('''DELETE FROM pending_orders 
+                                              WHERE status = "pending" AND created_at <= ? 
+                                              RETURNING order_id, discord_id, discord_username, package_type''',
+                                           (cutoff_time,), fetch_all=True) or []
+    for order in stale_orders:
+        scheduler.cancel('order_timeout', order[0])
+    
+    if stale_orders:
+        print(f"🧹 Cleanup: Found {len(stale_orders)} expired orders (>10 menit) - Real time: {now_jakarta.strftime('%Y-%m-%d %H:%M:%S WIB')}")
+        for order_id, discord_id, discord_username, package_type in stale_orders:
+            # Kirim DM ke user
+            dm_dispatcher.send(discord_id, PRIORITY_NOTICE,
+                               embed=_stale_order_embed(order_id, package_type, now_jakarta)).add_done_callback(_count_stale_order_dm)
+    
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    stale_order_metrics['passes'] += 1
+    stale_order_metrics['expired'] += len(stale_orders)
+    stale_order_metrics['last_expired'] = len(stale_orders)
+    stale_order_metrics['last_pass_ms'] = round(elapsed_ms, 1)
+    stale_order_metrics['max_pass_ms'] = round(max(stale_order_metrics['max_pass_ms'], elapsed_ms), 1)
+    if stale_orders:
+        print(f"🧹 Stale order pass: {len(stale_orders)} expired, {len(stale_orders)} DM queued in {elapsed_ms:.0f} ms")
+
+
+async def expire_subscriptions(order_ids):
+    """Subscription yang end_date-nya lewat: cabut role (satu batch), DM + email, tandai expired"""
+    guild = _require_guild()
+    now = get_jakarta_datetime()
+    expired_subs = await Database.aexecute(f'''SELECT order_id, discord_id, discord_username, nama, email, package_type, end_date 
+                                               FROM subscriptions WHERE status = "active" AND order_id IN {_in_params(order_ids)}''',
+                                           tuple(order_ids), fetch_all=True, commit=False)
+    print(f"🔍 Auto removal check: Found {len(expired_subs)} expired memberships")
+    
+    # Katalog sekali per pass, bukan per baris
+    packages = await Database.arun(get_all_packages)
+    batch = role_service.batch('subscription_expiry', reason="Membership expired")
+    expired, notices = [], {}
+    for order_id, discord_id, discord_username, nama, email, package_type, end_date in expired_subs:
         try:
-            conn = Database.connect()
-            c = conn.cursor()
-            
-            # Use Jakarta timezone untuk accurate comparison dengan database
-            now = get_jakarta_datetime().strftime('%Y-%m-%d %H:%M:%S')
-            
-            c.execute('''SELECT discord_id, discord_username, nama, email, package_type, end_date 
-                        FROM subscriptions 
-                        WHERE status = "active" 
-                        AND end_date <= ?''',
-                     (now,))
-            
-            expired_subs = c.fetchall()
-            print(f"🔍 Auto removal check: Found {len(expired_subs)} expired memberships")
-            
-            guild = bot.get_guild(GUILD_ID)
-            if not guild:
-                print(f"❌ Guild not found in auto removal!")
-                conn.close()
-                await asyncio.sleep(3600)
+            end_date = from_db_timestamp(end_date)
+            if end_date > now:
+                scheduler.schedule('subscription_expiry', order_id, end_date)  # end_date sudah diundur
                 continue
-            
-            for discord_id, discord_username, nama, email, package_type, end_date in expired_subs:
-                try:
-                    print(f"🔄 Processing expired: {discord_username} ({discord_id}) - Package: {package_type}")
-                    
-                    member = guild.get_member(int(discord_id))
-                    if not member:
-                        print(f"  ⚠️ Member {discord_username} ({discord_id}) tidak ditemukan di guild")
-                        c.execute('UPDATE subscriptions SET status = "expired" WHERE discord_id = ?',
-                                 (discord_id,))
-                        print(f"  ✅ Status updated to expired")
-                        continue
-                    
-                    packages = get_all_packages()
-                    role_name = packages.get(package_type, {}).get("role_name")
-                    duration_days = packages.get(package_type, {}).get("duration_days", 0)
-                    if not role_name:
-                        print(f"  ❌ Role name tidak ditemukan untuk package {package_type}")
-                        continue
-                    
-                    role = discord.utils.get(guild.roles, name=role_name)
-                    if not role:
-                        print(f"  ❌ Role '{role_name}' tidak ditemukan di guild")
-                        continue
-                    
-                    if role in member.roles:
-                        pkg_name = packages.get(package_type, {}).get('name', 'The Warrior')
-                        end_datetime_full = format_jakarta_datetime_full(end_date)
-                        
-                        # Send RED EMBED DM notification
-                        try:
-                            expiry_embed = discord.Embed(
-                                title="⚠️ MEMBERSHIP EXPIRED! ⚠️",
-                                description=f"Paket **{pkg_name}** Anda telah berakhir.",
-                                color=0xff4444
-                            )
-                            expiry_embed.add_field(name="🔴 Status", value="EXPIRED", inline=True)
-                            expiry_embed.add_field(name="📅 Berakhir", value=end_datetime_full, inline=True)
-                            expiry_embed.add_field(name="🔄 Solusi", value="Klik `/buy` untuk perpanjang atau beli paket baru!", inline=False)
-                            expiry_embed.set_footer(text="Diary Crypto Payment Bot • Real Time WIB")
-                            expiry_embed.set_thumbnail(url=member.avatar.url if member.avatar else "")
-                            
-                            await member.send(embed=expiry_embed)
-                            print(f"  ✅ Expiry RED EMBED sent to {member.name}")
-                        except discord.HTTPException as e:
-                            print(f"  ⚠️ Could not send DM to {discord_id}: {e}")
-                        
-                        await member.remove_roles(role)
-                        print(f"  ✅ Role '{role_name}' removed from {discord_username}")
-                        
-                        # Send expiry reminder email dengan RED gradient
-                        try:
-                            member_avatar = str(member.avatar.url) if member.avatar else str(member.default_avatar)
-                            end_datetime = format_jakarta_datetime_full(end_date)
-                            result = send_expiry_reminder_email(nama, email, pkg_name, end_datetime, member_avatar)
-                            if result:
-                                print(f"  ✅ Expiry RED email sent to {email}")
-                            else:
-                                print(f"  ⚠️ Email function returned False for {email}")
-                        except Exception as e:
-                            print(f"  ❌ Error sending expiry email to {email}: {e}")
-                        
-                        send_admin_kick_notification(nama, email, pkg_name, "Membership Expired")
-                    
-                    c.execute('UPDATE subscriptions SET status = "expired" WHERE discord_id = ?', (discord_id,))
-                    print(f"  ✅ Subscription marked as expired")
-                    
-                except Exception as e:
-                    print(f"  ❌ Error: {e}")
-            
-            conn.commit()
-            conn.close()
-            
+            print(f"🔄 Processing expired: {discord_username} ({discord_id}) - Package: {package_type}")
+            
+            # Masih punya subscription aktif lain (perpanjangan) → cukup tandai order ini expired
+            renewed = await Database.aexecute('''SELECT 1 FROM subscriptions 
+                                                 WHERE discord_id = ? AND status = "active" AND order_id != ? AND end_date > ?''',
+                                              (discord_id, order_id, to_db_timestamp(now)), fetch_one=True, commit=False)
+            member = guild.get_member(int(discord_id))
+            if renewed:
+                print(f"  ℹ️ {discord_username} masih punya membership aktif lain, role tidak dicabut")
+            elif not member:
+                print(f"  ⚠️ Member {discord_username} ({discord_id}) tidak ditemukan di guild")
+            else:
+                # Tanpa role yang bisa dicabut order tetap ditandai expired - kalau tidak, dicoba ulang selamanya
+                role_name = packages.get(package_type, {}).get("role_name")
+                role = role_service.get(guild, role_name) if role_name else None
+                if not role_name:
+                    print(f"  ❌ Role name tidak ditemukan untuk package {package_type}, order {order_id} ditandai expired")
+                elif not role:
+                    print(f"  ❌ Role '{role_name}' tidak ditemukan di guild, order {order_id} ditandai expired")
+                elif role in member.roles:
+                    batch.remove(member, role, key=order_id)
+                    pkg_name = packages.get(package_type, {}).get('name', 'The Warrior')
+                    notices[order_id] = (member, discord_id, discord_username, nama, email, pkg_name, role_name, end_date)
+            expired.append(order_id)
         except Exception as e:
-            # Silently handle database errors in background task
-            pass
+            print(f"  ❌ Error: {e}")
+    
+    # Semua pencabutan role dalam satu batch (concurrency terbatas); order yang gagal dicoba lagi nanti
+    report = await batch.run()
+    for keys, _ in report['failed'].values():
+        for order_id in keys:
+            expired.remove(order_id)
+            notices.pop(order_id, None)
+            scheduler.schedule('subscription_expiry', order_id, time.time() + scheduler.retry_delay)
+    
+    for member, discord_id, discord_username, nama, email, pkg_name, role_name, end_date in notices.values():
+        print(f"  ✅ Role '{role_name}' removed from {discord_username}")
+        end_datetime_full = format_jakarta_datetime_full(end_date)
+        
+        # Send RED EMBED DM notification
+        try:
+            expiry_embed = discord.Embed(
+                title="⚠️ MEMBERSHIP EXPIRED! ⚠️",
+                description=f"Paket **{pkg_name}** Anda telah berakhir.",
+                color=0xff4444
+            )
+            expiry_embed.add_field(name="🔴 Status", value="EXPIRED", inline=True)
+            expiry_embed.add_field(name="📅 Berakhir", value=end_datetime_full, inline=True)
+            expiry_embed.add_field(name="🔄 Solusi", value="Klik `/buy` untuk perpanjang atau beli paket baru!", inline=False)
+            expiry_embed.set_footer(text="Diary Crypto Payment Bot • Real Time WIB")
+            expiry_embed.set_thumbnail(url=member.avatar.url if member.avatar else "")
+            
+            dm_dispatcher.send(member, PRIORITY_REMINDER, embed=expiry_embed)
+            print(f"  ✅ Expiry RED EMBED queued for {member.name}")
+        except discord.HTTPException as e:
+            print(f"  ⚠️ Could not send DM to {discord_id}: {e}")
         
-        await asyncio.sleep(300)
+        # Send expiry reminder email dengan RED gradient
+        try:
+            member_avatar = str(member.avatar.url) if member.avatar else str(member.default_avatar)
+            result = send_expiry_reminder_email(nama, email, pkg_name, end_datetime_full, member_avatar)
+            if result:
+                print(f"  ✅ Expiry RED email queued for {email}")
+            else:
+                print(f"  ⚠️ Email function returned False for {email}")
+        except Exception as e:
+            print(f"  ❌ Error sending expiry email to {email}: {e}")
+        
+        send_admin_kick_notification(nama, email, pkg_name, "Membership Expired")
+    
+    if expired:
+        await Database.arun(Database.executemany, 'UPDATE subscriptions SET status = "expired" WHERE order_id = ?',
+                            [(order_id,) for order_id in expired])
+        for order_id in expired:
+            scheduler.cancel('subscription_warning', order_id)
+        print(f"  ✅ {len(expired)} subscription marked as expired")
 
 
 async def auto_remove_expired_members():
@@ -1722,176 +1124,133 @@ async def auto_remove_expired_members():
             print(f"❌ Error: {e}")
 
 
-async def check_3day_expiry_warning():
-    """Background task untuk kirim warning 3 hari sebelum expiry (1x per hari selama 3 hari)"""
-    await bot.wait_until_ready()
+async def warn_expiring_subscriptions(order_ids):
+    """Warning 3 hari sebelum expiry (1x per hari kalender WIB selama 3 hari)"""
+    guild = _require_guild()
+    now = get_jakarta_datetime()
+    today_start = _day_start(now)
+    warning_members = await Database.aexecute(f'''SELECT order_id, discord_id, discord_username, nama, email, package_type, end_date, expiry_reminder_count 
+                                                  FROM subscriptions 
+                                                  WHERE status = "active" AND expiry_reminder_count < ? AND order_id IN {_in_params(order_ids)}''',
+                                              (EXPIRY_WARNING_DAYS, *order_ids), fetch_all=True, commit=False)
     
-    while not bot.is_closed():
+    if warning_members:
+        print(f"🔔 3-Day Warning Check: Found {len(warning_members)} members to warn")
+    
+    packages = await Database.arun(get_all_packages)
+    for order_id, discord_id, discord_username, nama, email, package_type, end_date, reminder_count in warning_members:
         try:
-            conn = Database.connect()
-            c = conn.cursor()
-            
-            now = get_jakarta_datetime()
-            three_days_later = (now + timedelta(days=3)).strftime('%Y-%m-%d')
-            
-            # Find memberships yang akan expire dalam 3 hari, dan reminder_count < 3
-            c.execute('''SELECT order_id, discord_id, discord_username, nama, email, package_type, end_date, expiry_reminder_count 
-                        FROM subscriptions 
-                        WHERE status = "active" 
-                        AND CAST(end_date AS DATE) <= CAST(? AS DATE) 
-                        AND CAST(end_date AS DATE) > CAST(? AS DATE)
-                        AND expiry_reminder_count < 3''',
-                     (three_days_later, now.strftime('%Y-%m-%d')))
-            
-            warning_members = c.fetchall()
-            
-            if warning_members:
-                print(f"🔔 3-Day Warning Check: Found {len(warning_members)} members to warn")
-            
-            guild = bot.get_guild(GUILD_ID)
-            if not guild:
-                conn.close()
-                await asyncio.sleep(60)
+            end_dt = from_db_timestamp(end_date)
+            # Calculate sisa hari
+            sisa_hari = (end_dt.date() - now.date()).days
+            if sisa_hari > EXPIRY_WARNING_DAYS:
+                scheduler.schedule('subscription_warning', order_id, _warning_due(end_dt, reminder_count))
                 continue
+            if sisa_hari < 1:
+                continue  # expire hari ini - giliran expiry handler
             
-            for order_id, discord_id, discord_username, nama, email, package_type, end_date, reminder_count in warning_members:
+            member = guild.get_member(int(discord_id))
+            if member:
+                pkg_name = packages.get(package_type, {}).get('name', 'The Warrior')
+                
+                # Send YELLOW EMBED DM
                 try:
-                    member = guild.get_member(int(discord_id))
-                    if member:
-                        packages = get_all_packages()
-                        pkg_name = packages.get(package_type, {}).get('name', 'The Warrior')
-                        
-                        # Calculate sisa hari
-                        end_dt = datetime.fromisoformat(end_date)
-                        sisa_hari = (end_dt.date() - now.date()).days
-                        
-                        # Send YELLOW EMBED DM
-                        try:
-                            warning_embed = discord.Embed(
-                                title="⚠️ PERINGATAN JATUH TEMPO! ⚠️",
-                                description=f"Membership **{pkg_name}** Anda akan segera berakhir!",
-                                color=0xffc107
-                            )
-                            warning_embed.add_field(name="📅 Sisa Waktu", value=f"**{sisa_hari} Hari**", inline=True)
-                            warning_embed.add_field(name="⏰ Berakhir", value=format_jakarta_datetime_full(end_dt), inline=True)
-                            warning_embed.add_field(name="💡 Aksi", value="Gunakan `/buy` untuk perpanjang sekarang!", inline=False)
-                            warning_embed.set_footer(text="Diary Crypto Payment Bot • Real Time WIB")
-                            warning_embed.set_thumbnail(url=member.avatar.url if member.avatar else "")
-                            
-                            await member.send(embed=warning_embed)
-                            print(f"  ✅ 3-Day WARNING YELLOW EMBED sent to {discord_username} (Hari ke-{reminder_count+1})")
-                        except discord.HTTPException as e:
-                            print(f"  ⚠️ Could not send DM to {discord_id}: {e}")
-                        
-                        # Send YELLOW GRADIENT EMAIL
-                        try:
-                            member_avatar = str(member.avatar.url) if member.avatar else str(member.default_avatar)
-                            end_datetime = format_jakarta_datetime_full(end_dt)
-                            send_3day_expiry_warning_email(nama, email, pkg_name, end_datetime, member_avatar, sisa_hari)
-                            print(f"  ✅ 3-Day WARNING YELLOW EMAIL sent to {email}")
-                        except Exception as e:
-                            print(f"  ❌ Error sending 3-day warning email: {e}")
-                        
-                        # Increment reminder count
-                        c.execute('UPDATE subscriptions SET expiry_reminder_count = expiry_reminder_count + 1 WHERE order_id = ?', (order_id,))
-                        print(f"  ✅ Reminder count incremented for {nama} (Now: {reminder_count+1}/3)")
+                    warning_embed = discord.Embed(
+                        title="⚠️ PERINGATAN JATUH TEMPO! ⚠️",
+                        description=f"Membership **{pkg_name}** Anda akan segera berakhir!",
+                        color=0xffc107
+                    )
+                    warning_embed.add_field(name="📅 Sisa Waktu", value=f"**{sisa_hari} Hari**", inline=True)
+                    warning_embed.add_field(name="⏰ Berakhir", value=format_jakarta_datetime_full(end_dt), inline=True)
+                    warning_embed.add_field(name="💡 Aksi", value="Gunakan `/buy` untuk perpanjang sekarang!", inline=False)
+                    warning_embed.set_footer(text="Diary Crypto Payment Bot • Real Time WIB")
+                    warning_embed.set_thumbnail(url=member.avatar.url if member.avatar else "")
                     
+                    dm_dispatcher.send(member, PRIORITY_REMINDER, embed=warning_embed)
+                    print(f"  ✅ 3-Day WARNING YELLOW EMBED queued to {discord_username} (Hari ke-{reminder_count+1})")
+                except discord.HTTPException as e:
+                    print(f"  ⚠️ Could not send DM to {discord_id}: {e}")
+                
+                # Send YELLOW GRADIENT EMAIL
+                try:
+                    member_avatar = str(member.avatar.url) if member.avatar else str(member.default_avatar)
+                    end_datetime = format_jakarta_datetime_full(end_dt)
+                    send_3day_expiry_warning_email(nama, email, pkg_name, end_datetime, member_avatar, sisa_hari)
+                    print(f"  ✅ 3-Day WARNING YELLOW EMAIL sent to {email}")
                 except Exception as e:
-                    print(f"  ❌ Error: {e}")
+                    print(f"  ❌ Error sending 3-day warning email: {e}")
+                
+                # Increment reminder count
+                await Database.aexecute('UPDATE subscriptions SET expiry_reminder_count = expiry_reminder_count + 1 WHERE order_id = ?', (order_id,))
+                print(f"  ✅ Reminder count incremented for {nama} (Now: {reminder_count+1}/3)")
+                reminder_count += 1
             
-            conn.commit()
-            conn.close()
+            # Reminder berikutnya paling cepat besok 00:00 (bot yang baru nyala tidak mengirim 3x berturut-turut)
+            next_due = _warning_due(end_dt, reminder_count)
+            if next_due is not None:
+                scheduler.schedule('subscription_warning', order_id, max(next_due, today_start + timedelta(days=1)))
             
         except Exception as e:
-            # Silently handle database errors in background task
-            pass
-        
-        # Check setiap 1 jam (3600 seconds)
-        await asyncio.sleep(3600)
+            print(f"  ❌ Error: {e}")
 
 
-async def check_trial_expiry_warning():
-    """Background task untuk kirim warning trial member sebelum expire (1 hari sebelum)"""
-    await bot.wait_until_ready()
+async def warn_expiring_trials(discord_ids):
+    """Warning trial member 24 jam sebelum expire"""
+    guild = _require_guild()
+    now = get_jakarta_datetime()
+    trial_warnings = await Database.aexecute(f'''SELECT discord_id, discord_username, username, email, trial_end 
+                                                 FROM trial_members 
+                                                 WHERE status = "active" AND discord_id IN {_in_params(discord_ids)}''',
+                                             tuple(discord_ids), fetch_all=True, commit=False)
     
-    while not bot.is_closed():
+    if trial_warnings:
+        print(f"🔔 Trial Warning Check: Found {len(trial_warnings)} trial members to warn")
+    
+    trial_role = role_service.get(guild, TRIAL_MEMBER_ROLE_NAME)
+    for discord_id, discord_username, username, email, trial_end in trial_warnings:
         try:
-            conn = Database.connect()
-            c = conn.cursor()
-            
-            now = get_jakarta_datetime()
-            tomorrow = (now + timedelta(hours=24)).strftime('%Y-%m-%d')
-            
-            # Find trial members yang akan expire dalam < 24 jam
-            c.execute('''SELECT discord_id, discord_username, username, email, trial_end 
-                        FROM trial_members 
-                        WHERE status = "active" 
-                        AND CAST(trial_end AS DATE) <= CAST(? AS DATE)''',
-                     (tomorrow,))
-            
-            trial_warnings = c.fetchall()
-            
-            if trial_warnings:
-                print(f"🔔 Trial Warning Check: Found {len(trial_warnings)} trial members to warn")
-            
-            guild = bot.get_guild(GUILD_ID)
-            if not guild:
-                conn.close()
-                await asyncio.sleep(60)
+            trial_end = from_db_timestamp(trial_end)
+            if trial_end - TRIAL_WARNING_BEFORE > now:
+                scheduler.schedule('trial_warning', discord_id, trial_end - TRIAL_WARNING_BEFORE)
                 continue
             
-            for discord_id, discord_username, username, email, trial_end in trial_warnings:
+            member = guild.get_member(int(discord_id))
+            
+            # Check if member still has trial role
+            if member and trial_role and trial_role in member.roles:
+                # Send ORANGE DM notification
                 try:
-                    member = guild.get_member(int(discord_id))
-                    
-                    # Check if member still has trial role
-                    trial_role = discord.utils.get(guild.roles, name=TRIAL_MEMBER_ROLE_NAME)
+                    trial_embed = discord.Embed(
+                        title="⏳ TRIAL AKAN BERAKHIR! ⏳",
+                        description="Akses trial The Warrior kamu akan segera berakhir",
+                        color=0xf7931a
+                    )
+                    trial_embed.add_field(name="📅 Berakhir", value=format_jakarta_datetime_full(trial_end), inline=True)
+                    trial_embed.add_field(name="⚠️ Status", value="KURANG DARI 24 JAM", inline=True)
+                    trial_embed.add_field(name="💡 Aksi", value="Klik `/buy` untuk perpanjang atau beli paket premium!", inline=False)
+                    trial_embed.set_footer(text="Diary Crypto Payment Bot • Real Time WIB")
+                    trial_embed.set_thumbnail(url=member.avatar.url if member.avatar else "")
                     
-                    if member and trial_role and trial_role in member.roles:
-                        # Send ORANGE DM notification
-                        try:
-                            trial_embed = discord.Embed(
-                                title="⏳ TRIAL AKAN BERAKHIR! ⏳",
-                                description="Akses trial The Warrior kamu akan segera berakhir",
-                                color=0xf7931a
-                            )
-                            trial_embed.add_field(name="📅 Berakhir", value=format_jakarta_datetime_full(datetime.fromisoformat(trial_end)), inline=True)
-                            trial_embed.add_field(name="⚠️ Status", value="KURANG DARI 24 JAM", inline=True)
-                            trial_embed.add_field(name="💡 Aksi", value="Klik `/buy` untuk perpanjang atau beli paket premium!", inline=False)
-                            trial_embed.set_footer(text="Diary Crypto Payment Bot • Real Time WIB")
-                            trial_embed.set_thumbnail(url=member.avatar.url if member.avatar else "")
-                            
-                            await member.send(embed=trial_embed)
-                            print(f"  ✅ Trial warning ORANGE EMBED sent to {discord_username}")
-                        except discord.HTTPException as e:
-                            print(f"  ⚠️ Could not send DM to {discord_id}: {e}")
-                        
-                        # Send ORANGE GRADIENT EMAIL
-                        try:
-                            member_avatar = str(member.avatar.url) if member.avatar else str(member.default_avatar)
-                            trial_end_display = format_jakarta_datetime_full(datetime.fromisoformat(trial_end))
-                            send_trial_expiry_warning_email(username, email, trial_end_display, member_avatar, 24)
-                            print(f"  ✅ Trial warning ORANGE EMAIL sent to {email}")
-                        except Exception as e:
-                            print(f"  ❌ Error sending trial warning email: {e}")
-                    else:
-                        # Member tidak punya role = sudah di-kick, mark as expired
-                        trial_db = Database.connect()
-                        trial_c = trial_db.cursor()
-                        trial_c.execute('UPDATE trial_members SET status = "expired" WHERE discord_id = ?', (discord_id,))
-                        trial_db.commit()
-                        trial_db.close()
-                        print(f"  ℹ️ Trial marked as expired for {discord_username} (role removed)")
+                    dm_dispatcher.send(member, PRIORITY_REMINDER, embed=trial_embed)
+                    print(f"  ✅ Trial warning ORANGE EMBED queued for {discord_username}")
+                except discord.HTTPException as e:
+                    print(f"  ⚠️ Could not send DM to {discord_id}: {e}")
+                
+                # Send ORANGE GRADIENT EMAIL
+                try:
+                    member_avatar = str(member.avatar.url) if member.avatar else str(member.default_avatar)
+                    trial_end_display = format_jakarta_datetime_full(trial_end)
+                    send_trial_expiry_warning_email(username, email, trial_end_display, member_avatar, 24)
+                    print(f"  ✅ Trial warning ORANGE EMAIL sent to {email}")
                 except Exception as e:
-                    print(f"  ❌ Error: {e}")
-            
-            conn.close()
-            
+                    print(f"  ❌ Error sending trial warning email: {e}")
+            else:
+                # Member tidak punya role = sudah di-kick, mark as expired
+                await Database.aexecute('UPDATE trial_members SET status = "expired" WHERE discord_id = ?', (discord_id,))
+                scheduler.cancel('trial_expiry', discord_id)
+                print(f"  ℹ️ Trial marked as expired for {discord_username} (role removed)")
         except Exception as e:
-            # Silently handle database errors in background task
-            pass
-        
-        await asyncio.sleep(3600)
+            print(f"  ❌ Error: {e}")
 
 
 async def keep_alive():
@@ -1900,9 +1259,10 @@ async def keep_alive():
     
     while not bot.is_closed():
         try:
-            # Ping ke Flask endpoint untuk keep Replit environment active
+            # Ping ke webhook server sendiri (Flask / aiohttp, WEBHOOK_HOST:WEBHOOK_PORT) untuk keep Replit environment active.
+            # Di thread: mode aiohttp melayani request ini di loop yang sama
             try:
-                requests.get('http://127.0.0.1:5000/', timeout=2)
+                await asyncio.to_thread(requests.get, local_url('/'), timeout=2)
                 print(f"💓 Keep-alive ping sent at {format_jakarta_datetime(get_jakarta_datetime())}")
             except Exception as e:
                 print(f"⚠️ Keep-alive ping failed: {e}")
@@ -1914,64 +1274,220 @@ async def keep_alive():
             await asyncio.sleep(60)
 
 
-async def remove_expired_trial_members():
-    await bot.wait_until_ready()
+async def expire_trials(discord_ids):
+    """Trial yang trial_end-nya lewat: cabut role Trial Member (satu batch), DM, tandai expired"""
+    guild = _require_guild()
+    now = get_jakarta_datetime()
+    expired_trials = await Database.aexecute(f'''SELECT discord_id, discord_username, trial_end FROM trial_members 
+                                                 WHERE status = "active" AND discord_id IN {_in_params(discord_ids)}''',
+                                             tuple(discord_ids), fetch_all=True, commit=False)
     
-    while not bot.is_closed():
+    print(f"🔍 Trial check: Found {len(expired_trials)} expired trial members")
+    
+    trial_role = role_service.get(guild, TRIAL_MEMBER_ROLE_NAME)
+    batch = role_service.batch('trial_expiry', reason="Trial expired")
+    expired, notices = [], {}
+    for discord_id, discord_username, trial_end in expired_trials:
         try:
-            conn = Database.connect()
-            c = conn.cursor()
-            
-            # Use Jakarta timezone untuk accurate comparison dengan database
-            now = get_jakarta_datetime().strftime('%Y-%m-%d %H:%M:%S')
-            
-            c.execute('SELECT discord_id, discord_username FROM trial_members WHERE status = "active" AND CAST(trial_end AS DATE) <= CAST(? AS DATE)', (now,))
-            expired_trials = c.fetchall()
-            
-            print(f"🔍 Trial check: Found {len(expired_trials)} expired trial members")
-            
-            guild = bot.get_guild(GUILD_ID)
-            if not guild:
-                conn.close()
-                await asyncio.sleep(300)
+            trial_end = from_db_timestamp(trial_end)
+            if trial_end > now:
+                scheduler.schedule('trial_expiry', discord_id, trial_end)
                 continue
             
-            for discord_id, discord_username in expired_trials:
-                try:
-                    member = guild.get_member(int(discord_id))
-                    if member:
-                        trial_role = discord.utils.get(guild.roles, name=TRIAL_MEMBER_ROLE_NAME)
-                        if trial_role and trial_role in member.roles:
-                            await member.remove_roles(trial_role)
-                            print(f"  ✅ Trial role removed from {discord_username}")
-                            
-                            try:
-                                embed = discord.Embed(
-                                    title="⏰ Trial Membership Expired",
-                                    description="Masa trial Anda telah berakhir. Saatnya untuk upgrade membership The Warrior!",
-                                    color=0xff0000
-                                )
-                                embed.set_footer(text="📊 Diary Crypto Bot")
-                                
-                                await member.send(embed=embed)
-                                print(f"  ✅ DM sent to {member.name}")
-                            except discord.HTTPException:
-                                print(f"  ⚠️ Could not send DM to {discord_id}")
-                    
-                    c.execute('UPDATE trial_members SET status = "expired" WHERE discord_id = ?', (discord_id,))
-                    print(f"  ✅ Trial member marked as expired")
-                    
-                except Exception as e:
-                    print(f"  ❌ Error: {e}")
-            
-            conn.commit()
-            conn.close()
-            
+            member = guild.get_member(int(discord_id))
+            if member and trial_role and trial_role in member.roles:
+                batch.remove(member, trial_role, key=discord_id)
+                notices[discord_id] = (member, discord_username)
+            expired.append(discord_id)
         except Exception as e:
-            # Silently handle database errors in background task
-            pass
-        
-        await asyncio.sleep(300)
+            print(f"  ❌ Error: {e}")
+    
+    report = await batch.run()
+    for keys, _ in report['failed'].values():
+        for discord_id in keys:
+            expired.remove(discord_id)
+            notices.pop(discord_id, None)
+            scheduler.schedule('trial_expiry', discord_id, time.time() + scheduler.retry_delay)
+    
+    for discord_id, (member, discord_username) in notices.items():
+        print(f"  ✅ Trial role removed from {discord_username}")
+        try:
+            embed = discord.Embed(
+                title="⏰ Trial Membership Expired",
+                description="Masa trial Anda telah berakhir. Saatnya untuk upgrade membership The Warrior!",
+                color=0xff0000
+            )
+            embed.set_footer(text="📊 Diary Crypto Bot")
+            
+            dm_dispatcher.send(member, PRIORITY_REMINDER, embed=embed)
+            print(f"  ✅ DM queued for {member.name}")
+        except discord.HTTPException:
+            print(f"  ⚠️ Could not send DM to {discord_id}")
+    
+    if expired:
+        await Database.arun(Database.executemany, 'UPDATE trial_members SET status = "expired" WHERE discord_id = ?',
+                            [(discord_id,) for discord_id in expired])
+        for discord_id in expired:
+            scheduler.cancel('trial_warning', discord_id)
+        print(f"  ✅ {len(expired)} trial member marked as expired")
+
+
+scheduler.register('order_timeout', expire_stale_orders, _load_order_deadlines)
+scheduler.register('subscription_expiry', expire_subscriptions, _load_subscription_expiry_deadlines)
+scheduler.register('subscription_warning', warn_expiring_subscriptions, _load_subscription_warning_deadlines)
+scheduler.register('trial_expiry', expire_trials, _load_trial_expiry_deadlines)
+scheduler.register('trial_warning', warn_expiring_trials, _load_trial_warning_deadlines)
+scheduler.share()
+
+
+# ============ OUTBOX HANDLERS ============
+# Notifikasi Midtrans (di-ack webhook) dan side effect aktivasinya. Return = selesai, raise = outbox
+# mencoba ulang dengan backoff, jadi handler harus aman dijalankan ulang (role dicek dulu, DM/email paling buruk terkirim dua kali).
+
+async def _outbox_member(discord_id):
+    """(guild, member) - member None kalau user sudah keluar dari server"""
+    guild = bot.get_guild(GUILD_ID)
+    if guild is None:
+        raise RuntimeError(f"Guild {GUILD_ID} not ready")
+    member = guild.get_member(int(discord_id))
+    if member is None:
+        try:
+            member = await guild.fetch_member(int(discord_id))
+        except discord.NotFound:
+            return guild, None
+    return guild, member
+
+def _member_avatar(member):
+    return str(member.avatar.url) if member.avatar else str(member.default_avatar)
+
+async def _outbox_role_grant(payload):
+    guild, member = await _outbox_member(payload['discord_id'])
+    if member is None:
+        print(f"⚠️ Member {payload['discord_id']} not in guild - role '{payload['role']}' skipped")
+        return
+    role = role_service.get(guild, payload['role'])
+    if role is None:
+        raise LookupError(f"Role '{payload['role']}' not found in guild")
+    if role not in member.roles:
+        await member.add_roles(role, reason=f"Payment {payload['order_id']}")
+    print(f"✅ Role '{role.name}' assigned to {member}")
+
+async def _outbox_welcome_dm(payload):
+    _, member = await _outbox_member(payload['discord_id'])
+    dm_embed = discord.Embed(
+        title="✅ SELAMAT DATANG DI THE WARRIOR!",
+        description="Membership Anda berhasil diaktifkan!",
+        color=0xf7931a
+    )
+    if member is not None:
+        dm_embed.set_thumbnail(url=_member_avatar(member))
+    dm_embed.add_field(name="📦 Paket", value=f"**{payload['package_name']}**", inline=True)
+    dm_embed.add_field(name="📋 Order ID", value=f"`{payload['order_id']}`", inline=True)
+    dm_embed.add_field(name="📅 Mulai", value=payload['start_date'], inline=True)
+    dm_embed.add_field(name="⏰ Berakhir", value=payload['end_date'], inline=True)
+    dm_embed.add_field(name="🎯 Info", value="Nikmati akses eksklusif ke The Warrior!", inline=False)
+    dm_embed.set_footer(text="Diary Crypto Payment Bot • Terima kasih!")
+    
+    # Dispatcher sudah retry error sementara; False = DM tertutup, retry outbox tidak akan membantu
+    if await dm_dispatcher.send(member or int(payload['discord_id']), PRIORITY_PAYMENT, embed=dm_embed):
+        print(f"✅ Welcome embed sent to {payload['nama']}")
+
+async def _outbox_welcome_email(payload):
+    if not GMAIL_SENDER or not GMAIL_PASSWORD:
+        print("⚠️ Gmail not configured - welcome email skipped")
+        return
+    _, member = await _outbox_member(payload['discord_id'])
+    sent = _queue_email('welcome', payload['email'], member_name=payload['nama'], package_name=payload['package_name'],
+                        order_id=payload['order_id'], start_date=payload['start_date'], end_date=payload['end_date'],
+                        referral_code='', member_avatar=_member_avatar(member) if member else '')
+    if not await asyncio.wrap_future(sent):
+        raise RuntimeError(f"Welcome email to {payload['email']} not delivered")
+
+async def _outbox_admin_email(payload):
+    if not GMAIL_SENDER or not GMAIL_PASSWORD or not ADMIN_EMAIL:
+        print("⚠️ Gmail or Admin email not configured - admin notification skipped")
+        return
+    sent = _queue_email('admin_new_member', ADMIN_EMAIL, member_name=payload['nama'], member_email=payload['email'],
+                        package_name=payload['package_name'], order_id=payload['order_id'], sent_at=payload['paid_at'])
+    if not await asyncio.wrap_future(sent):
+        raise RuntimeError(f"Admin notification for {payload['order_id']} not delivered")
+
+
+async def _outbox_payment_notification(data):
+    """Notifikasi Midtrans yang sudah di-ack webhook: aktivasi + side effect dalam satu transaksi"""
+    order_id = data.get('order_id')
+    transaction_status = data.get('transaction_status')
+    
+    # Handle both 'settlement' dan 'capture' status (payment successful)
+    if transaction_status not in ['settlement', 'capture', 'accept_partial_credit']:
+        return
+    
+    pending = await Database.arun(get_pending_order, order_id)
+    if not pending:
+        print(f"⚠️ Pending order NOT found for {order_id} - might be already processed or expired")
+        return
+    
+    order_id_db, discord_id, discord_username, nama, email, package_type, payment_url, status, created_at = pending
+    print(f"✅ Found pending order - Discord ID: {discord_id}, Package: {package_type}")
+    
+    packages = get_all_packages()
+    pkg = packages.get(package_type)
+    pkg_name = pkg['name'] if pkg else package_type
+    
+    # Aktivasi + hapus pending order + side effect (outbox) atomik - commit = role/DM/email pasti dijalankan.
+    # DELETE pending order dulu sebagai klaim: capture + settlement untuk order yang sama (dua kunci dedup
+    # berbeda) yang diproses bersamaan hanya mengaktifkan sekali.
+    # Satu unit di writer thread (SQLite) - klaim DELETE tidak bersaing dengan writer untuk file lock.
+    def activate(tx):
+        if not tx.execute('DELETE FROM pending_orders WHERE order_id = ?', (order_id,)):
+            print(f"♻️ Order {order_id} already activated by another notification")
+            return False
+        sub_data = save_subscription(order_id, discord_id, discord_username, nama, email, package_type, tx=tx)
+        if not sub_data:
+            tx.rollback()  # paket tidak ada - pending order tetap disimpan
+        else:
+            start_date, end_date = sub_data
+            activation = {'order_id': order_id, 'discord_id': str(discord_id), 'nama': nama, 'email': email,
+                          'package_name': pkg_name, 'start_date': start_date, 'end_date': end_date}
+            outbox.enqueue(tx, 'role_grant', {'order_id': order_id, 'discord_id': str(discord_id), 'role': WARRIOR_ROLE_NAME})
+            outbox.enqueue(tx, 'welcome_dm', activation)
+            outbox.enqueue(tx, 'welcome_email', activation)
+            outbox.enqueue(tx, 'admin_email', dict(activation, paid_at=format_jakarta_datetime(datetime.now())))
+        return sub_data
+    
+    if await Database.awrite_transaction(activate):
+        scheduler.cancel('order_timeout', order_id)
+        outbox.wakeup()
+        print(f"✅ Subscription activated for {nama}, pending order deleted, side effects queued")
+
+
+outbox.register(NOTIFICATION_KIND, _outbox_payment_notification)
+outbox.register('role_grant', _outbox_role_grant)
+outbox.register('welcome_dm', _outbox_welcome_dm)
+outbox.register('welcome_email', _outbox_welcome_email)
+outbox.register('admin_email', _outbox_admin_email)
+outbox.register_cleanup(webhook_ingest.purge)
+outbox.share()
+
+# Hanya satu replica (leader) yang menjalankan task terjadwal; webhook & command tetap jalan di semua replica
+leader = LeaderElection('scheduler')
+leader_tasks = []
+
+async def _start_leader_tasks():
+    print("✅ Deadline scheduler started! (order timeout, expiry, 3-day & trial warnings)")
+    leader_tasks.append(bot.loop.create_task(scheduler.run()))
+    
+    print("✅ Auto role removal started!")
+    leader_tasks.append(bot.loop.create_task(auto_remove_expired_members()))
+    
+    leader_tasks.append(bot.loop.create_task(outbox.run()))
+
+async def _stop_leader_tasks():
+    for task in leader_tasks:
+        task.cancel()
+    await asyncio.gather(*leader_tasks, return_exceptions=True)
+    leader_tasks.clear()
+    print("⏸️ Scheduled tasks stopped - replica ini standby")
 
 
 @bot.event
@@ -1994,23 +1510,15 @@ async def on_ready():
         print(f"❌ Error syncing commands: {e}")
     
     if not bot.is_synced:
-        print("✅ Stale order cleanup started!")
-        bot.loop.create_task(cleanup_stale_orders())
+        dm_dispatcher.start()
+        print(f"✅ DM dispatcher started! ({dm_dispatcher.rate:g}/s, {dm_dispatcher.concurrency} workers)")
         
-        print("✅ Expiry checker started!")
-        bot.loop.create_task(check_expired_subscriptions())
+        if WEBHOOK_SERVER == 'aiohttp':
+            await webhook_server.start()
+            print(f"✅ Webhook server (aiohttp) listening on {WEBHOOK_HOST}:{WEBHOOK_PORT}")
         
-        print("✅ 3-Day expiry warning started!")
-        bot.loop.create_task(check_3day_expiry_warning())
-        
-        print("✅ Trial expiry warning started!")
-        bot.loop.create_task(check_trial_expiry_warning())
-        
-        print("✅ Auto role removal started!")
-        bot.loop.create_task(auto_remove_expired_members())
-        
-        print("✅ Trial member auto-removal started!")
-        bot.loop.create_task(remove_expired_trial_members())
+        print(f"✅ Leader election started! ({leader.stats()['backend']}, {leader.identity})")
+        bot.loop.create_task(leader.run(_start_leader_tasks, _stop_leader_tasks))
         
         print("✅ Keep-alive task started! (Ping every 15 min)")
         bot.loop.create_task(keep_alive())
@@ -2112,12 +1620,14 @@ class BuyNewModal(discord.ui.Modal, title="📝 Beli Paket Baru"):
     
     async def on_submit(self, interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True)
+        if await _gateway_down(interaction):
+            return
         
         discord_id = str(interaction.user.id)
         discord_username = self.nama_user_discord.value
         package_id = self.package_id
         
-        packages = get_all_packages()
+        packages = await Database.arun(get_all_packages)
         pkg = packages.get(package_id)
         email_val = self.email.value
         nama_val = self.nama.value
@@ -2133,7 +1643,7 @@ class BuyNewModal(discord.ui.Modal, title="📝 Beli Paket Baru"):
         
         # Verify discount code
         if discount_code_val:
-            verify_result = verify_discount_code(discount_code_val)
+            verify_result = await Database.arun(verify_discount_code, discount_code_val)
             if verify_result["valid"]:
                 discount_percent = verify_result["discount_percent"]
                 discount_amount = int(pkg['price'] * discount_percent / 100)
@@ -2154,7 +1664,7 @@ class BuyNewModal(discord.ui.Modal, title="📝 Beli Paket Baru"):
         
         # Verify referral code
         if referral_code_val:
-            verify_result = verify_referral_code(referral_code_val)
+            verify_result = await Database.arun(verify_referral_code, referral_code_val)
             if verify_result["valid"]:
                 analyst_id = verify_result["analyst_id"]
                 analyst_name = verify_result["analyst_name"]
@@ -2167,32 +1677,40 @@ class BuyNewModal(discord.ui.Modal, title="📝 Beli Paket Baru"):
         
         # Create order
         order_id = f"ORD_{discord_id}_{int(time.time())}"
-        save_pending_order(order_id, discord_id, discord_username, nama_val, email_val, package_id, "https://checkout.midtrans.com")
         
-        # Update order dan track komisi
-        conn = Database.connect()
-        c = conn.cursor()
-        c.execute('UPDATE pending_orders SET price = ? WHERE order_id = ?', (final_price, order_id))
+        # Order, pemakaian diskon dan komisi dicatat dalam satu unit-of-work (writer thread di SQLite)
+        def record_order(tx):
+            # Order identik yang belum dibayar → pakai order itu, tanpa order / diskon / transaksi Midtrans baru
+            open_checkout = find_open_checkout(tx, discord_id, package_id, final_price, 'ORD', analyst_id)
+            if open_checkout:
+                return open_checkout
+            save_pending_order(order_id, discord_id, discord_username, nama_val, email_val, package_id,
+                               None, price=final_price, tx=tx)
+            
+            if discount_code_val:
+                # Conditional UPDATE - gagal kalau kuota habis sejak verifikasi di atas (checkout bersamaan)
+                if not tx.execute(CONSUME_DISCOUNT_SQL, (discount_code_val.upper(),)):
+                    raise CodeUnavailable("Kode diskon sudah mencapai batas penggunaan")
+            
+            if analyst_id and referral_code_val:
+                # Track komisi untuk analyst
+                commission_amount = int(final_price * 30 / 100)
+                created_at = get_jakarta_datetime().strftime('%Y-%m-%d %H:%M:%S')
+                tx.defer('INSERT INTO commissions (order_id, analyst_id, analyst_name, commission_amount, created_at, earned_date) VALUES (?, ?, ?, ?, ?, ?)',
+                         (order_id, analyst_id, analyst_name, commission_amount, created_at, to_db_timestamp(get_jakarta_datetime())))
+            return None
         
+        try:
+            open_checkout = await Database.awrite_transaction(record_order)
+        except CodeUnavailable as e:
+            await Database.arun(code_registry.refresh, 'discount', discount_code_val)
+            await interaction.followup.send(f"❌ {e}", ephemeral=True)
+            return
+        if open_checkout:
+            await send_open_checkout(interaction, pkg, final_price, open_checkout)
+            return
         if discount_code_val:
-            c.execute('UPDATE discount_codes SET used_count = used_count + 1 WHERE code = ?', (discount_code_val.upper(),))
-        
-        if analyst_id and referral_code_val:
-            # Track komisi untuk analyst
-            commission_amount = int(final_price * 30 / 100)
-            c.execute('''CREATE TABLE IF NOT EXISTS commissions (
-                order_id TEXT,
-                analyst_id TEXT,
-                analyst_name TEXT,
-                commission_amount REAL,
-                created_at TEXT
-            )''')
-            created_at = get_jakarta_datetime().strftime('%Y-%m-%d %H:%M:%S')
-            c.execute('INSERT INTO commissions (order_id, analyst_id, analyst_name, commission_amount, created_at) VALUES (?, ?, ?, ?, ?)',
-                     (order_id, analyst_id, analyst_name, commission_amount, created_at))
-        
-        conn.commit()
-        conn.close()
+            code_registry.record_use('discount', discount_code_val)
         
         embed = discord.Embed(
             title="✅ Beli Paket Baru - Checkout Dibuat",
@@ -2212,9 +1730,13 @@ class BuyNewModal(discord.ui.Modal, title="📝 Beli Paket Baru"):
         # Send DM dengan instruksi pembayaran - EMBED DENGAN AVATAR
         try:
             # Generate payment link dari Midtrans (redirect_url)
-            payment_link = generate_snap_token(order_id, final_price, nama_val, email_val)
+            payment_link = await generate_snap_token(order_id, final_price, nama_val, email_val)
             
-            if not payment_link:
+            if payment_link:
+                # Link asli disimpan - checkout ulang yang identik memakai link ini (find_open_checkout)
+                await Database.aexecute('UPDATE pending_orders SET payment_url = ? WHERE order_id = ?', (payment_link, order_id))
+                checkout_metrics['created'] += 1
+            else:
                 payment_link = "https://app.sandbox.midtrans.com"  # Fallback ke halaman utama
                 print(f"⚠️ Fallback payment link digunakan untuk {order_id}")
             
@@ -2233,8 +1755,8 @@ class BuyNewModal(discord.ui.Modal, title="📝 Beli Paket Baru"):
             dm_embed.add_field(name="📌 Info", value="Invoice juga sudah dikirim ke email Anda", inline=False)
             dm_embed.set_footer(text="Diary Crypto Payment Bot • Terima kasih!")
             
-            await interaction.user.send(embed=dm_embed)
-            print(f"✅ DM checkout dikirim ke {discord_username}")
+            dm_dispatcher.send(interaction.user, PRIORITY_PAYMENT, embed=dm_embed)
+            print(f"✅ DM checkout diantrikan ke {discord_username}")
         except discord.HTTPException as e:
             print(f"⚠️ Gagal kirim DM ke {discord_username}: {e}")
 
@@ -2246,25 +1768,24 @@ class RenewModal(discord.ui.Modal, title="🔄 Perpanjang Membership"):
     
     async def on_submit(self, interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True)
+        if await _gateway_down(interaction):
+            return
         
         discord_id = str(interaction.user.id)
         discord_username = self.nama_user_discord.value
         package_id = self.package_id
         
         # Get current subscription
-        conn = Database.connect()
-        c = conn.cursor()
-        c.execute('SELECT email, nama, start_date, end_date FROM subscriptions WHERE discord_id = ? AND status = "active"', (discord_id,))
-        current = c.fetchone()
+        current = await Database.aexecute_prepared('active_subscription_detail_by_member', (discord_id,), fetch_one=True, commit=False)
         
         if not current:
-            conn.close()
             await interaction.followup.send("❌ Anda belum memiliki membership aktif!", ephemeral=True)
             return
         
         email_val, nama_val, old_start, old_end = current
+        old_end = format_db_timestamp(old_end)
         
-        packages = get_all_packages()
+        packages = await Database.arun(get_all_packages)
         pkg = packages.get(package_id)
         discount_code_val = self.discount_code.value.strip() if self.discount_code.value else ""
         referral_code_val = self.referral_code.value.strip() if self.referral_code.value else ""
@@ -2278,20 +1799,19 @@ class RenewModal(discord.ui.Modal, title="🔄 Perpanjang Membership"):
         
         # Verify discount code
         if discount_code_val:
-            verify_result = verify_discount_code(discount_code_val)
+            verify_result = await Database.arun(verify_discount_code, discount_code_val)
             if verify_result["valid"]:
                 discount_percent = verify_result["discount_percent"]
                 discount_amount = int(pkg['price'] * discount_percent / 100)
                 final_price = pkg['price'] - discount_amount
                 discount_info = f"\n💰 Diskon: {discount_percent}% (-Rp {discount_amount:,})"
             else:
-                conn.close()
                 await interaction.followup.send(f"❌ {verify_result['message']}", ephemeral=True)
                 return
         
         # Verify referral code
         if referral_code_val:
-            verify_result = verify_referral_code(referral_code_val)
+            verify_result = await Database.arun(verify_referral_code, referral_code_val)
             if verify_result["valid"]:
                 analyst_id = verify_result["analyst_id"]
                 analyst_name = verify_result["analyst_name"]
@@ -2299,13 +1819,11 @@ class RenewModal(discord.ui.Modal, title="🔄 Perpanjang Membership"):
                 commission_amount = int(final_price * commission_percent / 100)
                 referral_info = f"\n👥 Referral dari: {analyst_name} (Komisi: {commission_percent}% = Rp {commission_amount:,})"
             else:
-                conn.close()
                 await interaction.followup.send(f"❌ {verify_result['message']}", ephemeral=True)
                 return
         
         # Create renewal order
         order_id = f"REN_{discord_id}_{int(time.time())}"
-        save_pending_order(order_id, discord_id, discord_username, nama_val, email_val, package_id, "https://checkout.midtrans.com")
         
         # Renewals table already created in init_db()
         
@@ -2317,27 +1835,37 @@ class RenewModal(discord.ui.Modal, title="🔄 Perpanjang Membership"):
         created_at = get_jakarta_datetime().strftime('%Y-%m-%d %H:%M:%S')
         
         # Track renewal
-        c.execute('UPDATE pending_orders SET price = ? WHERE order_id = ?', (final_price, order_id))
-        c.execute('INSERT INTO renewals (order_id, discord_id, discord_username, package_type, old_end_date, new_end_date, renewal_price, discount_applied, referral_applied, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
-                 (order_id, discord_id, discord_username, package_id, old_end, new_end_date, final_price, discount_code_val or "none", referral_code_val or "none", created_at))
+        def record_renewal(tx):
+            open_checkout = find_open_checkout(tx, discord_id, package_id, final_price, 'REN', analyst_id)
+            if open_checkout:
+                return open_checkout
+            save_pending_order(order_id, discord_id, discord_username, nama_val, email_val, package_id,
+                               None, price=final_price, tx=tx)
+            tx.defer('INSERT INTO renewals (order_id, discord_id, discord_username, package_type, old_end_date, new_end_date, renewal_price, discount_applied, referral_applied, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                     (order_id, discord_id, discord_username, package_id, old_end, new_end_date, final_price, discount_code_val or "none", referral_code_val or "none", created_at))
+            
+            if discount_code_val:
+                # Conditional UPDATE - gagal kalau kuota habis sejak verifikasi di atas (checkout bersamaan)
+                if not tx.execute(CONSUME_DISCOUNT_SQL, (discount_code_val.upper(),)):
+                    raise CodeUnavailable("Kode diskon sudah mencapai batas penggunaan")
+            
+            if analyst_id and referral_code_val:
+                commission_amount = int(final_price * 30 / 100)
+                tx.defer('INSERT INTO commissions (order_id, analyst_id, analyst_name, commission_amount, created_at, earned_date) VALUES (?, ?, ?, ?, ?, ?)',
+                         (order_id, analyst_id, analyst_name, commission_amount, created_at, to_db_timestamp(get_jakarta_datetime())))
+            return None
         
+        try:
+            open_checkout = await Database.awrite_transaction(record_renewal)
+        except CodeUnavailable as e:
+            await Database.arun(code_registry.refresh, 'discount', discount_code_val)
+            await interaction.followup.send(f"❌ {e}", ephemeral=True)
+            return
+        if open_checkout:
+            await send_open_checkout(interaction, pkg, final_price, open_checkout)
+            return
         if discount_code_val:
-            c.execute('UPDATE discount_codes SET used_count = used_count + 1 WHERE code = ?', (discount_code_val.upper(),))
-        
-        if analyst_id and referral_code_val:
-            commission_amount = int(final_price * 30 / 100)
-            c.execute('''CREATE TABLE IF NOT EXISTS commissions (
-                order_id TEXT,
-                analyst_id TEXT,
-                analyst_name TEXT,
-                commission_amount REAL,
-                created_at TEXT
-            )''')
-            c.execute('INSERT INTO commissions (order_id, analyst_id, analyst_name, commission_amount, created_at) VALUES (?, ?, ?, ?, ?)',
-                     (order_id, analyst_id, analyst_name, commission_amount, created_at))
-        
-        conn.commit()
-        conn.close()
+            code_registry.record_use('discount', discount_code_val)
         
         embed = discord.Embed(
             title="✅ Perpanjang Membership - Checkout Dibuat",
@@ -2363,9 +1891,13 @@ class RenewModal(discord.ui.Modal, title="🔄 Perpanjang Membership"):
         # Send DM dengan instruksi perpanjangan - EMBED DENGAN AVATAR
         try:
             # Generate payment link dari Midtrans (redirect_url)
-            payment_link = generate_snap_token(order_id, final_price, nama_val, email_val)
+            payment_link = await generate_snap_token(order_id, final_price, nama_val, email_val)
             
-            if not payment_link:
+            if payment_link:
+                # Link asli disimpan - checkout ulang yang identik memakai link ini (find_open_checkout)
+                await Database.aexecute('UPDATE pending_orders SET payment_url = ? WHERE order_id = ?', (payment_link, order_id))
+                checkout_metrics['created'] += 1
+            else:
                 payment_link = "https://app.sandbox.midtrans.com"  # Fallback ke halaman utama
                 print(f"⚠️ Fallback payment link digunakan untuk {order_id}")
             
@@ -2385,8 +1917,8 @@ class RenewModal(discord.ui.Modal, title="🔄 Perpanjang Membership"):
             dm_embed.add_field(name="✨ Ucapan Terima Kasih", value="Terimakasih Atas Loyalitas Nya Ke Diary Crypto! 💎", inline=False)
             dm_embed.set_footer(text="Diary Crypto Payment Bot • Terima kasih!")
             
-            await interaction.user.send(embed=dm_embed)
-            print(f"✅ DM perpanjangan dikirim ke {discord_username}")
+            dm_dispatcher.send(interaction.user, PRIORITY_PAYMENT, embed=dm_embed)
+            print(f"✅ DM perpanjangan diantrikan ke {discord_username}")
         except discord.HTTPException as e:
             print(f"⚠️ Gagal kirim DM ke {discord_username}: {e}")
 
@@ -2395,15 +1927,11 @@ class RenewModal(discord.ui.Modal, title="🔄 Perpanjang Membership"):
 async def buy_command(interaction: discord.Interaction):
     await interaction.response.defer(ephemeral=True)
     
-    packages = get_all_packages()
+    packages = await Database.arun(get_all_packages)
     discord_id = str(interaction.user.id)
     
     # Check if user already has active membership
-    conn = Database.connect()
-    c = conn.cursor()
-    c.execute('SELECT package_type, end_date FROM subscriptions WHERE discord_id = ? AND status = "active"', (discord_id,))
-    existing = c.fetchone()
-    conn.close()
+    existing = await Database.aexecute_prepared('active_subscription_by_member', (discord_id,), fetch_one=True, commit=False)
     
     # Buttons untuk pilih aksi
     class ActionView(discord.ui.View):
@@ -2483,6 +2011,7 @@ async def buy_command(interaction: discord.Interaction):
                     self.add_item(PackageSelect())
             
             pkg_type, end_date = existing
+            end_date = format_db_timestamp(end_date)
             embed = discord.Embed(
                 title="🔄 Perpanjang Membership",
                 description=f"Membership saat ini berakhir: **{end_date}**\n\nPilih paket perpanjang:",
@@ -2499,7 +2028,7 @@ async def buy_command(interaction: discord.Interaction):
     
     if existing:
         pkg_type, end_date = existing
-        embed.add_field(name="✅ Membership Aktif", value=f"Berakhir: {end_date}", inline=False)
+        embed.add_field(name="✅ Membership Aktif", value=f"Berakhir: {format_db_timestamp(end_date)}", inline=False)
     
     await interaction.followup.send(embed=embed, view=ActionView(has_membership=bool(existing)), ephemeral=True)
 
@@ -2523,14 +2052,10 @@ class TrialRedeemModal(discord.ui.Modal, title="🎉 Redeem Trial Member"):
         discord_id = str(interaction.user.id)
         discord_username = interaction.user.name
         
-        # Check if code exists
-        conn = Database.connect()
-        c = conn.cursor()
-        
-        c.execute('SELECT id, trial_code, discord_id, discord_username, email, username, trial_started, trial_end, status, created_at, created_by, duration_days, validity_days, code_expiry_date, max_uses, used_count FROM trial_members WHERE trial_code = ?', (trial_code_val,))
-        code_check = c.fetchone()
+        # Check if code exists (code registry - tanpa query untuk kode yang sudah dikenal)
+        code_check, reason = await Database.arun(code_registry.check, 'trial', trial_code_val)
         
-        if not code_check:
+        if reason == 'not_found':
             embed = discord.Embed(
                 title="⚠️ Kode Trial Tidak Valid",
                 description="Maaf, kode trial yang Anda masukkan tidak ditemukan atau sudah digunakan.",
@@ -2540,75 +2065,70 @@ class TrialRedeemModal(discord.ui.Modal, title="🎉 Redeem Trial Member"):
             embed.add_field(name="💡 Saran", value="Periksa kembali kode trial Anda atau hubungi admin untuk mendapatkan kode baru", inline=False)
             embed.set_footer(text="Diary Crypto Payment Bot • Real Time WIB")
             await interaction.followup.send(embed=embed, ephemeral=True)
-            conn.close()
             return
         
-        # Check if code is still valid (not expired)
-        code_expiry = code_check[13]  # code_expiry_date (index 13)
-        max_uses = int(code_check[14]) if code_check[14] else 0  # max_uses (index 14) - convert to int
-        used_count = int(code_check[15]) if code_check[15] else 0  # used_count (index 15) - convert to int
-        duration_days = int(code_check[11]) if code_check[11] else 1  # duration_days (index 11) - convert to int with default
-        
-        if code_expiry and isinstance(code_expiry, str):
-            try:
-                code_expiry_dt = datetime.fromisoformat(code_expiry)
-                if get_jakarta_datetime() > code_expiry_dt:
-                    embed = discord.Embed(
-                        title="⚠️ Kode Trial Sudah Expired",
-                        description="Maaf, kode trial ini sudah tidak berlaku lagi.",
-                        color=0xff4444
-                    )
-                    embed.add_field(name="📅 Berlaku Sampai", value=code_expiry, inline=False)
-                    embed.add_field(name="💡 Saran", value="Hubungi admin untuk mendapatkan kode trial yang baru", inline=False)
-                    embed.set_footer(text="Diary Crypto Payment Bot • Real Time WIB")
-                    await interaction.followup.send(embed=embed, ephemeral=True)
-                    conn.close()
-                    return
-            except (ValueError, TypeError):
-                pass  # Skip expiry check if date is invalid
+        max_uses = code_check['max_uses']
+        used_count = code_check['used_count']
+        duration_days = code_check['duration_days']
         
-        # Check if code has reached max uses
-        if max_uses > 0 and used_count >= max_uses:
+        # Check if code is still valid (not expired)
+        if reason == 'expired':
             embed = discord.Embed(
-                title="⚠️ Kode Trial Sudah Penuh",
-                description="Maaf, kode trial ini sudah digunakan oleh terlalu banyak orang.",
+                title="⚠️ Kode Trial Sudah Expired",
+                description="Maaf, kode trial ini sudah tidak berlaku lagi.",
                 color=0xff4444
             )
-            embed.add_field(name="👥 Kapasitas", value=f"Sudah digunakan: {used_count}/{max_uses} orang", inline=False)
+            embed.add_field(name="📅 Berlaku Sampai", value=code_check['expires_at'].strftime('%Y-%m-%d %H:%M:%S'), inline=False)
             embed.add_field(name="💡 Saran", value="Hubungi admin untuk mendapatkan kode trial yang baru", inline=False)
             embed.set_footer(text="Diary Crypto Payment Bot • Real Time WIB")
             await interaction.followup.send(embed=embed, ephemeral=True)
-            conn.close()
+            return
+        
+        # Check if code has reached max uses
+        full_embed = discord.Embed(
+            title="⚠️ Kode Trial Sudah Penuh",
+            description="Maaf, kode trial ini sudah digunakan oleh terlalu banyak orang.",
+            color=0xff4444
+        )
+        full_embed.add_field(name="👥 Kapasitas", value=f"Sudah digunakan: {used_count}/{max_uses} orang", inline=False)
+        full_embed.add_field(name="💡 Saran", value="Hubungi admin untuk mendapatkan kode trial yang baru", inline=False)
+        full_embed.set_footer(text="Diary Crypto Payment Bot • Real Time WIB")
+        if reason == 'exhausted':
+            await interaction.followup.send(embed=full_embed, ephemeral=True)
             return
         
         # Check if user already has active trial
-        c.execute('SELECT * FROM trial_members WHERE discord_id = ? AND status = "active"', (discord_id,))
-        existing = c.fetchone()
+        existing = await Database.aexecute('SELECT 1 FROM trial_members WHERE discord_id = ? AND status = "active"',
+                                           (discord_id,), fetch_one=True, commit=False)
         
         if existing:
             await interaction.followup.send("❌ Anda sudah memiliki trial member aktif!", ephemeral=True)
-            conn.close()
             return
         
         guild = interaction.guild
-        trial_role = discord.utils.get(guild.roles, name=TRIAL_MEMBER_ROLE_NAME)
+        trial_role = role_service.get(guild, TRIAL_MEMBER_ROLE_NAME)
         
         if not trial_role:
             await interaction.followup.send("❌ Role Trial Member tidak ditemukan di server!", ephemeral=True)
-            conn.close()
             return
         
         trial_start = get_jakarta_datetime()
         trial_end = trial_start + timedelta(days=duration_days)
         
-        # Update trial_members dengan data lengkap dan increment used_count
-        c.execute('''UPDATE trial_members 
-                    SET discord_id = ?, discord_username = ?, email = ?, username = ?, trial_started = ?, trial_end = ?, status = "active", used_count = used_count + 1
-                    WHERE trial_code = ?''',
-                 (discord_id, discord_username, email_val, username_val, trial_start.strftime('%Y-%m-%d %H:%M:%S'), 
-                  trial_end.strftime('%Y-%m-%d %H:%M:%S'), trial_code_val))
-        conn.commit()
-        conn.close()
+        # Update trial_members dengan data lengkap dan increment used_count - hanya kalau kuota masih ada
+        redeemed = await Database.awrite_transaction(lambda tx: tx.execute(f'''UPDATE trial_members 
+                        SET discord_id = ?, discord_username = ?, email = ?, username = ?, trial_started = ?, trial_end = ?, status = "active", used_count = COALESCE(used_count, 0) + 1
+                        WHERE trial_code = ? AND {HAS_CAPACITY}''',
+                     (discord_id, discord_username, email_val, username_val, trial_start.strftime('%Y-%m-%d %H:%M:%S'), 
+                      to_db_timestamp(trial_end), trial_code_val)))
+        
+        if not redeemed:
+            # Kuota habis diambil redeem lain sejak cek di atas
+            await Database.arun(code_registry.refresh, 'trial', trial_code_val)
+            await interaction.followup.send(embed=full_embed, ephemeral=True)
+            return
+        code_registry.record_use('trial', trial_code_val)
+        schedule_trial(discord_id, trial_end)
         
         await interaction.user.add_roles(trial_role)
         
@@ -2646,8 +2166,8 @@ class TrialRedeemModal(discord.ui.Modal, title="🎉 Redeem Trial Member"):
             dm_embed.add_field(name="🔗 Aksi", value="Gunakan `/buy` untuk beli paket lebih lama!", inline=False)
             dm_embed.set_footer(text="Diary Crypto Payment Bot • Real Time WIB")
             
-            await interaction.user.send(embed=dm_embed)
-            print(f"✅ Trial ORANGE DM sent to {discord_username}")
+            dm_dispatcher.send(interaction.user, PRIORITY_NOTICE, embed=dm_embed)
+            print(f"✅ Trial ORANGE DM queued for {discord_username}")
         except discord.HTTPException as e:
             print(f"⚠️ Could not send DM to {discord_username}: {e}")
         
@@ -2771,8 +2291,13 @@ async def export_monthly_excel(interaction: discord.Interaction, year_month: str
         # ===== SHEET 1: SUMMARY =====
         ws_summary = wb.create_sheet("📊 Summary", 0)
         
+        # Range [awal bulan, awal bulan berikutnya) - pakai index, bukan LIKE
+        period_start = datetime.strptime(f"{year_month}-01", '%Y-%m-%d')
+        period_end = (period_start + timedelta(days=32)).replace(day=1)
+        period = (to_db_timestamp(period_start), to_db_timestamp(period_end))
+        
         # Get stats
-        c.execute('SELECT COUNT(*), COALESCE(SUM(price), 0) FROM pending_orders WHERE status = "settlement" AND created_at LIKE ?', (f'%{year_month}%',))
+        c.execute('SELECT COUNT(*), COALESCE(SUM(price), 0) FROM pending_orders WHERE status = "settlement" AND created_at >= ? AND created_at < ?', period)
         total_orders, total_revenue = c.fetchone()
         
         c.execute('SELECT COUNT(DISTINCT discord_id) FROM subscriptions WHERE status = "active"')
@@ -2787,7 +2312,7 @@ async def export_monthly_excel(interaction: discord.Interaction, year_month: str
         c.execute('SELECT COUNT(*) FROM pending_orders WHERE status = "pending"')
         pending_orders = c.fetchone()[0]
         
-        c.execute('SELECT COALESCE(SUM(commission_amount), 0) FROM commissions WHERE earned_date LIKE ?', (f'%{year_month}%',))
+        c.execute('SELECT COALESCE(SUM(commission_amount), 0) FROM commissions WHERE earned_date >= ? AND earned_date < ?', period)
         total_commission = c.fetchone()[0]
         
         # Summary headers
@@ -2848,7 +2373,7 @@ async def export_monthly_excel(interaction: discord.Interaction, year_month: str
             ws_members.cell(row=row, column=3).value = member[2]
             ws_members.cell(row=row, column=4).value = member[3]
             ws_members.cell(row=row, column=5).value = member[4]
-            ws_members.cell(row=row, column=6).value = member[5]
+            ws_members.cell(row=row, column=6).value = format_db_timestamp(member[5])
             ws_members.cell(row=row, column=7).value = member[6]
         
         for col in range(1, 8):
@@ -2874,7 +2399,7 @@ async def export_monthly_excel(interaction: discord.Interaction, year_month: str
             ws_trans.cell(row=row, column=5).value = trans[4]
             ws_trans.cell(row=row, column=6).value = f"Rp {int(trans[5]):,}"
             ws_trans.cell(row=row, column=7).value = trans[6]
-            ws_trans.cell(row=row, column=8).value = trans[7]
+            ws_trans.cell(row=row, column=8).value = format_db_timestamp(trans[7])
         
         for col in range(1, 9):
             ws_trans.column_dimensions[chr(64+col)].width = 18
@@ -2926,7 +2451,7 @@ async def export_monthly_excel(interaction: discord.Interaction, year_month: str
             ws_trial.cell(row=row, column=2).value = trial[1]
             ws_trial.cell(row=row, column=3).value = trial[2]
             ws_trial.cell(row=row, column=4).value = trial[3]
-            ws_trial.cell(row=row, column=5).value = trial[4]
+            ws_trial.cell(row=row, column=5).value = format_db_timestamp(trial[4])
             ws_trial.cell(row=row, column=6).value = trial[5]
             ws_trial.cell(row=row, column=7).value = trial[6]
         
@@ -3013,6 +2538,103 @@ async def bot_stats_command(interaction: discord.Interaction):
         embed.add_field(name="⏰ Expired Members", value=f"**{expired_members}** member", inline=True)
         embed.add_field(name="🎯 Trial Members", value=f"**{trial_members}** trial", inline=True)
         embed.add_field(name="💰 Total Revenue", value=f"Rp **{total_revenue:,}**", inline=False)
+        
+        pool_lines = []
+        for stats in Database.pool_stats():
+            pool_lines.append(
+                f"**{stats['pool']}**: {stats['in_use']}/{stats['max_size']} in use, "
+                f"{stats['idle']} idle, {stats['waiters']} waiting, "
+                f"avg wait {stats['avg_wait_ms']} ms (max {stats['max_wait_ms']} ms)"
+            )
+        writer = Database.writer_stats()
+        if writer:
+            pool_lines.append(
+                f"**{writer['pool']}**: {writer['jobs']} writes in {writer['commits']} commits "
+                f"(avg batch {writer['avg_batch']}, queued {writer['queued']}, avg queue {writer['avg_queue_ms']} ms)"
+            )
+        if pool_lines:
+            embed.add_field(name="🗄️ DB Pool", value="\n".join(pool_lines), inline=False)
+        
+        prepared = Database.prepared_stats()
+        embed.add_field(name="⚡ Prepared Statements",
+                        value=f"{prepared['hits']} hits / {prepared['misses']} prepares",
+                        inline=False)
+        
+        catalog = package_catalog.stats()
+        embed.add_field(name="📦 Package Cache",
+                        value=f"{catalog['hits']} hits / {catalog['misses']} loads ({catalog['hit_rate']}%), "
+                              f"{catalog['invalidations']} invalidations, TTL {catalog['ttl']:.0f}s",
+                        inline=False)
+        
+        stale = stale_order_metrics
+        embed.add_field(name="🧹 Stale Orders",
+                        value=f"{stale['expired']} expired dalam {stale['passes']} pass, {stale['dms_sent']} DM terkirim "
+                              f"({stale['dms_failed']} gagal) - pass terakhir {stale['last_pass_ms']} ms (max {stale['max_pass_ms']} ms)",
+                        inline=False)
+        
+        lead = leader.stats()
+        embed.add_field(name="👑 Leader",
+                        value=f"{'LEADER' if lead['is_leader'] else 'standby'} ({lead['backend']}) - {lead['identity']}\n"
+                              f"{lead['elections']} elected, {lead['demotions']} demoted, {lead['errors']} error",
+                        inline=False)
+        
+        sched = scheduler.stats()
+        pending_text = ", ".join(f"{kind}: {count}" for kind, count in sched['pending'].items()) or "kosong"
+        embed.add_field(name="⏱️ Scheduler",
+                        value=f"{pending_text}\nBerikutnya dalam {sched['next_in_s']}s - {sched['fired']} deadline, "
+                              f"telat rata-rata {sched['avg_lateness_ms']} ms (max {sched['max_lateness_ms']} ms)",
+                        inline=False)
+        
+        dms = dm_dispatcher.stats()
+        queued_text = ", ".join(f"{lane}: {count}" for lane, count in dms['queued'].items())
+        embed.add_field(name="📨 DM Dispatcher",
+                        value=f"Antrian {queued_text}\n{dms['sent']} terkirim ({dms['per_minute']}/menit, latency rata-rata {dms['avg_latency_ms']} ms), "
+                              f"{dms['failed']} gagal, {dms['retried']} retry, {dms['rate_limited']} rate limited, "
+                              f"{dms['skipped_closed']} skip (DM tertutup)",
+                        inline=False)
+        
+        sent_out = outbox.stats()
+        backlog = await Database.arun(outbox.backlog)
+        embed.add_field(name="📤 Outbox",
+                        value=f"{backlog.get('pending', 0)} pending, {backlog.get('dead', 0)} dead - {sent_out['done']} selesai, "
+                              f"{sent_out['retried']} retry ({'worker aktif' if sent_out['active'] else 'standby'})\n"
+                              f"Commit → selesai rata-rata {sent_out['avg_lag_ms']} ms (max {sent_out['max_lag_ms']} ms)",
+                        inline=False)
+        
+        hook = webhook_ingest.stats()
+        embed.add_field(name="🔔 Webhook Ack",
+                        value=f"p50 {hook['p50_ms']} ms, p99 {hook['p99_ms']} ms (max {hook['max_ms']} ms, target {hook['target_ms']:.0f} ms) - "
+                              f"{hook['accepted']} diterima, {hook['rejected']} ditolak, {hook['errors']} error, {hook['over_target']} lewat target\n"
+                              f"{hook['deduplicated']} duplikat diabaikan ({hook['dedup_hot']} dari memory, {hook['dedup_db']} dari database)",
+                        inline=False)
+        
+        gateway = payment_gateway.stats()
+        embed.add_field(name="💳 Midtrans",
+                        value=f"Breaker {gateway['breaker']}" + (f" (coba lagi {gateway['retry_in_s']}s)" if gateway['breaker'] == 'open' else "") +
+                              f", {gateway['trips']}x trip - {gateway['calls']} call ({gateway['failed']} gagal, {gateway['retried']} retry, "
+                              f"{gateway['rejected_open']} ditolak cepat), rata-rata {gateway['avg_ms']} ms (max {gateway['max_ms']} ms)\n"
+                              f"Checkout: {checkout_metrics['created']} link baru, {checkout_metrics['reused']} link dipakai ulang",
+                        inline=False)
+        
+        mail = mailer.stats()
+        embed.add_field(name="📧 Email Queue",
+                        value=f"{mail['queued']} antri, {mail['sent']} terkirim ({mail['failed']} gagal, {mail['retried']} retry) - "
+                              f"{mail['sessions_open']} sesi SMTP terbuka, {mail['connects']} login, kirim rata-rata {mail['avg_send_ms']} ms",
+                        inline=False)
+        
+        roles = role_service.stats()
+        batch_text = "\n".join(f"{name}: {b['runs']}x, {b['members']} member ({b['failed']} gagal), terakhir {b['last_ms']} ms (max {b['max_ms']} ms)"
+                               for name, b in roles['batches'].items()) or "belum ada batch"
+        embed.add_field(name="🎭 Roles",
+                        value=f"Index {roles['index']['roles']} role - {roles['index']['hits']} hits, {roles['index']['rebuilds']} rebuild\n{batch_text}",
+                        inline=False)
+        
+        codes = code_registry.stats()
+        embed.add_field(name="🎟️ Code Registry",
+                        value=f"{codes['codes']['discount']} diskon, {codes['codes']['referral']} referral, {codes['codes']['trial']} trial - "
+                              f"{codes['hit_rate']}% dari memory ({codes['negative_hits']} negative hits, {codes['misses']} DB lookups)",
+                        inline=False)
+        
         embed.add_field(name="📅 Update Time", value=format_jakarta_datetime(get_jakarta_datetime()), inline=False)
         
         await interaction.followup.send(embed=embed, ephemeral=True)
@@ -3020,6 +2642,47 @@ async def bot_stats_command(interaction: discord.Interaction):
         await interaction.followup.send(f"❌ Error: {str(e)}", ephemeral=True)
 
 
+@tree.command(name="db_stats", description="[Admin] Statistik query database - latency, calls, slow query")
+@discord.app_commands.describe(urutkan="total_ms (default), avg_ms, max_ms, calls, atau rows", reset="Reset statistik setelah ditampilkan")
+@discord.app_commands.default_permissions(administrator=False)
+async def db_stats_command(interaction: discord.Interaction, urutkan: str = "total_ms", reset: bool = False):
+    # Admin, guild owner, dan Orion saja yang bisa akses
+    is_orion = interaction.user.name.lower() == "orion" or str(interaction.user.id) == "orion"
+    if not (interaction.user.guild_permissions.administrator or interaction.user.id == interaction.guild.owner_id or is_orion):
+        await interaction.response.send_message(
+            "❌ Command ini hanya untuk **Admin**, **Guild Owner**, atau **Orion**!", 
+            ephemeral=True)
+        return
+    
+    if urutkan not in ("total_ms", "avg_ms", "max_ms", "calls", "rows"):
+        await interaction.response.send_message("❌ Urutan harus salah satu dari: total_ms, avg_ms, max_ms, calls, rows", ephemeral=True)
+        return
+    
+    stats = Database.query_stats(limit=10, order_by=urutkan)
+    embed = discord.Embed(
+        title="🗄️ DATABASE QUERY STATS",
+        description=f"Top {len(stats)} statement (urut: **{urutkan}**) • slow log > {DB_SLOW_QUERY_MS:.0f} ms",
+        color=0xf7931a
+    )
+    for i, row in enumerate(stats, 1):
+        sql = row['sql'] if len(row['sql']) <= 180 else row['sql'][:177] + "..."
+        embed.add_field(
+            name=f"#{i} • {row['calls']} calls • total {row['total_ms']:.0f} ms",
+            value=(f"```sql\n{sql}\n```"
+                   f"avg {row['avg_ms']} ms • p95 ≤{row['p95_ms']} ms • max {row['max_ms']} ms • "
+                   f"rows {row['rows']} • errors {row['errors']}"),
+            inline=False
+        )
+    if not stats:
+        embed.add_field(name="ℹ️ Kosong", value="Belum ada query yang tercatat", inline=False)
+    embed.set_footer(text=f"Generated: {format_jakarta_datetime(get_jakarta_datetime())}")
+    
+    if reset:
+        Database.reset_query_stats()
+    
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+
 class CreatePackageModal(discord.ui.Modal, title="➕ Buat Paket Baru"):
     package_id = discord.ui.TextInput(label="ID Paket", placeholder="Contoh: warrior_custom", required=True, max_length=20)
     package_name = discord.ui.TextInput(label="Nama Paket", placeholder="Contoh: The Warrior Premium", required=True, max_length=50)
@@ -3049,12 +2712,7 @@ class CreatePackageModal(discord.ui.Modal, title="➕ Buat Paket Baru"):
                 return
             
             # Check if package already exists
-            conn = Database.connect()
-            c = conn.cursor()
-            
-            c.execute('SELECT package_id FROM packages WHERE package_id = ?', (pkg_id,))
-            if c.fetchone():
-                conn.close()
+            if await Database.aexecute('SELECT package_id FROM packages WHERE package_id = ?', (pkg_id,), fetch_one=True, commit=False):
                 await interaction.followup.send(f"❌ Paket dengan ID `{pkg_id}` sudah ada!", ephemeral=True)
                 return
             
@@ -3062,12 +2720,10 @@ class CreatePackageModal(discord.ui.Modal, title="➕ Buat Paket Baru"):
             duration_text = f"{pkg_duration} hari"
             created_at = get_jakarta_datetime().strftime('%Y-%m-%d %H:%M:%S')
             
-            c.execute('''INSERT INTO packages (package_id, package_name, price, duration_days, duration_text, role_name, created_at, created_by)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
-                     (pkg_id, pkg_name, pkg_price, pkg_duration, duration_text, WARRIOR_ROLE_NAME, created_at, interaction.user.name))
-            
-            conn.commit()
-            conn.close()
+            await Database.aexecute('''INSERT INTO packages (package_id, package_name, price, duration_days, duration_text, role_name, created_at, created_by)
+                                     VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                                    (pkg_id, pkg_name, pkg_price, pkg_duration, duration_text, WARRIOR_ROLE_NAME, created_at, interaction.user.name))
+            await Database.arun(package_catalog.invalidate)
             
             embed = discord.Embed(
                 title="✅ PAKET BERHASIL DITAMBAH",
@@ -3116,14 +2772,10 @@ class DeletePackageView(discord.ui.View):
         
         try:
             # Check if package is used in any subscription
-            conn = Database.connect()
-            c = conn.cursor()
-            
-            c.execute('SELECT COUNT(*) FROM subscriptions WHERE package_type = ?', (selected_id,))
-            usage_count = c.fetchone()[0]
+            usage_count = (await Database.aexecute('SELECT COUNT(*) FROM subscriptions WHERE package_type = ?', (selected_id,),
+                                                   fetch_one=True, commit=False))[0]
             
             if usage_count > 0:
-                conn.close()
                 embed = discord.Embed(
                     title="❌ TIDAK BISA MENGHAPUS",
                     color=0xff6b6b
@@ -3135,9 +2787,8 @@ class DeletePackageView(discord.ui.View):
                 return
             
             # Delete from database
-            c.execute('DELETE FROM packages WHERE package_id = ?', (selected_id,))
-            conn.commit()
-            conn.close()
+            await Database.aexecute('DELETE FROM packages WHERE package_id = ?', (selected_id,))
+            await Database.arun(package_catalog.invalidate)
             
             embed = discord.Embed(
                 title="✅ PAKET BERHASIL DIHAPUS",
@@ -3233,32 +2884,15 @@ class CreateDiscountModal(discord.ui.Modal, title="💰 Create Discount Code"):
                 await interaction.followup.send("❌ Max uses tidak boleh negatif!", ephemeral=True)
                 return
             
-            conn = Database.connect()
-            c = conn.cursor()
-            
-            # Create discount code table if not exists
-            c.execute('''CREATE TABLE IF NOT EXISTS discount_codes (
-                code TEXT PRIMARY KEY,
-                discount_percent INTEGER,
-                validity_days INTEGER DEFAULT 1,
-                max_uses INTEGER,
-                used_count INTEGER DEFAULT 0,
-                created_at TEXT,
-                code_expiry_date TEXT,
-                created_by TEXT
-            )''')
-            
             created_at = get_jakarta_datetime().strftime('%Y-%m-%d %H:%M:%S')
             code_expiry = (get_jakarta_datetime() + timedelta(days=validity_days)).strftime('%Y-%m-%d %H:%M:%S')
             creator = interaction.user.name
             
-            c.execute('''INSERT OR REPLACE INTO discount_codes 
-                        (code, discount_percent, validity_days, max_uses, created_at, code_expiry_date, created_by)
-                        VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                     (code_val, discount_percent, validity_days, max_uses, created_at, code_expiry, creator))
-            
-            conn.commit()
-            conn.close()
+            await Database.aexecute('''INSERT OR REPLACE INTO discount_codes 
+                                     (code, discount_percent, validity_days, max_uses, created_at, code_expiry_date, created_by)
+                                     VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                                    (code_val, discount_percent, validity_days, max_uses, created_at, code_expiry, creator))
+            await Database.arun(code_registry.invalidate, 'discount', code_val)
             
             embed = discord.Embed(
                 title="✅ DISKON CODE DIBUAT",
@@ -3304,8 +2938,8 @@ async def referral_link_command(interaction: discord.Interaction):
         return
     
     # Check if user has "Analyst" or "Analyst's Lead" role
-    analyst_role = discord.utils.get(guild.roles, name=ANALYST_ROLE_NAME)
-    analyst_lead_role = discord.utils.get(guild.roles, name=ANALYST_LEAD_ROLE_NAME)
+    analyst_role = role_service.get(guild, ANALYST_ROLE_NAME)
+    analyst_lead_role = role_service.get(guild, ANALYST_LEAD_ROLE_NAME)
     
     has_analyst_role = (analyst_role and analyst_role in member.roles) or (analyst_lead_role and analyst_lead_role in member.roles)
     is_admin = interaction.user.guild_permissions.administrator or interaction.user.id == guild.owner_id
@@ -3331,41 +2965,37 @@ async def referral_link_command(interaction: discord.Interaction):
         analyst_id = str(interaction.user.id)
         analyst_name = interaction.user.name
         
-        # Use timeout untuk prevent hanging
-        await asyncio.sleep(0)  # Yield control
-        
-        conn = Database.connect()
-        c = conn.cursor()
-        
-        # Check if analyst referral code exists
-        c.execute('SELECT code FROM referral_codes WHERE created_by = ?', (analyst_id,))
-        existing_code = c.fetchone()
-        
-        if existing_code:
-            ref_code = existing_code[0]
-        else:
-            # Generate unique referral code
-            ref_code = f"REF{analyst_name[:3].upper()}{random.randint(1000, 9999)}"
+        def referral_stats(tx):
+            new_code = False
+            # Check if analyst referral code exists
+            existing_code = tx.fetchone('SELECT code FROM referral_codes WHERE created_by = ?', (analyst_id,))
             
-            c.execute('''INSERT INTO referral_codes (code, created_by, uses)
-                        VALUES (?, ?, ?)''',
-                     (ref_code, analyst_id, 0))
-            conn.commit()
-        
-        # Get referral stats
-        c.execute('SELECT uses FROM referral_codes WHERE code = ?', (ref_code,))
-        ref_row = c.fetchone()
-        uses = ref_row[0] if ref_row else 0
-        
-        c.execute('SELECT COUNT(*) FROM commissions WHERE analyst_id = ? AND status = "pending"', (analyst_id,))
-        pending_row = c.fetchone()
-        pending_commission = pending_row[0] if pending_row else 0
+            if existing_code:
+                ref_code = existing_code[0]
+            else:
+                # Generate unique referral code
+                ref_code = f"REF{analyst_name[:3].upper()}{random.randint(1000, 9999)}"
+                new_code = True
+                
+                tx.execute('''INSERT INTO referral_codes (code, created_by, uses, analyst_id, analyst_name)
+                              VALUES (?, ?, ?, ?, ?)''',
+                           (ref_code, analyst_id, 0, analyst_id, analyst_name))
+            
+            # Get referral stats
+            ref_row = tx.fetchone('SELECT uses FROM referral_codes WHERE code = ?', (ref_code,))
+            uses = ref_row[0] if ref_row else 0
+            
+            pending_row = tx.fetchone('SELECT COUNT(*) FROM commissions WHERE analyst_id = ? AND status = "pending"', (analyst_id,))
+            pending_commission = pending_row[0] if pending_row else 0
+            
+            total_row = tx.fetchone('SELECT SUM(commission_amount) FROM commissions WHERE analyst_id = ? AND status = "completed"', (analyst_id,))
+            total_earned = (total_row[0] or 0) if total_row else 0
+            return ref_code, new_code, uses, pending_commission, total_earned
         
-        c.execute('SELECT SUM(commission_amount) FROM commissions WHERE analyst_id = ? AND status = "completed"', (analyst_id,))
-        total_row = c.fetchone()
-        total_earned = (total_row[0] or 0) if total_row else 0
+        ref_code, new_code, uses, pending_commission, total_earned = await Database.awrite_transaction(referral_stats)
         
-        conn.close()
+        if new_code:
+            await Database.arun(code_registry.invalidate, 'referral', ref_code)
         
         embed = discord.Embed(
             title="🔗 REFERRAL LINK ANDA",
@@ -3478,20 +3108,15 @@ class CreateTrialCodeModal(discord.ui.Modal, title="🎫 Create Trial Code"):
             
             trial_code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
             
-            conn = Database.connect()
-            c = conn.cursor()
-            
             created_at = get_jakarta_datetime().strftime('%Y-%m-%d %H:%M:%S')
             creator = interaction.user.name
             code_expiry = (get_jakarta_datetime() + timedelta(days=validity_days)).strftime('%Y-%m-%d %H:%M:%S')
             
-            c.execute('''INSERT INTO trial_members 
-                        (trial_code, status, created_at, created_by, duration_days, validity_days, code_expiry_date, max_uses)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
-                     (trial_code, 'pending', created_at, creator, duration_days, validity_days, code_expiry, max_uses))
-            
-            conn.commit()
-            conn.close()
+            await Database.aexecute('''INSERT INTO trial_members 
+                                     (trial_code, status, created_at, created_by, duration_days, validity_days, code_expiry_date, max_uses)
+                                     VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                                    (trial_code, 'pending', created_at, creator, duration_days, validity_days, code_expiry, max_uses))
+            await Database.arun(code_registry.invalidate, 'trial', trial_code)
             
             embed = discord.Embed(
                 title="🎫 TRIAL CODE GENERATED",
@@ -3543,8 +3168,8 @@ async def kick_member_command(interaction: discord.Interaction):
     warrior_members = []
     trial_members = []
     
-    warrior_role = discord.utils.get(guild.roles, name=WARRIOR_ROLE_NAME)
-    trial_role = discord.utils.get(guild.roles, name=TRIAL_MEMBER_ROLE_NAME)
+    warrior_role = role_service.get(guild, WARRIOR_ROLE_NAME)
+    trial_role = role_service.get(guild, TRIAL_MEMBER_ROLE_NAME)
     
     if warrior_role:
         warrior_members = [m for m in warrior_role.members]
@@ -3609,7 +3234,7 @@ async def kick_member_command(interaction: discord.Interaction):
                                 kick_embed.set_footer(text="Diary Crypto Payment Bot • Real Time WIB")
                                 kick_embed.set_thumbnail(url=member.avatar.url if member.avatar else "")
                                 
-                                await member.send(embed=kick_embed)
+                                dm_dispatcher.send(member, PRIORITY_NOTICE, embed=kick_embed)
                             except:
                                 pass
                             
@@ -3692,39 +3317,41 @@ class TutupBukuModal(discord.ui.Modal, title="📊 TUTUP BUKU PERIODE"):
             else:
                 end_date = f"{tahun:04d}-{bulan+1:02d}-01"
             
+            period = (to_db_timestamp(start_date), to_db_timestamp(end_date))
+            
             # Revenue
-            c.execute('SELECT SUM(price) FROM pending_orders WHERE status = "settlement" AND CAST(created_at AS DATE) >= CAST(? AS DATE) AND CAST(created_at AS DATE) < CAST(? AS DATE)', (start_date, end_date))
+            c.execute('SELECT SUM(price) FROM pending_orders WHERE status = "settlement" AND created_at >= ? AND created_at < ?', period)
             total_revenue = c.fetchone()[0] or 0
             
             # Transactions
-            c.execute('SELECT COUNT(*) FROM pending_orders WHERE status = "settlement" AND CAST(created_at AS DATE) >= CAST(? AS DATE) AND CAST(created_at AS DATE) < CAST(? AS DATE)', (start_date, end_date))
+            c.execute('SELECT COUNT(*) FROM pending_orders WHERE status = "settlement" AND created_at >= ? AND created_at < ?', period)
             total_transactions = c.fetchone()[0] or 0
             
             # Active members in period
-            c.execute('SELECT COUNT(DISTINCT discord_id) FROM subscriptions WHERE CAST(start_date AS DATE) >= CAST(? AS DATE) AND CAST(start_date AS DATE) < CAST(? AS DATE)', (start_date, end_date))
+            # start_date masih TEXT 'YYYY-MM-DD HH:MM:SS' - perbandingan string tetap urut tanggal
+            c.execute('SELECT COUNT(DISTINCT discord_id) FROM subscriptions WHERE start_date >= ? AND start_date < ?', (start_date, end_date))
             total_members = c.fetchone()[0] or 0
             
             # Get detailed data
             c.execute('''SELECT s.discord_username, s.nama, s.package_type, po.price, po.created_at
                         FROM pending_orders po
                         LEFT JOIN subscriptions s ON po.order_id = s.order_id
-                        WHERE po.status = "settlement" AND CAST(po.created_at AS DATE) >= CAST(? AS DATE) AND CAST(po.created_at AS DATE) < CAST(? AS DATE)
-                        ORDER BY po.created_at DESC''', (start_date, end_date))
+                        WHERE po.status = "settlement" AND po.created_at >= ? AND po.created_at < ?
+                        ORDER BY po.created_at DESC''', period)
             transactions = c.fetchall()
             
             # Referral breakdown
             c.execute('''SELECT c.analyst_id, COUNT(*) as count, SUM(c.commission_amount) as total_commission
                         FROM commissions c
-                        WHERE CAST(c.earned_date AS DATE) >= CAST(? AS DATE) AND CAST(c.earned_date AS DATE) < CAST(? AS DATE)
-                        GROUP BY c.analyst_id''', (start_date, end_date))
+                        WHERE c.earned_date >= ? AND c.earned_date < ?
+                        GROUP BY c.analyst_id''', period)
             referrals = c.fetchall()
+            conn.close()
             
             # Save closed period
-            c.execute('''INSERT INTO closed_periods (year_month, total_revenue, total_members, total_transactions, closed_by)
-                        VALUES (?, ?, ?, ?, ?)''',
-                     (year_month, total_revenue, total_members, total_transactions, interaction.user.name))
-            conn.commit()
-            conn.close()
+            await Database.aexecute('''INSERT INTO closed_periods (year_month, total_revenue, total_members, total_transactions, closed_by)
+                                     VALUES (?, ?, ?, ?, ?)''',
+                                    (year_month, total_revenue, total_members, total_transactions, interaction.user.name))
             
             # Create Excel export untuk accounting team
             try:
@@ -3794,7 +3421,7 @@ class TutupBukuModal(discord.ui.Modal, title="📊 TUTUP BUKU PERIODE"):
                 ws_trans.cell(row=row_idx, column=2, value=trans[1] or "N/A")
                 ws_trans.cell(row=row_idx, column=3, value=trans[2] or "N/A")
                 ws_trans.cell(row=row_idx, column=4, value=int(trans[3]) if trans[3] else 0)
-                ws_trans.cell(row=row_idx, column=5, value=trans[4] or "N/A")
+                ws_trans.cell(row=row_idx, column=5, value=format_db_timestamp(trans[4]) or "N/A")
             
             ws_trans.column_dimensions['A'].width = 15
             ws_trans.column_dimensions['B'].width = 20
@@ -3886,140 +3513,15 @@ async def on_app_command_error(interaction: discord.Interaction, error: discord.
 # ============ FLASK ROUTES ============
 @app.route('/')
 def home():
-    return '''
-    <html>
-        <head><title>Diary Crypto Payment Bot</title></head>
-        <body style="font-family: Arial; text-align: center; padding: 50px;">
-            <h1>🤖 Diary Crypto Payment Bot - Running</h1>
-            <p>Bot Status: <b>ONLINE ✅</b></p>
-            <p>Discord Guild: Diary Crypto</p>
-            <p>Payment Gateway: Midtrans SANDBOX</p>
-        </body>
-    </html>
-    '''
-
-
-def delete_pending_order(order_id):
-    """Delete pending order after successful payment"""
-    try:
-        conn = Database.connect()
-        c = conn.cursor()
-        c.execute('DELETE FROM pending_orders WHERE order_id = ?', (order_id,))
-        conn.commit()
-        conn.close()
-        print(f"✅ Pending order deleted: {order_id}")
-        return True
-    except Exception as e:
-        print(f"⚠️ Error deleting pending order: {e}")
-        return False
+    return HOME_PAGE
+
 
 @app.route('/webhook/midtrans', methods=['POST'])
 def midtrans_webhook():
-    try:
-        data = request.get_json()
-        order_id = data.get('order_id')
-        transaction_status = data.get('transaction_status')
-        
-        print(f"🔔 Webhook received: Order {order_id} - Status {transaction_status}")
-        
-        # Handle both 'settlement' dan 'capture' status (payment successful)
-        if transaction_status in ['settlement', 'capture', 'accept_partial_credit']:
-            pending = get_pending_order(order_id)
-            print(f"📋 Pending order lookup result: {pending}")
-            
-            if pending:
-                order_id_db, discord_id, discord_username, nama, email, package_type, payment_url, status, created_at = pending
-                print(f"✅ Found pending order - Discord ID: {discord_id}, Package: {package_type}")
-                
-                save_subscription(order_id, discord_id, discord_username, nama, email, package_type)
-                print(f"✅ Subscription activated for {nama}")
-                
-                # Assign role dan send notifications
-                try:
-                    packages = get_all_packages()
-                    pkg = packages.get(package_type)
-                    pkg_name = pkg['name'] if pkg else package_type
-                    
-                    # Get subscription dates
-                    conn = Database.connect()
-                    c = conn.cursor()
-                    c.execute('SELECT start_date, end_date FROM subscriptions WHERE order_id = ?', (order_id,))
-                    sub_data = c.fetchone()
-                    conn.close()
-                    
-                    if sub_data:
-                        start_date, end_date = sub_data
-                        
-                        # Get user from Discord
-                        guild = bot.get_guild(GUILD_ID)
-                        print(f"📌 Guild lookup: {guild}")
-                        
-                        if guild:
-                            member = guild.get_member(int(discord_id))
-                            print(f"👤 Member lookup for ID {discord_id}: {member}")
-                            
-                            if member:
-                                member_avatar = str(member.avatar.url) if member.avatar else str(member.default_avatar)
-                                warrior_role = discord.utils.get(guild.roles, name=WARRIOR_ROLE_NAME)
-                                
-                                # 1. ASSIGN ROLE
-                                if warrior_role:
-                                    try:
-                                        asyncio.run_coroutine_threadsafe(
-                                            member.add_roles(warrior_role),
-                                            bot.loop
-                                        )
-                                        print(f"✅ Role '{WARRIOR_ROLE_NAME}' assigned to {nama}")
-                                    except Exception as e:
-                                        print(f"⚠️ Error assigning role: {e}")
-                                else:
-                                    print(f"❌ Role '{WARRIOR_ROLE_NAME}' not found in guild")
-                                
-                                # 2. Send welcome email
-                                send_welcome_email(nama, email, pkg_name, order_id, start_date, end_date, "", member_avatar)
-                                
-                                # 3. Send DM with EMBED (matching /buy checkout format)
-                                try:
-                                    dm_embed = discord.Embed(
-                                        title="✅ SELAMAT DATANG DI THE WARRIOR!",
-                                        description="Membership Anda berhasil diaktifkan!",
-                                        color=0xf7931a
-                                    )
-                                    dm_embed.set_thumbnail(url=member_avatar)
-                                    dm_embed.add_field(name="📦 Paket", value=f"**{pkg_name}**", inline=True)
-                                    dm_embed.add_field(name="📋 Order ID", value=f"`{order_id}`", inline=True)
-                                    dm_embed.add_field(name="📅 Mulai", value=start_date, inline=True)
-                                    dm_embed.add_field(name="⏰ Berakhir", value=end_date, inline=True)
-                                    dm_embed.add_field(name="🎯 Info", value="Nikmati akses eksklusif ke The Warrior!", inline=False)
-                                    dm_embed.set_footer(text="Diary Crypto Payment Bot • Terima kasih!")
-                                    
-                                    asyncio.run_coroutine_threadsafe(
-                                        member.send(embed=dm_embed),
-                                        bot.loop
-                                    )
-                                    print(f"✅ Welcome embed sent to {nama}")
-                                except Exception as e:
-                                    print(f"⚠️ Could not send DM to {nama}: {e}")
-                                
-                                # 4. Send admin notification
-                                send_admin_new_member_notification(nama, order_id, pkg_name, email)
-                                
-                                # 5. DELETE PENDING ORDER IMMEDIATELY - Jadi tidak dapat notif "ORDER KADALUARSA" nanti
-                                delete_pending_order(order_id)
-                                print(f"✅ Pending order automatically deleted after payment success")
-                                
-                except Exception as e:
-                    print(f"⚠️ Error processing webhook: {e}")
-                    # Still delete pending order even if notifications failed
-                    delete_pending_order(order_id)
-            
-            else:
-                print(f"⚠️ Pending order NOT found for {order_id} - might be already processed or expired")
-        
-        return {'status': 'ok'}, 200
-    except Exception as e:
-        print(f"❌ Webhook error: {e}")
-        return {'status': 'error'}, 500
+    started = time.perf_counter()
+    data = request.get_json(silent=True)
+    print(f"🔔 Webhook received: Order {(data or {}).get('order_id')} - Status {(data or {}).get('transaction_status')}")
+    return webhook_ingest.accept(data, started)
 
 
 # ============ MAIN ============
@@ -4029,12 +3531,13 @@ if __name__ == '__main__':
     print("📧 Gmail Sender: ✅ SET" if GMAIL_SENDER else "📧 Gmail Sender: ❌ NOT SET")
     print("📧 Admin Email: ✅ SET" if ADMIN_EMAIL else "📧 Admin Email: ❌ NOT SET")
     
-    # Flask app
-    def run_flask():
-        app.run(host='0.0.0.0', port=5000, debug=False, use_reloader=False, threaded=True)
-    
-    flask_thread = threading.Thread(target=run_flask, daemon=True)
-    flask_thread.start()
+    # Flask app (default) - WEBHOOK_SERVER=aiohttp menjalankan webhook di loop bot saat on_ready
+    if WEBHOOK_SERVER != 'aiohttp':
+        def run_flask():
+            app.run(host=WEBHOOK_HOST, port=WEBHOOK_PORT, debug=False, use_reloader=False, threaded=True)
+        
+        flask_thread = threading.Thread(target=run_flask, daemon=True)
+        flask_thread.start()
     
     print(f"🚀 Starting Discord bot...")
     print(f"🌐 Webhook URL untuk Midtrans: https://{os.getenv('REPLIT_PROJECT_DOMAIN', 'localhost')}/webhook/midtrans")
@@ -4063,3 +3566,8 @@ if __name__ == '__main__':
             else:
                 print("❌ Max retries reached. Bot stopped.")
                 break
+    
+    # Email yang masih di antrian dikirim dulu sebelum proses berhenti
+    mailer.stop()
+    # Lepas lease supaya replica lain langsung ambil alih (tanpa menunggu lease kadaluarsa)
+    leader.release()
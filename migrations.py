@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+"""
+Versioned schema migrations (SQLite & PostgreSQL)
+Usage: python3 migrations.py [--dry-run]
+
+Setiap migration punya nomor versi; yang sudah jalan dicatat di tabel schema_version,
+jadi init_db() cukup memanggil run_migrations() di setiap startup.
+"""
+import argparse
+import time
+from datetime import datetime
+
+from db_handler import Database
+
+MIGRATION_LOCK_KEY = 7270001  # pg_advisory_xact_lock - cegah 2 replica migrate bersamaan
+
+
+def _id_column(dialect):
+    return 'SERIAL PRIMARY KEY' if dialect == 'postgres' else 'INTEGER PRIMARY KEY AUTOINCREMENT'
+
+
+# ============ MIGRATIONS ============
+# Tiap migration: build(dialect, columns_of) -> list SQL. columns_of(table) -> {kolom: tipe} yang ada
+# sekarang (kosong kalau tabel belum ada), jadi plan bisa dihitung tanpa mengubah apa pun (dry-run).
+
+def _baseline_tables(dialect, columns_of):
+    id_col = _id_column(dialect)
+    return [
+        '''CREATE TABLE IF NOT EXISTS subscriptions (
+            order_id TEXT PRIMARY KEY,
+            discord_id TEXT NOT NULL,
+            discord_username TEXT,
+            nama TEXT,
+            email TEXT,
+            package_type TEXT,
+            payment_method TEXT,
+            status TEXT DEFAULT 'pending',
+            start_date TEXT,
+            end_date TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            referral_code TEXT,
+            referrer_id TEXT,
+            expiry_reminder_count INTEGER DEFAULT 0
+        )''',
+        '''CREATE TABLE IF NOT EXISTS pending_orders (
+            order_id TEXT PRIMARY KEY,
+            discord_id TEXT,
+            discord_username TEXT,
+            nama TEXT,
+            email TEXT,
+            package_type TEXT,
+            price REAL DEFAULT 0,
+            payment_url TEXT,
+            status TEXT DEFAULT 'pending',
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )''',
+        f'''CREATE TABLE IF NOT EXISTS trial_members (
+            id {id_col},
+            trial_code TEXT UNIQUE,
+            discord_id TEXT,
+            discord_username TEXT,
+            email TEXT,
+            username TEXT,
+            trial_started TEXT,
+            trial_end TEXT,
+            status TEXT,
+            created_at TEXT,
+            created_by TEXT,
+            duration_days INTEGER DEFAULT 1,
+            validity_days INTEGER DEFAULT 1,
+            code_expiry_date TEXT,
+            max_uses INTEGER DEFAULT 1,
+            used_count INTEGER DEFAULT 0
+        )''',
+        '''CREATE TABLE IF NOT EXISTS referral_codes (
+            code TEXT PRIMARY KEY,
+            created_by TEXT,
+            created_date TEXT DEFAULT CURRENT_TIMESTAMP,
+            uses INTEGER DEFAULT 0,
+            max_uses INTEGER,
+            analyst_id TEXT,
+            analyst_name TEXT,
+            commission_percent INTEGER DEFAULT 30
+        )''',
+        f'''CREATE TABLE IF NOT EXISTS commissions (
+            id {id_col},
+            order_id TEXT,
+            analyst_id TEXT,
+            analyst_name TEXT,
+            referred_member_id TEXT,
+            commission_amount REAL,
+            package_type TEXT,
+            earned_date TEXT DEFAULT CURRENT_TIMESTAMP,
+            created_at TEXT,
+            status TEXT DEFAULT 'pending'
+        )''',
+        '''CREATE TABLE IF NOT EXISTS discount_codes (
+            code TEXT PRIMARY KEY,
+            discount_percent INTEGER,
+            validity_days INTEGER DEFAULT 1,
+            max_uses INTEGER,
+            used_count INTEGER DEFAULT 0,
+            created_at TEXT,
+            code_expiry_date TEXT,
+            created_by TEXT
+        )''',
+        '''CREATE TABLE IF NOT EXISTS packages (
+            package_id TEXT PRIMARY KEY,
+            package_name TEXT,
+            price REAL,
+            duration_days REAL,
+            duration_text TEXT,
+            role_name TEXT DEFAULT 'The Warrior',
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            created_by TEXT
+        )''',
+        f'''CREATE TABLE IF NOT EXISTS closed_periods (
+            id {id_col},
+            year_month TEXT UNIQUE,
+            total_revenue REAL,
+            total_members INTEGER,
+            total_transactions INTEGER,
+            closed_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            closed_by TEXT
+        )''',
+        '''CREATE TABLE IF NOT EXISTS renewals (
+            order_id TEXT PRIMARY KEY,
+            discord_id TEXT,
+            discord_username TEXT,
+            package_type TEXT,
+            old_end_date TEXT,
+            new_end_date TEXT,
+            renewal_price REAL,
+            discount_applied TEXT,
+            referral_applied TEXT,
+            status TEXT DEFAULT 'pending',
+            created_at TEXT
+        )''',
+    ]
+
+
+# Kolom yang dipakai kode tapi belum ada di database lama (dulu ditambal try/except ALTER TABLE)
+RECONCILE_COLUMNS = {
+    'subscriptions': [('expiry_reminder_count', "INTEGER DEFAULT 0")],
+    'referral_codes': [('analyst_id', 'TEXT'), ('analyst_name', 'TEXT'),
+                       ('commission_percent', 'INTEGER DEFAULT 30')],
+    'commissions': [('order_id', 'TEXT'), ('analyst_name', 'TEXT'), ('created_at', 'TEXT'),
+                    ('status', "TEXT DEFAULT 'pending'")],
+    'discount_codes': [('validity_days', 'INTEGER DEFAULT 1'), ('code_expiry_date', 'TEXT'),
+                       ('created_by', 'TEXT')],
+    'renewals': [('discord_username', 'TEXT'), ('package_type', 'TEXT'), ('renewal_price', 'REAL'),
+                 ('discount_applied', 'TEXT'), ('referral_applied', 'TEXT'),
+                 ('status', "TEXT DEFAULT 'pending'")],
+}
+
+
+def _reconcile_columns(dialect, columns_of):
+    steps = []
+    for table, wanted in RECONCILE_COLUMNS.items():
+        existing = columns_of(table)
+        if not existing:
+            continue  # tabel baru dibuat lengkap oleh baseline
+        for column, ddl in wanted:
+            if column not in existing:
+                steps.append(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}')
+    # Referral code lama hanya menyimpan analyst di created_by
+    if 'created_by' in columns_of('referral_codes'):
+        steps.append('UPDATE referral_codes SET analyst_id = created_by WHERE analyst_id IS NULL')
+    return steps
+
+
+# Partial index (WHERE ...) didukung SQLite >= 3.8 dan PostgreSQL
+HOT_PATH_INDEXES = {
+    'idx_subscriptions_status_end_date': 'ON subscriptions (status, end_date)',
+    'idx_subscriptions_active_end_date': "ON subscriptions (end_date) WHERE status = 'active'",
+    'idx_subscriptions_discord_status': 'ON subscriptions (discord_id, status)',
+    'idx_pending_orders_status_created': 'ON pending_orders (status, created_at)',
+    'idx_trial_members_status_trial_end': 'ON trial_members (status, trial_end)',
+    'idx_trial_members_active_trial_end': "ON trial_members (trial_end) WHERE status = 'active'",
+    'idx_commissions_analyst_status': 'ON commissions (analyst_id, status)',
+}
+
+
+def _create_index(name):
+    return f'CREATE INDEX IF NOT EXISTS {name} {HOT_PATH_INDEXES[name]}'
+
+
+def _hot_path_indexes(dialect, columns_of):
+    return [_create_index(name) for name in HOT_PATH_INDEXES]
+
+
+# (tabel, kolom, nilai lama ditulis dalam WIB?, default baru) - default sama di kedua dialek
+TIMESTAMP_CONVERSIONS = [
+    ('subscriptions', 'end_date', True, False),
+    ('pending_orders', 'created_at', True, True),
+    ('trial_members', 'trial_end', True, False),
+    # earned_date hanya pernah diisi DEFAULT CURRENT_TIMESTAMP (UTC)
+    ('commissions', 'earned_date', False, True),
+]
+SQLITE_NOW_EPOCH = "(CAST(strftime('%s', 'now') AS INTEGER))"
+
+
+def _baseline_columns(dialect, table):
+    """Ordered column definitions of `table` as created by the baseline migration"""
+    prefix = f'CREATE TABLE IF NOT EXISTS {table} ('
+    create = next(sql for sql in _baseline_tables(dialect, None) if sql.startswith(prefix))
+    body = create[len(prefix):create.rindex(')')]
+    return [line.strip().rstrip(',') for line in body.splitlines() if line.strip()]
+
+
+def _postgres_timestamp(table, column, wib, default, data_type):
+    if data_type == 'timestamp with time zone':
+        return []  # sudah dikonversi
+    zone = 'Asia/Jakarta' if wib else 'UTC'
+    if data_type in ('text', 'character varying'):
+        source = f"NULLIF({column}, '')::timestamp AT TIME ZONE '{zone}'"
+    elif data_type == 'timestamp without time zone':
+        source = f"{column} AT TIME ZONE '{zone}'"
+    else:
+        source = f'to_timestamp({column})'  # epoch numerik
+    steps = [f'ALTER TABLE {table} ALTER COLUMN {column} DROP DEFAULT',
+             f'ALTER TABLE {table} ALTER COLUMN {column} TYPE TIMESTAMPTZ USING ({source})']
+    if default:
+        steps.append(f'ALTER TABLE {table} ALTER COLUMN {column} SET DEFAULT now()')
+    return steps
+
+
+def _sqlite_timestamp(table, column, wib, default, existing):
+    """SQLite tidak bisa ALTER COLUMN TYPE: buat tabel baru (urutan kolom baseline, default dipertahankan),
+    salin isinya, lalu ganti nama - prosedur rebuild standar SQLite"""
+    if existing.get(column) == 'INTEGER':
+        return []  # sudah dikonversi
+    definitions, names = [], []
+    for definition in _baseline_columns('sqlite', table):
+        name = definition.split()[0]
+        if name == column:
+            definition = f"{column} INTEGER" + (f" DEFAULT {SQLITE_NOW_EPOCH}" if default else '')
+        definitions.append(definition)
+        names.append(name)
+    # Kolom legacy di luar baseline ikut dipindahkan (di belakang)
+    for name, declared in existing.items():
+        if name not in names:
+            definitions.append(f'{name} {declared}'.strip())
+            names.append(name)
+    copied = [name for name in names if name in existing]
+    modifier = ", '-7 hours'" if wib else ''  # WIB = UTC+7 (tanpa DST)
+    select = [f"CASE WHEN {name} IS NULL OR {name} = '' THEN NULL "
+              f"ELSE CAST(strftime('%s', {name}{modifier}) AS INTEGER) END" if name == column else name
+              for name in copied]
+    rebuilt = f'{table}__rebuild'
+    newline = ',\n    '
+    return [
+        f'CREATE TABLE {rebuilt} (\n    {newline.join(definitions)}\n)',
+        f"INSERT INTO {rebuilt} ({', '.join(copied)}) SELECT {', '.join(select)} FROM {table}",
+        f'DROP TABLE {table}',  # ikut menghapus index tabel ini
+        f'ALTER TABLE {rebuilt} RENAME TO {table}',
+    ] + [_create_index(name) for name, ddl in HOT_PATH_INDEXES.items() if ddl.split()[1] == table]
+
+
+def _native_timestamps(dialect, columns_of):
+    steps = []
+    for table, column, wib, default in TIMESTAMP_CONVERSIONS:
+        existing = columns_of(table)
+        if column not in existing:
+            continue
+        if dialect == 'postgres':
+            steps += _postgres_timestamp(table, column, wib, default, existing[column])
+        else:
+            steps += _sqlite_timestamp(table, column, wib, default, existing)
+    return steps
+
+
+def _leader_leases(dialect, columns_of):
+    # Dipakai leader election di SQLite (PostgreSQL memakai advisory lock), dibuat di keduanya supaya schema sama
+    return ['''CREATE TABLE IF NOT EXISTS leader_leases (
+                name TEXT PRIMARY KEY,
+                holder TEXT NOT NULL,
+                expires_at DOUBLE PRECISION NOT NULL
+            )''']
+
+
+def _outbox(dialect, columns_of):
+    # Epoch DOUBLE PRECISION seperti leader_leases - hanya dibaca worker outbox, tidak perlu kolom timestamp
+    return [f'''CREATE TABLE IF NOT EXISTS outbox (
+                id {_id_column(dialect)},
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at DOUBLE PRECISION NOT NULL,
+                created_at DOUBLE PRECISION NOT NULL,
+                processed_at DOUBLE PRECISION,
+                last_error TEXT
+            )''',
+            "CREATE INDEX IF NOT EXISTS idx_outbox_pending_next ON outbox (next_attempt_at) WHERE status = 'pending'",
+            'CREATE INDEX IF NOT EXISTS idx_outbox_status_processed ON outbox (status, processed_at)']
+
+
+def _webhook_dedup(dialect, columns_of):
+    # PK = kunci idempotensi notifikasi; INSERT kedua untuk kunci yang sama gagal → notifikasi duplikat
+    return ['''CREATE TABLE IF NOT EXISTS webhook_dedup (
+                order_id TEXT NOT NULL,
+                transaction_status TEXT NOT NULL,
+                status_code TEXT NOT NULL,
+                received_at DOUBLE PRECISION NOT NULL,
+                PRIMARY KEY (order_id, transaction_status, status_code)
+            )''',
+            'CREATE INDEX IF NOT EXISTS idx_webhook_dedup_received ON webhook_dedup (received_at)']
+
+
+MIGRATIONS = [
+    (1, 'baseline tables', _baseline_tables),
+    (2, 'reconcile legacy columns', _reconcile_columns),
+    (3, 'hot-path composite & partial indexes', _hot_path_indexes),
+    (4, 'native timestamp columns', _native_timestamps),
+    (5, 'leader election lease table', _leader_leases),
+    (6, 'transactional outbox', _outbox),
+    (7, 'webhook notification dedup', _webhook_dedup),
+]
+
+
+# ============ RUNNER ============
+def _columns(cursor, dialect, table):
+    """{column: declared type} in table order - kosong kalau tabel belum ada"""
+    if dialect == 'postgres':
+        cursor.execute('''SELECT column_name, data_type FROM information_schema.columns
+                          WHERE table_schema = current_schema() AND table_name = ?
+                          ORDER BY ordinal_position''', (table,))
+        return {row[0]: row[1] for row in cursor.fetchall()}
+    cursor.execute(f'PRAGMA table_info({table})')
+    return {row[1]: row[2].upper() for row in cursor.fetchall()}
+
+
+def _applied_versions(cursor, dialect):
+    if not _columns(cursor, dialect, 'schema_version'):
+        return set()
+    cursor.execute('SELECT version FROM schema_version')
+    return {row[0] for row in cursor.fetchall()}
+
+
+def _begin(cursor, dialect):
+    if dialect == 'postgres':
+        cursor.execute('SELECT pg_advisory_xact_lock(?)', (MIGRATION_LOCK_KEY,))
+    else:
+        cursor.execute('BEGIN IMMEDIATE')  # DDL sqlite3 tidak otomatis masuk transaksi
+
+
+def run_migrations(dry_run=False):
+    """Apply pending migrations in version order; dry_run=True hanya print plan"""
+    conn = Database.migration_connect()
+    dialect = Database.dialect(conn)
+    try:
+        c = conn.cursor()
+        columns_of = lambda table: _columns(c, dialect, table)
+
+        if not dry_run:
+            _begin(c, dialect)
+            c.execute('''CREATE TABLE IF NOT EXISTS schema_version (
+                            version INTEGER PRIMARY KEY,
+                            description TEXT,
+                            applied_at TEXT
+                        )''')
+            conn.commit()
+
+        applied = _applied_versions(c, dialect)
+        pending = [m for m in MIGRATIONS if m[0] not in applied]
+        current = max(applied) if applied else 0
+
+        if not pending:
+            print(f"✅ Schema up to date (v{current}, {dialect})")
+            return []
+
+        if dry_run:
+            print(f"📋 Migration plan ({dialect}): v{current} → v{pending[-1][0]}")
+
+        for version, description, build in pending:
+            if dry_run:
+                steps = build(dialect, columns_of)
+                print(f"\n-- v{version}: {description} ({len(steps)} steps)")
+                for sql in steps:
+                    print(f"{sql};")
+                continue
+
+            started = time.perf_counter()
+            _begin(c, dialect)
+            # Replica lain mungkin sudah menjalankan migration ini sambil kita menunggu lock
+            c.execute('SELECT 1 FROM schema_version WHERE version = ?', (version,))
+            if c.fetchone():
+                conn.commit()
+                continue
+
+            steps = build(dialect, columns_of)
+            for sql in steps:
+                c.execute(sql)
+            c.execute('INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)',
+                      (version, description, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+            conn.commit()
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            print(f"✅ Migration v{version}: {description} ({len(steps)} steps, {elapsed_ms:.0f} ms)")
+
+        return [m[0] for m in pending]
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Migration failed: {e}")
+        raise e
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Apply versioned schema migrations')
+    parser.add_argument('--dry-run', action='store_true', help='print the migration plan without applying it')
+    args = parser.parse_args()
+    run_migrations(dry_run=args.dry_run)
@@ -0,0 +1,224 @@
+"""
+Transactional Outbox - side effect (role, DM, email) ditulis sebagai baris outbox di transaksi yang sama
+dengan perubahan datanya, lalu worker mengeksekusinya di bot loop.
+Commit = side effect pasti dijalankan (minimal sekali); rollback = tidak ada side effect sama sekali.
+Baris yang gagal dicoba ulang dengan backoff, setelah OUTBOX_MAX_ATTEMPTS jadi 'dead' (cek last_error).
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import threading
+
+from db_handler import Database, USE_POSTGRES
+
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '50'))  # baris diklaim per putaran
+OUTBOX_CONCURRENCY = int(os.getenv('OUTBOX_CONCURRENCY', '8'))  # handler paralel per batch
+OUTBOX_POLL_SECONDS = float(os.getenv('OUTBOX_POLL_SECONDS', '5'))  # poll kalau tidak ada wakeup
+OUTBOX_CLAIM_SECONDS = float(os.getenv('OUTBOX_CLAIM_SECONDS', '120'))  # baris diklaim worker yang mati muncul lagi setelah ini
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '8'))
+OUTBOX_RETRY_BASE = float(os.getenv('OUTBOX_RETRY_BASE', '10'))  # detik, dikali 2^attempt + jitter
+OUTBOX_RETRY_MAX = float(os.getenv('OUTBOX_RETRY_MAX', '900'))
+OUTBOX_RETENTION_DAYS = float(os.getenv('OUTBOX_RETENTION_DAYS', '7'))  # baris 'done' dihapus setelah ini
+OUTBOX_CHANNEL = 'outbox_ready'  # NOTIFY: webhook di replica mana pun membangunkan worker di leader
+
+# Klaim = geser next_attempt_at ke depan + hitung attempt, jadi worker yang crash tidak menahan baris selamanya.
+# PostgreSQL: SKIP LOCKED supaya dua worker (mis. saat pergantian leader) tidak mengklaim baris yang sama.
+CLAIM_SQL = '''UPDATE outbox SET next_attempt_at = ?, attempts = attempts + 1
+               WHERE id IN (SELECT id FROM outbox WHERE status = 'pending' AND next_attempt_at <= ?
+                            ORDER BY id LIMIT ?{lock})
+               RETURNING id, kind, payload, attempts, created_at'''.format(lock=' FOR UPDATE SKIP LOCKED' if USE_POSTGRES else '')
+INSERT_SQL = '''INSERT INTO outbox (kind, payload, status, attempts, next_attempt_at, created_at)
+                VALUES (?, ?, 'pending', 0, ?, ?)'''
+
+
+def _log_notify_error(task):
+    if not task.cancelled() and task.exception() is not None:
+        print(f"⚠️ Outbox notify failed: {task.exception()}")
+
+
+class Outbox:
+    """enqueue(tx, kind, payload) di dalam transaksi; run() adalah worker tunggal yang men-drain outbox
+
+    Handler: async fn(payload dict). Return = selesai, raise = dicoba ulang dengan backoff.
+    """
+
+    def __init__(self, batch_size=OUTBOX_BATCH_SIZE, concurrency=OUTBOX_CONCURRENCY,
+                 poll_interval=OUTBOX_POLL_SECONDS, max_attempts=OUTBOX_MAX_ATTEMPTS):
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+        self.poll_interval = poll_interval
+        self.max_attempts = max(1, max_attempts)
+        self._handlers = {}  # kind -> async handler(payload)
+        self._cleanups = []  # sync fn() dijalankan bersama purge (retensi tabel lain)
+        self._lock = threading.Lock()  # enqueue() dipanggil dari thread Flask
+        self._loop = None
+        self._wake = None
+        self._shared = False
+        self.active = False
+        self.enqueued = 0
+        self.done = 0
+        self.retried = 0
+        self.dead = 0
+        self.batches = 0
+        self._lag_total = 0.0
+        self.max_lag = 0.0
+
+    def register(self, kind, handler):
+        self._handlers[kind] = handler
+
+    def register_cleanup(self, cleanup):
+        """cleanup: blocking fn() run hourly on the worker's replica (mis. hapus dedup lama)"""
+        self._cleanups.append(cleanup)
+
+    def enqueue(self, tx, kind, payload):
+        """Buffer an outbox row in tx - committed (or rolled back) together with the business write"""
+        now = time.time()
+        tx.defer(INSERT_SQL, (kind, json.dumps(payload), now, now))
+        with self._lock:
+            self.enqueued += 1
+
+    def share(self):
+        """PostgreSQL: wakeup() dari replica lain sampai ke worker di leader (False di SQLite)"""
+        self._shared = Database.listen(OUTBOX_CHANNEL, self._on_notify)
+        return self._shared
+
+    def _on_notify(self, payload):
+        self._wake_local()
+
+    def _wake_local(self):
+        loop, wake = self._loop, self._wake
+        if loop is not None and wake is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(wake.set)
+
+    def wakeup(self):
+        """Call after commit - worker langsung drain tanpa menunggu poll berikutnya (thread-safe)"""
+        if self.active:
+            self._wake_local()
+            return
+        if not self._shared:
+            return  # SQLite: poll berikutnya di worker proses ini yang mengambil
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is None:
+            try:
+                Database.notify(OUTBOX_CHANNEL)
+            except Exception as e:
+                print(f"⚠️ Outbox notify failed: {e}")
+            return
+        task = loop.create_task(Database.arun(Database.notify, OUTBOX_CHANNEL))
+        task.add_done_callback(_log_notify_error)
+
+    def _retry_delay(self, attempts):
+        return min(OUTBOX_RETRY_MAX, OUTBOX_RETRY_BASE * (2 ** (attempts - 1))) * (0.5 + random.random())
+
+    async def _dispatch(self, semaphore, row):
+        row_id, kind, payload = row[:3]
+        handler = self._handlers.get(kind)
+        async with semaphore:
+            if handler is None:
+                raise LookupError(f"no outbox handler for '{kind}'")
+            await handler(json.loads(payload))
+
+    async def drain_once(self):
+        """Claim one batch, run its handlers, record the outcome - returns number of rows claimed"""
+        now = time.time()
+        rows = await Database.aexecute(CLAIM_SQL, (now + OUTBOX_CLAIM_SECONDS, now, self.batch_size), fetch_all=True)
+        if not rows:
+            return 0
+        rows = sorted((tuple(row) for row in rows), key=lambda row: row[0])
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = await asyncio.gather(*(self._dispatch(semaphore, row) for row in rows), return_exceptions=True)
+
+        finished = time.time()
+        done, retry, dead = [], [], []
+        for (row_id, kind, _, attempts, created_at), result in zip(rows, results):
+            if isinstance(result, asyncio.CancelledError):
+                raise result
+            if not isinstance(result, BaseException):
+                done.append((finished, row_id))
+                lag = finished - created_at
+                self._lag_total += lag
+                self.max_lag = max(self.max_lag, lag)
+                continue
+            error = f"{type(result).__name__}: {result}"[:500]
+            if attempts >= self.max_attempts:
+                dead.append((error, finished, row_id))
+                print(f"❌ Outbox #{row_id} '{kind}' dead after {attempts} attempts: {error}")
+            else:
+                delay = self._retry_delay(attempts)
+                retry.append((finished + delay, error, row_id))
+                print(f"⚠️ Outbox #{row_id} '{kind}' failed (attempt {attempts}/{self.max_attempts}): {error} - retry in {delay:.0f}s")
+
+        async with Database.atransaction() as tx:
+            for params in done:
+                tx.defer("UPDATE outbox SET status = 'done', processed_at = ? WHERE id = ?", params)
+            for params in retry:
+                tx.defer('UPDATE outbox SET next_attempt_at = ?, last_error = ? WHERE id = ?', params)
+            for params in dead:
+                tx.defer("UPDATE outbox SET status = 'dead', last_error = ?, processed_at = ? WHERE id = ?", params)
+
+        self.batches += 1
+        self.done += len(done)
+        self.retried += len(retry)
+        self.dead += len(dead)
+        return len(rows)
+
+    async def purge(self):
+        cutoff = time.time() - OUTBOX_RETENTION_DAYS * 86400
+        await Database.aexecute("DELETE FROM outbox WHERE status = 'done' AND processed_at < ?", (cutoff,))
+        for cleanup in self._cleanups:
+            await Database.arun(cleanup)
+
+    async def run(self):
+        """Drain until cancelled (jalan di leader saja, leader election membatalkan task ini saat demote)"""
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self.active = True
+        try:
+            await self._run()
+        finally:
+            self.active = False
+
+    async def _run(self):
+        print("📤 Outbox worker started")
+        next_purge = 0.0
+        while True:
+            self._wake.clear()
+            try:
+                claimed = await self.drain_once()
+            except Exception as e:
+                print(f"⚠️ Outbox drain failed: {e}")
+                claimed = 0
+            if time.time() >= next_purge:
+                try:
+                    await self.purge()
+                except Exception as e:
+                    print(f"⚠️ Outbox purge failed: {e}")
+                next_purge = time.time() + 3600
+            if claimed >= self.batch_size:
+                continue  # masih ada backlog
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def backlog(self):
+        """{status: count} - blocking, call via Database.arun"""
+        rows = Database.execute('SELECT status, COUNT(*) FROM outbox GROUP BY status', fetch_all=True) or []
+        return {row[0]: row[1] for row in rows}
+
+    def stats(self):
+        return {
+            'active': self.active,
+            'enqueued': self.enqueued,
+            'done': self.done,
+            'retried': self.retried,
+            'dead': self.dead,
+            'batches': self.batches,
+            'avg_lag_ms': round(self._lag_total / self.done * 1000, 1) if self.done else 0.0,
+            'max_lag_ms': round(self.max_lag * 1000, 1),
+        }
@@ -0,0 +1,288 @@
+"""
+Payment Gateway - client async untuk Midtrans Snap API
+Satu aiohttp session dengan pool koneksi keep-alive, deadline per panggilan, retry untuk error
+sementara (order_id + Idempotency-Key yang sama, jadi retry tidak membuat transaksi kedua), dan
+circuit breaker: setelah beberapa kegagalan beruntun checkout langsung ditolak sampai cooldown lewat.
+
+Local stand-in untuk development:
+    python payment_gateway.py serve --port 8089 [--fail-rate 0.3] [--latency-ms 200]
+    MIDTRANS_SNAP_URL=http://localhost:8089/snap/v1 python main.py
+"""
+import os
+import sys
+import time
+import uuid
+import base64
+import random
+import asyncio
+import argparse
+
+import aiohttp
+from aiohttp import web
+
+MIDTRANS_IS_PRODUCTION = os.getenv('MIDTRANS_IS_PRODUCTION', '0') == '1'
+MIDTRANS_SNAP_URL = os.getenv('MIDTRANS_SNAP_URL', 'https://app.midtrans.com/snap/v1' if MIDTRANS_IS_PRODUCTION
+                              else 'https://app.sandbox.midtrans.com/snap/v1')
+MIDTRANS_TIMEOUT = float(os.getenv('MIDTRANS_TIMEOUT', '10'))  # deadline total per panggilan (termasuk retry)
+MIDTRANS_ATTEMPT_TIMEOUT = float(os.getenv('MIDTRANS_ATTEMPT_TIMEOUT', '5'))  # maks per percobaan
+MIDTRANS_CONNECT_TIMEOUT = float(os.getenv('MIDTRANS_CONNECT_TIMEOUT', '3'))
+MIDTRANS_MAX_RETRIES = int(os.getenv('MIDTRANS_MAX_RETRIES', '2'))
+MIDTRANS_POOL_SIZE = int(os.getenv('MIDTRANS_POOL_SIZE', '10'))  # koneksi keep-alive ke Snap API
+MIDTRANS_BREAKER_THRESHOLD = int(os.getenv('MIDTRANS_BREAKER_THRESHOLD', '5'))  # kegagalan beruntun sebelum open
+MIDTRANS_BREAKER_COOLDOWN = float(os.getenv('MIDTRANS_BREAKER_COOLDOWN', '30'))  # detik open sebelum dicoba lagi
+
+
+class PaymentGatewayError(Exception):
+    """Midtrans menolak / tidak bisa dihubungi setelah retry"""
+
+
+class GatewayUnavailable(PaymentGatewayError):
+    """Circuit breaker open - panggilan tidak dikirim sama sekali"""
+
+
+class CircuitBreaker:
+    """closed → open setelah `threshold` kegagalan beruntun → half-open (1 percobaan) setelah cooldown"""
+
+    def __init__(self, threshold=MIDTRANS_BREAKER_THRESHOLD, cooldown=MIDTRANS_BREAKER_COOLDOWN):
+        self.threshold = max(1, threshold)
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self.trips = 0
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'half_open' if time.monotonic() - self.opened_at >= self.cooldown else 'open'
+
+    def retry_in(self):
+        return max(0.0, self.cooldown - (time.monotonic() - self.opened_at)) if self.opened_at is not None else 0.0
+
+    def allow(self):
+        state = self.state
+        if state == 'closed':
+            return True
+        if state == 'half_open' and not self._probing:
+            self._probing = True  # hanya satu request yang menguji gateway
+            return True
+        return False
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def abandon(self):
+        """Probe cancelled before an answer - the next call may probe again"""
+        self._probing = False
+
+    def failure(self):
+        self.failures += 1
+        if self._probing or self.failures >= self.threshold:
+            if self.opened_at is None or self._probing:
+                self.trips += 1
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+
+class _Transient(Exception):
+    pass
+
+
+class MidtransSnap:
+    """await create_transaction(payload) → {'token', 'redirect_url'}; raise PaymentGatewayError / GatewayUnavailable"""
+
+    def __init__(self, server_key, base_url=MIDTRANS_SNAP_URL, timeout=MIDTRANS_TIMEOUT,
+                 max_retries=MIDTRANS_MAX_RETRIES, pool_size=MIDTRANS_POOL_SIZE):
+        self.server_key = server_key
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.max_retries = max(0, max_retries)
+        self.pool_size = max(1, pool_size)
+        self.breaker = CircuitBreaker()
+        self._session = None
+        self._session_loop = None
+        self.calls = 0
+        self.failed = 0
+        self.retried = 0
+        self.rejected_open = 0
+        self._latency_total = 0.0
+        self.max_latency = 0.0
+
+    def _get_session(self):
+        # Dibuat di loop yang sedang jalan (bot.run membuat loop baru setiap reconnect)
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+            # Basic auth = server key + ':' (header dibuat sendiri - parameter auth= deprecated di aiohttp baru)
+            authorization = 'Basic ' + base64.b64encode(f'{self.server_key or ""}:'.encode()).decode('ascii')
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers={'Accept': 'application/json', 'Content-Type': 'application/json', 'Authorization': authorization},
+            )
+            self._session_loop = loop
+        return self._session
+
+    async def close(self):
+        session, self._session = self._session, None
+        if session is not None and not session.closed:
+            await session.close()
+
+    def available(self):
+        """False selama breaker open - caller bisa menolak checkout sebelum menulis apa pun"""
+        return self.breaker.state != 'open'
+
+    async def _post(self, path, payload, idempotency_key, attempt_timeout):
+        timeout = aiohttp.ClientTimeout(total=attempt_timeout, connect=min(MIDTRANS_CONNECT_TIMEOUT, attempt_timeout))
+        try:
+            async with self._get_session().post(f'{self.base_url}{path}', json=payload, timeout=timeout,
+                                                headers={'Idempotency-Key': idempotency_key}) as response:
+                try:
+                    body = await response.json(content_type=None)
+                except ValueError:
+                    body = {}
+                if response.status == 429 or response.status >= 500:
+                    raise _Transient(f"HTTP {response.status}: {body.get('error_messages') or body}")
+                if response.status >= 400:
+                    # 4xx (payload salah, order_id dipakai) tidak akan sembuh dengan retry
+                    raise PaymentGatewayError(f"HTTP {response.status}: {body.get('error_messages') or body}")
+                return body
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            raise _Transient(f"{type(e).__name__}: {e}") from e
+
+    async def create_transaction(self, payload):
+        if not self.breaker.allow():
+            self.rejected_open += 1
+            raise GatewayUnavailable(f"Midtrans sedang bermasalah, coba lagi dalam {self.breaker.retry_in():.0f} detik")
+        self.calls += 1
+        started = time.monotonic()
+        deadline = started + self.timeout
+        idempotency_key = str(payload.get('transaction_details', {}).get('order_id') or uuid.uuid4())
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    raise _Transient(f"deadline {self.timeout:.0f}s exceeded")
+                body = await self._post('/transactions', payload, idempotency_key, min(MIDTRANS_ATTEMPT_TIMEOUT, remaining))
+            except _Transient as e:
+                remaining = deadline - time.monotonic()
+                backoff = min(2.0, 0.25 * (2 ** attempt)) * (0.5 + random.random())
+                if attempt < self.max_retries and remaining > backoff:
+                    attempt += 1
+                    self.retried += 1
+                    await asyncio.sleep(backoff)
+                    continue
+                self._finish(started, ok=False)
+                raise PaymentGatewayError(f"Midtrans tidak merespons setelah {attempt + 1} percobaan: {e}") from None
+            except PaymentGatewayError:
+                # Gateway hidup dan menjawab - bukan alasan membuka breaker
+                self.breaker.success()
+                self.failed += 1
+                raise
+            except asyncio.CancelledError:
+                self.breaker.abandon()
+                raise
+            self._finish(started, ok=True)
+            return body
+
+    def _finish(self, started, ok):
+        elapsed = time.monotonic() - started
+        self._latency_total += elapsed
+        self.max_latency = max(self.max_latency, elapsed)
+        if ok:
+            self.breaker.success()
+        else:
+            self.failed += 1
+            self.breaker.failure()
+
+    def stats(self):
+        return {
+            'base_url': self.base_url,
+            'breaker': self.breaker.state,
+            'retry_in_s': round(self.breaker.retry_in(), 1),
+            'trips': self.breaker.trips,
+            'calls': self.calls,
+            'failed': self.failed,
+            'retried': self.retried,
+            'rejected_open': self.rejected_open,
+            'avg_ms': round(self._latency_total / self.calls * 1000, 1) if self.calls else 0.0,
+            'max_ms': round(self.max_latency * 1000, 1),
+        }
+
+
+# ============ LOCAL STAND-IN ============
+class LocalSnapServer:
+    """Minimal Snap API (POST /snap/v1/transactions) for development and tests
+
+    fail_rate: fraction of requests answered 503; latency_ms: delay before every answer.
+    Order id yang sama dengan Idempotency-Key yang sama mendapat jawaban yang sama (seperti gateway asli).
+    """
+
+    def __init__(self, host='127.0.0.1', port=8089, fail_rate=0.0, latency_ms=0.0, verbose=False):
+        self.host = host
+        self.port = port
+        self.fail_rate = fail_rate
+        self.latency_ms = latency_ms
+        self.verbose = verbose
+        self.transactions = {}  # order_id -> (idempotency key, response)
+        self.requests = 0
+        self.app = web.Application()
+        self.app.router.add_post('/snap/v1/transactions', self._create)
+        self._runner = None
+
+    async def _create(self, request):
+        self.requests += 1
+        payload = await request.json()
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        if random.random() < self.fail_rate:
+            return web.json_response({'error_messages': ['stand-in: simulated outage']}, status=503)
+        order_id = payload.get('transaction_details', {}).get('order_id')
+        if not order_id:
+            return web.json_response({'error_messages': ['transaction_details.order_id is required']}, status=400)
+        key = request.headers.get('Idempotency-Key')
+        known = self.transactions.get(order_id)
+        if known is not None:
+            if known[0] == key:
+                return web.json_response(known[1], status=201)
+            return web.json_response({'error_messages': ['transaction_details.order_id sudah digunakan']}, status=400)
+        token = uuid.uuid4().hex
+        response = {'token': token, 'redirect_url': f'http://{self.host}:{self.port}/snap/v2/vtweb/{token}'}
+        self.transactions[order_id] = (key, response)
+        if self.verbose:
+            print(f"💳 {order_id}: Rp {payload['transaction_details'].get('gross_amount'):,} → {token}")
+        return web.json_response(response, status=201)
+
+    async def start(self):
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local Midtrans Snap stand-in')
+    sub = parser.add_subparsers(dest='command', required=True)
+    serve = sub.add_parser('serve', help='answer Snap create-transaction calls')
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8089)
+    serve.add_argument('--fail-rate', type=float, default=0.0, help='fraction of requests answered 503')
+    serve.add_argument('--latency-ms', type=float, default=0.0)
+    args = parser.parse_args()
+
+    async def serve_forever():
+        stand_in = LocalSnapServer(args.host, args.port, args.fail_rate, args.latency_ms, verbose=True)
+        await stand_in.start()
+        print(f"💳 Snap stand-in listening on http://{args.host}:{args.port}/snap/v1")
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(serve_forever())
+    except KeyboardInterrupt:
+        sys.exit(0)
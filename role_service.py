@@ -0,0 +1,192 @@
+"""
+Role Service - resolusi nama role → Role lewat index per guild, plus batch executor perubahan role
+Index dibangun sekali dan diperbarui oleh event on_guild_role_create/update/delete, jadi lookup
+tidak lagi scan guild.roles per baris. Perubahan role dikumpulkan per member lalu dijalankan
+dengan concurrency terbatas: satu perubahan → add_roles/remove_roles, lebih dari satu → satu edit.
+"""
+import os
+import time
+import asyncio
+
+ROLE_EDIT_CONCURRENCY = int(os.getenv('ROLE_EDIT_CONCURRENCY', '4'))  # edit member paralel per batch
+
+
+class RoleIndex:
+    """{guild_id: {role name: role_id}} - role dengan nama sama: posisi terendah menang (sama seperti discord.utils.get)"""
+
+    def __init__(self):
+        self._names = {}
+        self.hits = 0
+        self.misses = 0
+        self.rebuilds = 0
+
+    def _build(self, guild):
+        names = {}
+        for role in guild.roles:
+            names.setdefault(role.name, role.id)
+        self._names[guild.id] = names
+        self.rebuilds += 1
+        return names
+
+    def get(self, guild, name):
+        """Role object untuk name, atau None"""
+        if guild is None or not name:
+            return None
+        names = self._names.get(guild.id)
+        if names is None:
+            names = self._build(guild)
+        role_id = names.get(name)
+        role = guild.get_role(role_id) if role_id is not None else None
+        if role is not None and role.name == name:
+            self.hits += 1
+            return role
+        # Event terlewat (reconnect, cache belum siap) → bangun ulang index guild ini sekali
+        self.misses += 1
+        role_id = self._build(guild).get(name)
+        return guild.get_role(role_id) if role_id is not None else None
+
+    def invalidate(self, guild):
+        self._names.pop(guild.id, None)
+
+    def on_role_create(self, role):
+        names = self._names.get(role.guild.id)
+        if names is not None:
+            names.setdefault(role.name, role.id)
+
+    def on_role_update(self, before, after):
+        if before.name != after.name or before.position != after.position:
+            self.invalidate(after.guild)
+
+    def on_role_delete(self, role):
+        names = self._names.get(role.guild.id)
+        if names is not None and names.get(role.name) == role.id:
+            self.invalidate(role.guild)
+
+    def stats(self):
+        return {
+            'guilds': len(self._names),
+            'roles': sum(len(names) for names in self._names.values()),
+            'hits': self.hits,
+            'misses': self.misses,
+            'rebuilds': self.rebuilds,
+        }
+
+
+class RoleBatch:
+    """Collect add/remove per member, then run() applies them with bounded concurrency
+
+    key (mis. order_id) ikut dilaporkan di hasil supaya caller tahu baris mana yang gagal.
+    """
+
+    def __init__(self, name, concurrency=ROLE_EDIT_CONCURRENCY, reason=None, metrics=None):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.reason = reason
+        self._metrics = metrics
+        self._changes = {}  # member_id -> [member, {role_id: role} add, {role_id: role} remove, [keys]]
+
+    def _entry(self, member, key):
+        entry = self._changes.get(member.id)
+        if entry is None:
+            entry = self._changes[member.id] = [member, {}, {}, []]
+        if key is not None:
+            entry[3].append(key)
+        return entry
+
+    def add(self, member, role, key=None):
+        entry = self._entry(member, key)
+        entry[2].pop(role.id, None)  # add setelah remove untuk role yang sama → add menang
+        entry[1][role.id] = role
+
+    def remove(self, member, role, key=None):
+        entry = self._entry(member, key)
+        entry[1].pop(role.id, None)
+        entry[2][role.id] = role
+
+    def __len__(self):
+        return len(self._changes)
+
+    async def _apply(self, semaphore, member, add, remove):
+        current = {role.id for role in member.roles}
+        add = [role for role_id, role in add.items() if role_id not in current]
+        remove = [role for role_id, role in remove.items() if role_id in current]
+        if not add and not remove:
+            return 'skipped'
+        async with semaphore:
+            if len(add) + len(remove) == 1:
+                # Endpoint per-role tidak menimpa role lain yang berubah bersamaan
+                if add:
+                    await member.add_roles(add[0], reason=self.reason)
+                else:
+                    await member.remove_roles(remove[0], reason=self.reason)
+            else:
+                # Beberapa perubahan untuk member yang sama → satu PATCH dengan daftar role final
+                remove_ids = {role.id for role in remove}
+                roles = [role for role in member.roles if not role.is_default() and role.id not in remove_ids]
+                await member.edit(roles=roles + add, reason=self.reason)
+        return 'applied'
+
+    async def run(self):
+        """{'members', 'applied', 'skipped', 'failed': {member_id: (keys, error)}, 'elapsed_ms'}"""
+        started = time.perf_counter()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        entries = list(self._changes.values())
+        self._changes = {}
+        results = await asyncio.gather(*(self._apply(semaphore, member, add, remove)
+                                         for member, add, remove, _ in entries),
+                                       return_exceptions=True)
+        report = {'members': len(entries), 'applied': 0, 'skipped': 0, 'failed': {}}
+        for (member, _, _, keys), result in zip(entries, results):
+            if isinstance(result, BaseException):
+                report['failed'][member.id] = (keys, result)
+                print(f"  ❌ Role update for {member} failed: {result}")
+            else:
+                report[result] += 1
+        report['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        if entries:
+            print(f"🎭 Role batch '{self.name}': {report['applied']} applied, {report['skipped']} skipped, "
+                  f"{len(report['failed'])} failed in {report['elapsed_ms']} ms")
+        if self._metrics is not None:
+            self._metrics(self.name, report)
+        return report
+
+
+class RoleService:
+    """Role lookup by name + batch factory with per-batch-name timing stats"""
+
+    def __init__(self, concurrency=ROLE_EDIT_CONCURRENCY):
+        self.index = RoleIndex()
+        self.concurrency = concurrency
+        self._batches = {}  # name -> {'runs', 'members', 'failed', 'last_ms', 'max_ms'}
+
+    def get(self, guild, name):
+        return self.index.get(guild, name)
+
+    def batch(self, name, reason=None):
+        return RoleBatch(name, self.concurrency, reason, self._record)
+
+    def _record(self, name, report):
+        stats = self._batches.setdefault(name, {'runs': 0, 'members': 0, 'failed': 0, 'last_ms': 0.0, 'max_ms': 0.0})
+        stats['runs'] += 1
+        stats['members'] += report['members']
+        stats['failed'] += len(report['failed'])
+        stats['last_ms'] = report['elapsed_ms']
+        stats['max_ms'] = max(stats['max_ms'], report['elapsed_ms'])
+
+    def register(self, bot):
+        """Pasang listener role event ke bot (bot.add_listener, tidak menimpa @bot.event lain)"""
+        async def on_guild_role_create(role):
+            self.index.on_role_create(role)
+
+        async def on_guild_role_update(before, after):
+            self.index.on_role_update(before, after)
+
+        async def on_guild_role_delete(role):
+            self.index.on_role_delete(role)
+
+        bot.add_listener(on_guild_role_create)
+        bot.add_listener(on_guild_role_update)
+        bot.add_listener(on_guild_role_delete)
+
+    def stats(self):
+        return {'index': self.index.stats(), 'batches': {name: dict(stats) for name, stats in self._batches.items()}}
@@ -0,0 +1,208 @@
+"""
+Deadline Scheduler - satu min-heap untuk semua deadline (expiry, reminder, order timeout)
+Task tidur sampai deadline terdekat, lalu handler per kind dipanggil dengan semua key yang jatuh tempo.
+Database tetap sumber kebenaran: handler selalu cek ulang kondisi sebelum bertindak.
+"""
+import os
+import json
+import time
+import heapq
+import asyncio
+import threading
+from datetime import datetime
+
+from db_handler import Database
+
+SCHEDULER_RESYNC_SECONDS = float(os.getenv('SCHEDULER_RESYNC_SECONDS', '3600'))  # reload deadline dari database
+SCHEDULER_RETRY_SECONDS = float(os.getenv('SCHEDULER_RETRY_SECONDS', '60'))  # jadwal ulang kalau handler gagal
+DEADLINES_CHANNEL = 'deadlines_changed'  # NOTIFY: replica standby meneruskan deadline baru ke leader
+
+
+def _epoch(due):
+    return due.timestamp() if isinstance(due, datetime) else float(due)
+
+
+def _log_forward_error(task):
+    if not task.cancelled() and task.exception() is not None:
+        print(f"⚠️ Scheduler forward failed: {task.exception()}")
+
+
+class DeadlineScheduler:
+    """Min-heap of (due, kind, key); schedule() is thread-safe, run() is the single consumer task
+
+    Jadwal ulang key yang sama cukup push entry baru - entry lama di heap diabaikan saat di-pop
+    (lazy deletion), jadi schedule() O(log n) tanpa mencari entry lama.
+    """
+
+    def __init__(self, resync_interval=SCHEDULER_RESYNC_SECONDS, retry_delay=SCHEDULER_RETRY_SECONDS):
+        self.resync_interval = resync_interval
+        self.retry_delay = retry_delay
+        self._handlers = {}  # kind -> async handler(keys)
+        self._loaders = {}  # kind -> sync loader() -> [(key, due), ...]
+        self._heap = []
+        self._due = {}  # (kind, key) -> due epoch yang berlaku
+        self._lock = threading.Lock()
+        self._loop = None
+        self._wake = None
+        self._shared = False
+        self.active = False  # True selama run() jalan (replica ini leader)
+        self.forwarded = 0
+        self.fired = 0
+        self.passes = 0
+        self.resyncs = 0
+        self._lateness_total = 0.0
+        self.max_lateness = 0.0
+
+    def register(self, kind, handler, loader=None):
+        """handler: async fn(keys) dipanggil saat deadline lewat; loader: sync fn() → [(key, due)] untuk startup/resync"""
+        self._handlers[kind] = handler
+        if loader is not None:
+            self._loaders[kind] = loader
+
+    def schedule(self, kind, key, due):
+        """Set (or move) the deadline for key - due is an aware datetime or epoch seconds; None cancels"""
+        if due is None:
+            return self.cancel(kind, key)
+        due = _epoch(due)
+        if self._shared and not self.active:
+            # Standby: deadline disimpan leader; kalau jadi leader nanti, resync memuat ulang dari database
+            return self._forward(kind, key, due)
+        with self._lock:
+            if self._due.get((kind, key)) == due:
+                return
+            first = not self._heap or due < self._heap[0][0]
+            self._due[(kind, key)] = due
+            heapq.heappush(self._heap, (due, kind, key))
+        if first:
+            self._wakeup()
+
+    def cancel(self, kind, key):
+        with self._lock:
+            self._due.pop((kind, key), None)
+
+    def share(self):
+        """PostgreSQL: standby replicas forward schedule() calls to the leader (False on SQLite)"""
+        self._shared = Database.listen(DEADLINES_CHANNEL, self._on_notify)
+        return self._shared
+
+    def _forward(self, kind, key, due):
+        payload = json.dumps([kind, key, due])
+        self.forwarded += 1
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is None:
+            try:
+                Database.notify(DEADLINES_CHANNEL, payload)
+            except Exception as e:
+                print(f"⚠️ Scheduler forward failed: {e}")
+            return
+        # Jangan blocking event loop untuk round-trip NOTIFY
+        task = loop.create_task(Database.arun(Database.notify, DEADLINES_CHANNEL, payload))
+        task.add_done_callback(_log_forward_error)
+
+    def _on_notify(self, payload):
+        if payload is None or not self.active:
+            return  # reconnect: resync berikutnya menutup celah; standby tidak menyimpan deadline
+        try:
+            kind, key, due = json.loads(payload)
+        except (ValueError, TypeError):
+            return
+        self.schedule(kind, key, due)
+
+    def _wakeup(self):
+        loop, wake = self._loop, self._wake
+        if loop is not None and wake is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(wake.set)
+
+    def _pop_due(self, now):
+        """{kind: [keys]} for every live entry with due <= now"""
+        batches = {}
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                due, kind, key = heapq.heappop(self._heap)
+                if self._due.get((kind, key)) != due:
+                    continue  # sudah dijadwal ulang / dibatalkan
+                del self._due[(kind, key)]
+                batches.setdefault(kind, []).append(key)
+                self.fired += 1
+                lateness = now - due
+                self._lateness_total += lateness
+                self.max_lateness = max(self.max_lateness, lateness)
+        return batches
+
+    def _next_due(self):
+        with self._lock:
+            # Buang entry basi di puncak heap supaya timeout tidak terlalu pendek
+            while self._heap and self._due.get((self._heap[0][1], self._heap[0][2])) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+
+    async def resync(self):
+        """Reload every deadline from the database (startup, then every resync_interval)"""
+        for kind, loader in self._loaders.items():
+            try:
+                entries = await Database.arun(loader)
+                for key, due in entries:
+                    self.schedule(kind, key, due)
+            except Exception as e:
+                print(f"⚠️ Scheduler resync '{kind}' failed: {e}")
+        self.resyncs += 1
+
+    async def run(self):
+        """Consume deadlines until cancelled (leader election membatalkan task ini saat demote)"""
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self.active = True
+        try:
+            await self._run()
+        finally:
+            self.active = False
+
+    async def _run(self):
+        await self.resync()
+        print(f"⏱️ Scheduler started with {len(self._due)} deadlines")
+        next_resync = time.time() + self.resync_interval
+        while True:
+            for kind, keys in self._pop_due(time.time()).items():
+                handler = self._handlers.get(kind)
+                if handler is None:
+                    continue
+                self.passes += 1
+                try:
+                    await handler(keys)
+                except Exception as e:
+                    print(f"⚠️ Scheduler handler '{kind}' failed for {len(keys)} keys: {e} - retry in {self.retry_delay:.0f}s")
+                    for key in keys:
+                        self.schedule(kind, key, time.time() + self.retry_delay)
+            if time.time() >= next_resync:
+                await self.resync()
+                next_resync = time.time() + self.resync_interval
+            self._wake.clear()
+            next_due = self._next_due()
+            deadline = next_resync if next_due is None else min(next_due, next_resync)
+            timeout = max(0.0, deadline - time.time())
+            if timeout > 0:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+    def stats(self):
+        with self._lock:
+            pending = {}
+            for kind, _ in self._due:
+                pending[kind] = pending.get(kind, 0) + 1
+            next_due = min(self._due.values()) if self._due else None
+        return {
+            'pending': pending,
+            'next_in_s': round(next_due - time.time(), 1) if next_due is not None else None,
+            'fired': self.fired,
+            'passes': self.passes,
+            'resyncs': self.resyncs,
+            'active': self.active,
+            'forwarded': self.forwarded,
+            'avg_lateness_ms': round(self._lateness_total / self.fired * 1000, 1) if self.fired else 0.0,
+            'max_lateness_ms': round(self.max_lateness * 1000, 1),
+        }
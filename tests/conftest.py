@@ -0,0 +1,36 @@
+"""
+Fixtures bersama - setiap test memakai file SQLite sendiri di tmp_path (tidak pernah warrior_subscriptions.db)
+"""
+import os
+import sys
+
+os.environ.pop('DATABASE_URL', None)  # test selalu jalan di SQLite
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import db_handler
+from db_handler import Database
+from migrations import run_migrations
+
+
+def _reset_engine():
+    Database.close_pools()
+    db_handler._pools.clear()
+    db_handler._writer = None
+
+
+@pytest.fixture
+def sqlite_path(tmp_path, monkeypatch):
+    """Fresh, empty database file - pools and writer thread are rebuilt for it"""
+    _reset_engine()
+    monkeypatch.setattr(db_handler, 'SQLITE_PATH', str(tmp_path / 'test.db'))
+    yield db_handler.SQLITE_PATH
+    _reset_engine()
+
+
+@pytest.fixture
+def db(sqlite_path):
+    """Fresh database with every migration applied"""
+    run_migrations()
+    return Database
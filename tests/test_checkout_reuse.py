@@ -0,0 +1,84 @@
+import sys
+import threading
+import importlib
+from datetime import timedelta
+
+import pytest
+
+from db_handler import to_db_timestamp
+
+PACKAGE, PRICE = 'warrior_1month', 299000
+
+
+@pytest.fixture
+def main(db, tmp_path, monkeypatch):
+    """main.py diimport sekali (init_db memakai database test); Database selalu membaca SQLITE_PATH terbaru"""
+    monkeypatch.chdir(tmp_path)
+    return sys.modules.get('main') or importlib.import_module('main')
+
+
+def _checkout(main, db, order_id, analyst_id=None, discord_id='1'):
+    """Same unit as BuyNewModal.record_order: reuse an identical open order or record a new one"""
+    def record_order(tx):
+        open_checkout = main.find_open_checkout(tx, discord_id, PACKAGE, PRICE, 'ORD', analyst_id)
+        if open_checkout:
+            return open_checkout
+        main.save_pending_order(order_id, discord_id, 'user', 'Nama', 'user@example.com', PACKAGE, None, price=PRICE, tx=tx)
+        if analyst_id:
+            tx.defer('INSERT INTO commissions (order_id, analyst_id, analyst_name, commission_amount) VALUES (?, ?, ?, ?)',
+                     (order_id, analyst_id, 'Analyst', PRICE * 30 // 100))
+        return None
+    return db.write_transaction(record_order)
+
+
+def _orders(db):
+    return [row[0] for row in db.execute('SELECT order_id FROM pending_orders ORDER BY order_id', fetch_all=True, commit=False)]
+
+
+def test_concurrent_double_submit_reuses_the_order_still_waiting_for_its_link(main, db):
+    results = {}
+    barrier = threading.Barrier(6)
+
+    def submit(i):
+        barrier.wait()
+        results[i] = _checkout(main, db, f'ORD_1_{i}')
+
+    threads = [threading.Thread(target=submit, args=(i,)) for i in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    created = [i for i, result in results.items() if result is None]
+    assert len(created) == 1 and _orders(db) == [f'ORD_1_{created[0]}']
+    reused = [result for result in results.values() if result is not None]
+    assert {(order_id, link) for order_id, link, _ in reused} == {(f'ORD_1_{created[0]}', None)}  # link masih dibuat
+
+
+def test_reused_order_returns_its_payment_link(main, db):
+    assert _checkout(main, db, 'ORD_1_a') is None
+    db.execute('UPDATE pending_orders SET payment_url = ? WHERE order_id = ?', ('https://pay.example/a', 'ORD_1_a'))
+    order_id, link, expires_at = _checkout(main, db, 'ORD_1_b')
+    assert (order_id, link) == ('ORD_1_a', 'https://pay.example/a')
+    assert expires_at > main.get_jakarta_datetime() + timedelta(minutes=9)
+
+
+def test_referral_is_part_of_the_reuse_key(main, db):
+    assert _checkout(main, db, 'ORD_1_plain') is None
+    assert _checkout(main, db, 'ORD_1_ref', analyst_id='777') is None  # tanpa referral → jangan buang komisi
+    assert _checkout(main, db, 'ORD_1_ref2', analyst_id='777')[0] == 'ORD_1_ref'
+    assert _checkout(main, db, 'ORD_1_other', analyst_id='888') is None
+    assert _checkout(main, db, 'ORD_1_plain2')[0] == 'ORD_1_plain'
+    commissions = db.execute('SELECT order_id, analyst_id FROM commissions ORDER BY order_id', fetch_all=True, commit=False)
+    assert [tuple(row) for row in commissions] == [('ORD_1_other', '888'), ('ORD_1_ref', '777')]
+
+
+def test_failed_link_and_nearly_expired_orders_are_not_reused(main, db):
+    now = main.get_jakarta_datetime()
+    insert = 'INSERT INTO pending_orders (order_id, discord_id, package_type, price, payment_url, created_at) VALUES (?, ?, ?, ?, ?, ?)'
+    # Snap gagal / proses mati sebelum link disimpan
+    db.execute(insert, ('ORD_1_nolink', '1', PACKAGE, PRICE, None, to_db_timestamp(now - main.PAYMENT_LINK_PENDING_GRACE - timedelta(seconds=5))))
+    # Link masih ada tapi sisa waktunya terlalu sedikit untuk dibayar
+    db.execute(insert, ('ORD_1_old', '1', PACKAGE, PRICE, 'https://pay.example/old', to_db_timestamp(now - timedelta(minutes=9))))
+    assert _checkout(main, db, 'ORD_1_new') is None
+    assert _checkout(main, db, 'ORD_1_x', discord_id='2') is None  # member lain tidak pernah berbagi order
@@ -0,0 +1,121 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from code_registry import CodeRegistry, CodeUnavailable, CONSUME_DISCOUNT_SQL, HAS_CAPACITY
+from db_handler import APP_TIMEZONE
+
+
+def _discount(db, code, max_uses, used_count=0, expiry=None):
+    db.execute('INSERT INTO discount_codes (code, discount_percent, max_uses, used_count, code_expiry_date) VALUES (?, ?, ?, ?, ?)',
+               (code, 20, max_uses, used_count, expiry and expiry.strftime('%Y-%m-%d %H:%M:%S')))  # format seperti /create_discount
+
+
+def _trial(db, code, max_uses, used_count=0):
+    db.execute('INSERT INTO trial_members (trial_code, duration_days, max_uses, used_count, status) VALUES (?, ?, ?, ?, ?)',
+               (code, 1, max_uses, used_count, 'pending'))
+
+
+def _used(db, table, column, code):
+    return db.execute(f'SELECT used_count FROM {table} WHERE {column} = ?', (code,), fetch_one=True, commit=False)[0]
+
+
+def _consume(tx, code):
+    # Sama seperti BuyNewModal.record_order
+    if not tx.execute(CONSUME_DISCOUNT_SQL, (code,)):
+        raise CodeUnavailable("Kode diskon sudah mencapai batas penggunaan")
+    return True
+
+
+def _redeem_trial(tx, code, discord_id):
+    # Sama seperti redeem trial di main.py - conditional UPDATE, rowcount 0 = kuota habis
+    return tx.execute(f'''UPDATE trial_members SET discord_id = ?, status = "active", used_count = COALESCE(used_count, 0) + 1
+                          WHERE trial_code = ? AND {HAS_CAPACITY}''', (discord_id, code))
+
+
+def test_discount_check_and_consume_stop_at_max_uses(db):
+    _discount(db, 'HEMAT', max_uses=2, used_count=1)
+    registry = CodeRegistry()
+    assert registry.check('discount', 'hemat')[1] is None
+    assert db.write_transaction(lambda tx: _consume(tx, 'HEMAT'))
+    registry.record_use('discount', 'HEMAT')
+    assert registry.check('discount', 'HEMAT')[1] == 'exhausted'
+    with pytest.raises(CodeUnavailable):
+        db.write_transaction(lambda tx: _consume(tx, 'HEMAT'))
+    assert _used(db, 'discount_codes', 'code', 'HEMAT') == 2
+
+
+def test_unlimited_and_expired_discount_codes(db):
+    _discount(db, 'FREE', max_uses=0, used_count=50)
+    _discount(db, 'OLD', max_uses=0, expiry=datetime.now(APP_TIMEZONE) - timedelta(days=1))
+    registry = CodeRegistry()
+    assert registry.check('discount', 'FREE')[1] is None  # max_uses 0 = tanpa batas
+    assert db.write_transaction(lambda tx: _consume(tx, 'FREE'))
+    assert registry.check('discount', 'OLD')[1] == 'expired'
+    with pytest.raises(CodeUnavailable):
+        db.write_transaction(lambda tx: _consume(tx, 'MISSING'))  # kode hilang juga rowcount 0
+
+
+def test_trial_redeem_respects_max_uses(db):
+    _trial(db, 'TRIAL1', max_uses=1)
+    registry = CodeRegistry()
+    assert registry.check('trial', 'TRIAL1')[1] is None
+    assert db.write_transaction(lambda tx: _redeem_trial(tx, 'TRIAL1', '111')) == 1
+    registry.record_use('trial', 'TRIAL1')
+    assert registry.check('trial', 'TRIAL1')[1] == 'exhausted'
+    assert db.write_transaction(lambda tx: _redeem_trial(tx, 'TRIAL1', '222')) == 0
+    assert _used(db, 'trial_members', 'trial_code', 'TRIAL1') == 1
+
+
+def test_referral_codes_have_no_usage_limit(db):
+    db.execute('INSERT INTO referral_codes (code, created_by, uses, max_uses, analyst_id, analyst_name) VALUES (?, ?, ?, ?, ?, ?)',
+               ('REF_1', '9', 5, 1, '9', 'Analyst'))
+    entry, reason = CodeRegistry().check('referral', 'ref_1')
+    assert reason is None  # referral tidak pernah dibatasi max_uses (komisi per order)
+    assert (entry['analyst_id'], entry['analyst_name']) == ('9', 'Analyst')
+
+
+def test_concurrent_consumes_never_exceed_max_uses(db):
+    _discount(db, 'RUSH', max_uses=3)
+    results = []
+    lock = threading.Lock()
+
+    def checkout():
+        try:
+            outcome = db.write_transaction(lambda tx: _consume(tx, 'RUSH'))
+        except CodeUnavailable:
+            outcome = False
+        with lock:
+            results.append(outcome)
+
+    threads = [threading.Thread(target=checkout) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert results.count(True) == 3 and results.count(False) == 7
+    assert _used(db, 'discount_codes', 'code', 'RUSH') == 3
+
+
+def test_negative_cache_expires(db):
+    registry = CodeRegistry(negative_ttl=0.1)
+    assert registry.check('discount', 'LATER') == (None, 'not_found')
+    _discount(db, 'LATER', max_uses=1)
+    assert registry.check('discount', 'LATER') == (None, 'not_found')  # masih diingat sebagai miss
+    assert registry.stats()['negative_hits'] == 1
+    time.sleep(0.15)
+    assert registry.check('discount', 'LATER')[1] is None
+
+
+def test_invalidate_makes_a_new_code_visible(db):
+    registry = CodeRegistry()
+    assert registry.check('trial', 'NEWTRIAL') == (None, 'not_found')
+    _trial(db, 'NEWTRIAL', max_uses=5)
+    registry.invalidate('trial', 'newtrial')
+    entry, reason = registry.check('trial', 'NEWTRIAL')
+    assert reason is None and entry['max_uses'] == 5
+    db.execute('DELETE FROM trial_members WHERE trial_code = ?', ('NEWTRIAL',))
+    registry.refresh('trial', 'NEWTRIAL')
+    assert registry.check('trial', 'NEWTRIAL') == (None, 'not_found')
@@ -0,0 +1,203 @@
+import sqlite3
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import pytest
+
+import db_handler
+from db_handler import ConnectionPool, PoolTimeout, SQLiteWriter
+
+
+class FakeConn:
+    in_transaction = False
+    row_factory = None
+
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def _pool(ping=lambda conn, deep: True, **kwargs):
+    opened = []
+
+    def factory():
+        opened.append(FakeConn())
+        return opened[-1]
+
+    return ConnectionPool('test', factory, ping, **dict(dict(min_size=0, max_size=2, timeout=0.05), **kwargs)), opened
+
+
+def test_pool_reuses_released_connections():
+    pool, opened = _pool()
+    for _ in range(5):
+        pool.acquire().close()
+    assert len(opened) == 1
+    assert pool.stats()['checkouts'] == 5 and pool.stats()['idle'] == 1
+
+
+def test_exhausted_pool_times_out_then_serves_the_next_waiter():
+    pool, _ = _pool()
+    held = [pool.acquire(), pool.acquire()]
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.acquire(timeout=2)))
+    waiter.start()
+    held.pop().close()
+    waiter.join(2)
+    assert got and pool.stats()['timeouts'] == 1
+
+
+def test_dead_connection_is_discarded_on_borrow():
+    alive = {'ok': True}
+    pool, opened = _pool(ping=lambda conn, deep: alive['ok'])
+    pool.acquire().close()
+    alive['ok'] = False
+    conn = pool.acquire()  # idle koneksi mati → dibuang, koneksi baru dibuka
+    assert len(opened) == 2 and opened[0].closed
+    assert conn.raw is opened[1]
+    assert pool.stats()['discarded'] == 1
+
+
+def test_slow_warm_up_does_not_block_release_of_other_connections():
+    gate = threading.Event()
+    opened = []
+
+    def factory():
+        if opened:  # koneksi warm-up kedua menggantung sampai gate dibuka
+            gate.wait(5)
+        opened.append(FakeConn())
+        return opened[-1]
+
+    pool = ConnectionPool('test', factory, lambda conn, deep: True, min_size=2, max_size=3, timeout=2)
+    pool._filled = True  # satu koneksi sudah dipinjam sebelum warm-up ulang
+    held = pool.acquire()
+    pool._filled = False
+    warming = threading.Thread(target=lambda: pool.acquire().close())
+    warming.start()
+    while len(opened) < 1 or pool.stats()['size'] < 2:
+        time.sleep(0.01)
+    released = threading.Thread(target=held.close)
+    released.start()
+    released.join(1)
+    assert not released.is_alive()  # release tidak menunggu factory yang lambat
+    gate.set()
+    warming.join(5)
+    assert len(opened) == 2 and pool.stats()['size'] == 2 and pool.stats()['in_use'] == 0
+
+
+def test_failed_warm_up_is_retried_on_the_next_acquire():
+    fail = {'on': True}
+    opened = []
+
+    def factory():
+        if fail['on']:
+            raise OSError('database down')
+        opened.append(FakeConn())
+        return opened[-1]
+
+    pool = ConnectionPool('test', factory, lambda conn, deep: True, min_size=2, max_size=3, timeout=0.05)
+    with pytest.raises(OSError):
+        pool.acquire()
+    assert pool.stats()['size'] == 0
+    fail['on'] = False
+    pool.acquire().close()
+    assert len(opened) == 2 and pool.stats()['size'] == 2
+
+
+def _insert(conn, cursor, value):
+    cursor.execute('INSERT INTO leader_leases (name, holder, expires_at) VALUES (?, ?, ?)', (value, 'x', 0))
+    if value.startswith('bad'):
+        raise ValueError(value)
+    return value
+
+
+def _lease_names(db):
+    return sorted(row[0] for row in db.execute('SELECT name FROM leader_leases', fetch_all=True, commit=False))
+
+
+def test_failed_job_rolls_back_only_its_own_savepoint(db):
+    writer = SQLiteWriter(batch_size=10, linger_ms=200)
+    futures = [writer.submit(_insert, name) for name in ('a', 'bad', 'c')]
+    assert futures[0].result(5) == 'a' and futures[2].result(5) == 'c'
+    with pytest.raises(ValueError):
+        futures[1].result(5)
+    stats = writer.stats()
+    writer.stop()
+    assert _lease_names(db) == ['a', 'c']
+    assert (stats['jobs'], stats['failed'], stats['commits']) == (3, 1, 1)  # satu COMMIT untuk seluruh batch
+
+
+def test_raw_connections_are_read_only_and_migrations_can_write(db):
+    conn = db.connect()
+    try:
+        with pytest.raises(sqlite3.OperationalError, match='readonly'):
+            conn.cursor().execute('INSERT INTO leader_leases (name, holder, expires_at) VALUES (?, ?, ?)', ('x', 'x', 0))
+    finally:
+        conn.close()
+    conn = db.migration_connect()
+    try:
+        conn.cursor().execute('INSERT INTO leader_leases (name, holder, expires_at) VALUES (?, ?, ?)', ('m', 'x', 0))
+        conn.commit()
+    finally:
+        conn.close()
+    assert _lease_names(db) == ['m']
+
+
+def test_interactive_transaction_outside_the_writer_is_refused(db):
+    with pytest.raises(RuntimeError, match='write_transaction'):
+        with db.transaction() as tx:
+            tx.fetchone('SELECT 1')
+    assert db.write_transaction(lambda tx: tx.fetchone('SELECT 1')[0]) == 1
+
+
+def _end_transaction_then_raise(conn, cursor, value):
+    _insert(conn, cursor, value)
+    cursor.raw.execute('ROLLBACK')  # seperti SQLITE_FULL / IOERR: SQLite sendiri mengakhiri transaksi
+    raise ValueError(value)
+
+
+def _stray_commit(conn, cursor, value):
+    _insert(conn, cursor, value)
+    conn.commit()
+
+
+@pytest.mark.parametrize('broken', [_end_transaction_then_raise, _stray_commit])
+def test_job_that_ends_the_transaction_fails_its_batch_without_killing_the_writer(db, broken):
+    writer = SQLiteWriter(batch_size=10, linger_ms=200)
+    futures = [writer.submit(_insert, 'a'), writer.submit(broken, 'x'), writer.submit(_insert, 'c')]
+    for future in futures:
+        with pytest.raises((ValueError, sqlite3.Error)):
+            future.result(5)  # tidak ada caller yang menunggu selamanya
+    assert writer.write(_insert, 'after') == 'after'  # thread tetap hidup, koneksi dibuka ulang
+    writer.stop()
+    assert 'after' in _lease_names(db) and 'c' not in _lease_names(db)
+
+
+def test_writer_survives_a_database_that_cannot_be_opened(db, monkeypatch):
+    writer = SQLiteWriter()
+    real_open = db_handler._open_sqlite
+    monkeypatch.setattr(db_handler, '_open_sqlite', lambda: (_ for _ in ()).throw(sqlite3.OperationalError('unable to open database file')))
+    with pytest.raises(sqlite3.OperationalError, match='unable to open'):
+        writer.write(_insert, 'a')
+    monkeypatch.setattr(db_handler, '_open_sqlite', real_open)
+    assert writer.write(_insert, 'b') == 'b'
+    writer.stop()
+    assert _lease_names(db) == ['b']
+
+
+def test_write_gives_up_after_the_timeout_and_cancels_the_queued_job(db, monkeypatch):
+    monkeypatch.setattr(db_handler, 'DB_SQLITE_WRITE_TIMEOUT', 0.2)
+    writer = SQLiteWriter(batch_size=1, linger_ms=0)
+    release = threading.Event()
+    blocker = writer.submit(lambda conn, cursor: release.wait(5))
+    with pytest.raises(FutureTimeoutError):
+        writer.write(_insert, 'late')
+    release.set()
+    blocker.result(5)
+    assert writer.write(_insert, 'next') == 'next'
+    writer.stop()
+    assert _lease_names(db) == ['next']  # job yang timeout tidak pernah jalan
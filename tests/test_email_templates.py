@@ -0,0 +1,64 @@
+import pytest
+
+from email_templates import EmailTemplate, TemplateError, email_templates, html_to_text, SAMPLE_VALUES
+
+
+def _template(source, subject='Hi {{ name }}', directory=None):
+    return EmailTemplate('t', subject, source, directory) if directory else EmailTemplate('t', subject, source)
+
+
+def test_variables_are_escaped_in_html_but_not_in_text_or_subject():
+    subject, html_body, text_body = _template('<p>Halo {{ name }}</p>').render(name='Budi <&> "W"')
+    assert subject == 'Hi Budi <&> "W"'
+    assert html_body == b'<p>Halo Budi &lt;&amp;&gt; &quot;W&quot;</p>'
+    assert text_body == b'Halo Budi <&> "W"\n'
+
+
+def test_sections_render_only_for_truthy_values():
+    template = _template('<p>A{{# promo }}<b>{{ promo }}</b>{{/ promo }}B</p>')
+    for empty in ('', None, 0):
+        assert template.render(name='x', promo=empty)[1] == b'<p>AB</p>'
+    assert template.render(name='x', promo='HEMAT10')[1] == b'<p>A<b>HEMAT10</b>B</p>'
+
+
+def test_none_renders_as_empty_not_the_string_none():
+    assert _template('<p>[{{ code }}]</p>').render(name=None, code=None) == ('Hi ', b'<p>[]</p>', b'[]\n')
+
+
+def test_partials_are_resolved_at_compile_time(tmp_path):
+    (tmp_path / '_sig.html').write_text('<p>Salam, {{ team }}</p>', encoding='utf-8')
+    template = _template('<p>Halo</p>{{> _sig }}', directory=str(tmp_path))
+    assert template.variables == {'name', 'team'}
+    assert template.render(name='x', team='Admin')[1] == b'<p>Halo</p><p>Salam, Admin</p>'
+    with pytest.raises(TemplateError, match='partial not found'):
+        _template('{{> _missing }}', directory=str(tmp_path))
+
+
+@pytest.mark.parametrize('source', ['{{# a }}open', '{{/ a }}', '{{# a }}{{# b }}{{/ a }}{{/ b }}'])
+def test_unbalanced_sections_fail_at_compile_time(source):
+    with pytest.raises(TemplateError):
+        _template(source)
+
+
+def test_missing_value_is_reported_before_rendering():
+    template = _template('<p>{{ a }} {{ b }}</p>')
+    with pytest.raises(TemplateError, match='missing a, b'):
+        template.render(name='x')
+    with pytest.raises(TemplateError, match='missing b'):
+        template.message('bot@example.com', 'm@example.com', name='x', a=1)
+
+
+def test_plaintext_alternative_keeps_links_and_drops_styles():
+    text = html_to_text('<html><head><style>p {color: red}</style></head>'
+                        '<body><p>Bayar <a href="https://pay.example/{{ id }}">di sini</a></p><br><p>Terima kasih</p></body></html>')
+    assert text == 'Bayar di sini (https://pay.example/{{ id }})\n\nTerima kasih\n'
+
+
+@pytest.mark.parametrize('name', sorted(email_templates))
+def test_shipped_templates_render_with_sample_values(name):
+    template = email_templates[name]
+    assert template.variables <= set(SAMPLE_VALUES)
+    subject, html_body, text_body = template.render(**SAMPLE_VALUES)
+    assert subject and b'{{' not in html_body and b'{{' not in text_body
+    raw = template.message('bot@example.com', 'member@example.com', **SAMPLE_VALUES).as_bytes()
+    assert raw.isascii()  # header RFC 2047 + body base64: aman tanpa 8BITMIME
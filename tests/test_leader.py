@@ -0,0 +1,64 @@
+import asyncio
+import time
+
+from leader import LeaderElection
+
+
+def _holder(db, name='scheduler'):
+    row = db.execute('SELECT holder FROM leader_leases WHERE name = ?', (name,), fetch_one=True, commit=False)
+    return row[0] if row else None
+
+
+def test_second_replica_is_refused_while_the_lease_is_valid(db):
+    first, second = LeaderElection(lease_seconds=30), LeaderElection(lease_seconds=30)
+    assert first.try_acquire()
+    assert not second.try_acquire()
+    assert first.try_acquire()  # renew oleh pemegang lease sendiri
+    assert _holder(db) == first.identity
+
+
+def test_standby_takes_over_after_the_lease_expires(db):
+    first, second = LeaderElection(lease_seconds=0.1), LeaderElection(lease_seconds=30)
+    assert first.try_acquire()
+    assert not second.try_acquire()
+    time.sleep(0.15)  # leader lama berhenti renew
+    assert second.try_acquire()
+    assert not first.try_acquire()
+    assert _holder(db) == second.identity
+
+
+def test_release_frees_the_lease_only_for_its_holder(db):
+    first, second = LeaderElection(lease_seconds=30), LeaderElection(lease_seconds=30)
+    assert first.try_acquire()
+    second.release()  # bukan pemegang lease → tidak menghapus apa-apa
+    assert _holder(db) == first.identity
+    first.release()
+    assert _holder(db) is None
+    assert second.try_acquire()
+
+
+def test_run_demotes_when_another_replica_holds_the_lease(db):
+    election = LeaderElection(lease_seconds=30, renew_seconds=0.01)
+    events = []
+
+    async def scenario():
+        elected, demoted = asyncio.Event(), asyncio.Event()
+
+        async def on_elected():
+            events.append('elected')
+            elected.set()
+
+        async def on_demoted():
+            events.append('demoted')
+            demoted.set()
+
+        task = asyncio.create_task(election.run(on_elected, on_demoted))
+        await asyncio.wait_for(elected.wait(), 5)
+        db.execute('UPDATE leader_leases SET holder = ? WHERE name = ?', ('other-replica', 'scheduler'))
+        await asyncio.wait_for(demoted.wait(), 5)
+        task.cancel()
+
+    asyncio.run(scenario())
+    assert events == ['elected', 'demoted']
+    assert election.stats()['elections'] == 1 and election.stats()['demotions'] == 1
+    assert not election.is_leader
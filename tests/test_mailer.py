@@ -0,0 +1,90 @@
+from email.header import decode_header, make_header
+
+import pytest
+
+from email_templates import email_templates, SAMPLE_VALUES
+from mailer import Mailer, LocalSMTPServer
+
+
+@pytest.fixture
+def smtp_server():
+    servers = []
+
+    def start(drop_after=0):
+        server = LocalSMTPServer(port=0, drop_after=drop_after)
+        servers.append(server)
+        return server, server.start()
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def _welcome(to, **values):
+    return email_templates['welcome'].message('bot@example.com', to, **dict(SAMPLE_VALUES, **values))
+
+
+def _mailer(port, pool_size=1):
+    return Mailer('bot@example.com', 'secret', host='127.0.0.1', port=port, use_ssl=False,
+                  pool_size=pool_size, timeout=5, max_retries=2)
+
+
+def test_pooled_sessions_deliver_backlog_without_reconnecting(smtp_server):
+    server, port = smtp_server()
+    mailer = _mailer(port, pool_size=2)
+    futures = [mailer.send(_welcome(f'member{i}@example.com')) for i in range(10)]
+    assert all(future.result(timeout=10) for future in futures)
+    stats = mailer.stats()
+    mailer.stop()
+    assert stats['sent'] == 10
+    assert stats['connects'] <= 2  # satu login per sesi, bukan per email
+    assert sorted(recipients[0] for _, recipients, _ in server.messages) == sorted(
+        f'member{i}@example.com' for i in range(10))
+
+
+def test_dropped_session_reconnects_and_delivers(smtp_server):
+    server, port = smtp_server(drop_after=1)
+    mailer = _mailer(port)
+    futures = [mailer.send(_welcome(f'member{i}@example.com')) for i in range(3)]
+    assert all(future.result(timeout=10) for future in futures)
+    stats = mailer.stats()
+    mailer.stop()
+    assert len(server.messages) == 3
+    assert stats['connects'] == 3
+    assert stats['retried'] == 2
+    assert stats['failed'] == 0
+
+
+def test_message_is_multipart_alternative_with_encoded_subject(smtp_server):
+    server, port = smtp_server()
+    mailer = _mailer(port)
+    assert mailer.send(_welcome('budi@example.com')).result(timeout=10)
+    mailer.stop()
+    _, _, msg = server.messages[0]
+    subject = str(make_header(decode_header(msg['Subject'])))
+    assert subject == email_templates['welcome'].render(**SAMPLE_VALUES)[0]
+    assert msg.get_content_type() == 'multipart/alternative'
+    parts = msg.get_payload()
+    assert [part.get_content_type() for part in parts] == ['text/plain', 'text/html']
+    html_body = parts[1].get_payload(decode=True).decode('utf-8')
+    assert 'Budi &lt;Warrior&gt;' in html_body
+    assert 'Budi <Warrior>' in parts[0].get_payload(decode=True).decode('utf-8')
+
+
+def test_non_ascii_subject_uses_rfc2047_words():
+    raw = _welcome('budi@example.com').as_bytes()
+    header = raw.split(b'\r\n\r\n', 1)[0].decode('ascii')
+    subject_line = header.split('\r\nFrom:', 1)[0]
+    subject = email_templates['welcome'].render(**SAMPLE_VALUES)[0]  # diawali emoji
+    assert '=?utf-8?b?' in subject_line
+    assert str(make_header(decode_header(subject_line[len('Subject: '):].replace('\r\n ', ' ')))) == subject
+
+
+def test_missing_referral_code_is_not_rendered_as_none():
+    _, html_body, text_body = email_templates['welcome'].render(**dict(SAMPLE_VALUES, referral_code=None))
+    assert b'None' not in html_body
+    assert b'None' not in text_body
+    assert b'Kode Referral' not in html_body
+    _, html_body, _ = email_templates['welcome'].render(**SAMPLE_VALUES)
+    assert b'Kode Referral' in html_body and b'ANALYST10' in html_body
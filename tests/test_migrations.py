@@ -0,0 +1,75 @@
+import sqlite3
+
+from migrations import run_migrations, _baseline_columns, _native_timestamps, MIGRATIONS
+
+
+def _table_info(path, table):
+    conn = sqlite3.connect(path)
+    try:
+        return [(row[1], row[2], row[4]) for row in conn.execute(f'PRAGMA table_info({table})')]
+    finally:
+        conn.close()
+
+
+def _legacy_database(path):
+    """Database created by the pre-migration code: baseline TEXT columns, WIB text dates"""
+    conn = sqlite3.connect(path)
+    for sql in MIGRATIONS[0][2]('sqlite', None):
+        conn.execute(sql)
+    conn.execute("INSERT INTO pending_orders (order_id, discord_id, price, created_at) VALUES ('ORD_1', '1', 1000, '2025-11-26 07:00:00')")
+    conn.execute("INSERT INTO subscriptions (order_id, discord_id, status, end_date) VALUES ('ORD_1', '1', 'active', '2025-12-26 07:00:00')")
+    conn.execute("INSERT INTO commissions (analyst_id, commission_amount, earned_date) VALUES ('9', 300, '2025-11-26 00:00:00')")
+    conn.execute("INSERT INTO trial_members (trial_code, trial_end) VALUES ('T1', '')")
+    conn.commit()
+    conn.close()
+
+
+def test_sqlite_timestamp_columns_keep_baseline_order_and_default(sqlite_path):
+    _legacy_database(sqlite_path)
+    run_migrations()
+
+    for table, column in (('pending_orders', 'created_at'), ('commissions', 'earned_date')):
+        info = _table_info(sqlite_path, table)
+        assert [name for name, _, _ in info] == [d.split()[0] for d in _baseline_columns('sqlite', table)]
+        declared, default = next((t, d) for name, t, d in info if name == column)
+        assert declared == 'INTEGER'
+        assert default is not None and 'now' in default
+
+    conn = sqlite3.connect(sqlite_path)
+    try:
+        # WIB text → epoch UTC; earned_date lama ditulis CURRENT_TIMESTAMP (UTC)
+        assert conn.execute("SELECT created_at FROM pending_orders").fetchone()[0] == 1764115200
+        assert conn.execute("SELECT end_date FROM subscriptions").fetchone()[0] == 1766707200
+        assert conn.execute("SELECT earned_date FROM commissions").fetchone()[0] == 1764115200
+        assert conn.execute("SELECT trial_end FROM trial_members").fetchone()[0] is None
+        # Default tetap jalan tanpa nilai eksplisit
+        conn.execute("INSERT INTO commissions (analyst_id, commission_amount) VALUES ('9', 1)")
+        assert conn.execute("SELECT earned_date FROM commissions WHERE commission_amount = 1").fetchone()[0] > 0
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        assert {'idx_pending_orders_status_created', 'idx_subscriptions_active_end_date',
+                'idx_trial_members_active_trial_end', 'idx_commissions_analyst_status'} <= indexes
+    finally:
+        conn.close()
+
+
+def test_sqlite_conversion_skips_converted_tables(db, sqlite_path):
+    conn = sqlite3.connect(sqlite_path)
+    try:
+        columns_of = lambda table: {row[1]: row[2].upper() for row in conn.execute(f'PRAGMA table_info({table})')}
+        assert _native_timestamps('sqlite', columns_of) == []
+    finally:
+        conn.close()
+
+
+def test_postgres_conversion_depends_on_column_type():
+    types = {'subscriptions': 'text', 'pending_orders': 'timestamp with time zone',
+             'trial_members': 'timestamp without time zone', 'commissions': 'character varying'}
+    columns = {'subscriptions': 'end_date', 'pending_orders': 'created_at',
+               'trial_members': 'trial_end', 'commissions': 'earned_date'}
+    steps = _native_timestamps('postgres', lambda table: {columns[table]: types[table]})
+
+    assert not any('pending_orders' in sql for sql in steps)  # sudah TIMESTAMPTZ
+    assert any("NULLIF(end_date, '')::timestamp AT TIME ZONE 'Asia/Jakarta'" in sql for sql in steps)
+    assert any("USING (trial_end AT TIME ZONE 'Asia/Jakarta')" in sql for sql in steps)
+    assert any("NULLIF(earned_date, '')::timestamp AT TIME ZONE 'UTC'" in sql for sql in steps)
+    assert 'ALTER TABLE commissions ALTER COLUMN earned_date SET DEFAULT now()' in steps
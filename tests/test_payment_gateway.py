@@ -0,0 +1,124 @@
+import time
+import socket
+import asyncio
+
+import pytest
+
+import payment_gateway
+from payment_gateway import MidtransSnap, LocalSnapServer, CircuitBreaker, PaymentGatewayError, GatewayUnavailable
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _payload(order_id='ORD_1', amount=150000):
+    return {'transaction_details': {'order_id': order_id, 'gross_amount': amount}}
+
+
+def _with_stand_in(scenario, **server_kwargs):
+    """Run scenario(client, stand_in) on one loop against LocalSnapServer on a free port"""
+    async def main():
+        port = _free_port()
+        stand_in = LocalSnapServer('127.0.0.1', port, **server_kwargs)
+        await stand_in.start()
+        client = MidtransSnap('test-key', f'http://127.0.0.1:{port}/snap/v1', timeout=2, max_retries=2)
+        try:
+            return await scenario(client, stand_in)
+        finally:
+            await client.close()
+            await stand_in.stop()
+    return asyncio.run(main())
+
+
+def test_create_transaction_returns_token_and_redirect_url():
+    async def scenario(client, stand_in):
+        return await client.create_transaction(_payload()), stand_in
+
+    body, stand_in = _with_stand_in(scenario)
+    assert body['token'] and body['redirect_url'].endswith(body['token'])
+    assert stand_in.requests == 1
+
+
+def test_slow_gateway_is_cut_off_at_the_call_deadline(monkeypatch):
+    monkeypatch.setattr(payment_gateway, 'MIDTRANS_ATTEMPT_TIMEOUT', 0.2)
+
+    async def scenario(client, stand_in):
+        client.timeout = 0.5
+        started = time.monotonic()
+        with pytest.raises(PaymentGatewayError, match='tidak merespons'):
+            await client.create_transaction(_payload())
+        return time.monotonic() - started, client.stats()
+
+    elapsed, stats = _with_stand_in(scenario, latency_ms=1000)
+    assert elapsed < 0.9  # deadline total, bukan (retry + 1) x latency gateway
+    assert stats['failed'] == 1
+
+
+def test_retry_after_outage_reuses_the_order_id_and_creates_one_transaction():
+    async def scenario(client, stand_in):
+        first = asyncio.create_task(client.create_transaction(_payload('ORD_RETRY')))
+        await asyncio.sleep(0.05)
+        stand_in.fail_rate = 0.0  # gateway pulih saat client sedang backoff
+        body = await first
+        again = await client.create_transaction(_payload('ORD_RETRY'))  # kirim ulang (mis. retry caller)
+        return body, again, stand_in, client.stats()
+
+    body, again, stand_in, stats = _with_stand_in(scenario, fail_rate=1.0)
+    assert stats['retried'] >= 1
+    assert again == body  # Idempotency-Key = order_id → jawaban yang sama
+    assert list(stand_in.transactions) == ['ORD_RETRY']
+
+
+def test_rejected_payload_is_not_retried_and_does_not_open_the_breaker():
+    async def scenario(client, stand_in):
+        client.breaker = CircuitBreaker(threshold=1, cooldown=60)
+        with pytest.raises(PaymentGatewayError, match='HTTP 400'):
+            await client.create_transaction({'transaction_details': {}})
+        return stand_in.requests, client.breaker.state
+
+    assert _with_stand_in(scenario) == (1, 'closed')
+
+
+def test_breaker_opens_fails_fast_and_recovers_through_half_open():
+    async def scenario(client, stand_in):
+        client.max_retries = 0
+        client.breaker = CircuitBreaker(threshold=2, cooldown=0.3)
+        for i in range(2):
+            with pytest.raises(PaymentGatewayError):
+                await client.create_transaction(_payload(f'ORD_DOWN_{i}'))
+        assert client.breaker.state == 'open' and not client.available()
+
+        sent = stand_in.requests
+        with pytest.raises(GatewayUnavailable):
+            await client.create_transaction(_payload('ORD_FAST'))
+        assert stand_in.requests == sent  # fail fast: tidak ada request ke gateway
+
+        await asyncio.sleep(0.35)
+        assert client.breaker.state == 'half_open'
+        with pytest.raises(PaymentGatewayError):
+            await client.create_transaction(_payload('ORD_PROBE_FAIL'))  # probe gagal → open lagi
+        assert client.breaker.state == 'open'
+
+        await asyncio.sleep(0.35)
+        stand_in.fail_rate = 0.0
+        body = await client.create_transaction(_payload('ORD_PROBE_OK'))
+        return body, client.breaker.state, client.stats()
+
+    body, state, stats = _with_stand_in(scenario, fail_rate=1.0)
+    assert body['token']
+    assert state == 'closed'
+    assert (stats['trips'], stats['rejected_open']) == (2, 1)
+
+
+def test_half_open_allows_a_single_probe():
+    breaker = CircuitBreaker(threshold=1, cooldown=0)
+    breaker.failure()
+    assert breaker.allow() is True
+    assert breaker.allow() is False  # probe pertama belum selesai
+    breaker.abandon()
+    assert breaker.allow() is True
+    breaker.success()
+    assert breaker.state == 'closed'
@@ -0,0 +1,53 @@
+import time
+import asyncio
+import threading
+
+from scheduler import DeadlineScheduler
+
+
+def test_due_keys_are_batched_per_kind_and_stale_entries_skipped():
+    scheduler = DeadlineScheduler()
+    now = time.time()
+    scheduler.schedule('expiry', 'A', now - 2)
+    scheduler.schedule('expiry', 'B', now - 1)
+    scheduler.schedule('expiry', 'C', now - 1)
+    scheduler.schedule('expiry', 'C', now + 60)  # diundur - entry lama di heap diabaikan
+    scheduler.schedule('warning', 'A', now - 1)
+    scheduler.cancel('warning', 'A')
+    scheduler.schedule('timeout', 'D', None)  # None = cancel
+    assert scheduler._pop_due(now) == {'expiry': ['A', 'B']}
+    assert scheduler._next_due() == now + 60
+    assert scheduler.stats()['pending'] == {'expiry': 1}
+
+
+def test_run_fires_handlers_on_time_and_retries_failures():
+    scheduler = DeadlineScheduler(resync_interval=3600, retry_delay=0.05)
+    fired, attempts = [], []
+
+    async def expire(keys):
+        fired.append((keys, time.time()))
+
+    async def flaky(keys):
+        attempts.append(keys)
+        if len(attempts) == 1:
+            raise RuntimeError('discord down')
+
+    scheduler.register('expiry', expire, loader=lambda: [('loaded', time.time())])
+    scheduler.register('warning', flaky)
+
+    async def scenario():
+        task = asyncio.create_task(scheduler.run())
+        await asyncio.sleep(0.01)
+        due = time.time() + 0.1
+        # Dijadwal dari thread lain (webhook Flask) - harus membangunkan task yang sedang tidur
+        threading.Thread(target=scheduler.schedule, args=('expiry', 'late', due)).start()
+        scheduler.schedule('warning', 'W', time.time())
+        await asyncio.sleep(0.3)
+        task.cancel()
+        return due
+
+    due = asyncio.run(scenario())
+    assert [keys for keys, _ in fired] == [['loaded'], ['late']]
+    assert 0 <= fired[1][1] - due < 0.1
+    assert attempts == [['W'], ['W']]
+    assert scheduler.active is False
@@ -0,0 +1,82 @@
+import pytest
+
+from db_handler import translate_sql, is_read_query, normalize_sql, tokenize_sql
+
+
+def pg(query, has_params=True, numbered=False):
+    return translate_sql(query, 'postgres', has_params, numbered)
+
+
+def test_sqlite_queries_pass_through_unchanged():
+    query = 'SELECT * FROM subscriptions WHERE status = "active" AND discord_id = ?'
+    assert translate_sql(query, 'sqlite') is query
+
+
+def test_placeholders_outside_literals_and_comments_are_rewritten():
+    query = "SELECT * FROM t WHERE note = 'why?' /* ? */ AND id = ? -- ?\n AND code = ?"
+    assert pg(query) == "SELECT * FROM t WHERE note = 'why?' /* ? */ AND id = %s -- ?\n AND code = %s"
+    assert pg(query, numbered=True) == "SELECT * FROM t WHERE note = 'why?' /* ? */ AND id = $1 -- ?\n AND code = $2"
+
+
+def test_double_quoted_strings_become_string_literals():
+    assert pg('UPDATE subscriptions SET status = "expired" WHERE note = "it\'s ""x"""') == \
+        "UPDATE subscriptions SET status = 'expired' WHERE note = 'it''s \"x\"'"
+
+
+@pytest.mark.parametrize('has_params, expected', [
+    (True, "SELECT 1 FROM t WHERE code LIKE '%%10%%'"),
+    (False, "SELECT 1 FROM t WHERE code LIKE '%10%'"),
+])
+def test_percent_signs_are_escaped_only_when_psycopg2_formats(has_params, expected):
+    assert pg("SELECT 1 FROM t WHERE code LIKE '%10%'", has_params) == expected
+
+
+def test_insert_or_replace_becomes_upsert_on_the_table_key():
+    assert pg('INSERT OR REPLACE INTO pending_orders (order_id, price) VALUES (?, ?)') == \
+        'INSERT INTO pending_orders (order_id, price) VALUES (%s, %s) ON CONFLICT (order_id) DO UPDATE SET price = EXCLUDED.price'
+
+
+def test_upsert_clause_goes_before_returning_and_trailing_semicolon():
+    assert pg('INSERT OR REPLACE INTO packages (package_id) VALUES (?) RETURNING package_id;') == \
+        'INSERT INTO packages (package_id) VALUES (%s) ON CONFLICT (package_id) DO NOTHING RETURNING package_id;'
+
+
+def test_insert_or_ignore_becomes_on_conflict_do_nothing():
+    assert pg('INSERT OR IGNORE INTO anything (a) VALUES (?)') == 'INSERT INTO anything (a) VALUES (%s) ON CONFLICT DO NOTHING'
+
+
+def test_insert_or_replace_without_known_key_is_an_error():
+    with pytest.raises(ValueError, match='TABLE_KEYS'):
+        pg('INSERT OR REPLACE INTO unknown_table (a) VALUES (?)')
+
+
+def test_autoincrement_becomes_serial():
+    assert pg('CREATE TABLE t (id INTEGER PRIMARY KEY AUTOINCREMENT, v TEXT)', False) == \
+        'CREATE TABLE t (id SERIAL PRIMARY KEY, v TEXT)'
+
+
+def test_translation_is_memoized():
+    query = 'SELECT * FROM packages WHERE package_id = ?'
+    assert pg(query) is pg(query)
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('SELECT 1', True),
+    ('  -- komentar\n select * from t', True),
+    ('WITH x AS (SELECT 1) SELECT * FROM x', True),
+    ('WITH x AS (SELECT 1) DELETE FROM t WHERE id IN (SELECT * FROM x)', False),
+    ('UPDATE t SET a = 1', False),
+    ("INSERT INTO t VALUES ('SELECT')", False),
+    ('', False),
+])
+def test_is_read_query(query, expected):
+    assert is_read_query(query) is expected
+
+
+def test_normalize_sql_folds_literals_and_in_lists():
+    assert normalize_sql("SELECT *\n  FROM t WHERE a = 'x' AND b = 42 AND c IN (?, ?, ?) -- note") == \
+        'SELECT * FROM t WHERE a = ? AND b = ? AND c IN (?)'
+
+
+def test_tokenizer_keeps_escaped_quotes_inside_literals():
+    assert [kind for kind, _ in tokenize_sql("'it''s' ?")] == ['str', 'ws', 'param']
@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+
+class Rejected(Exception):
+    pass
+
+
+def _count(db, order_id):
+    return db.execute('SELECT COUNT(*) FROM pending_orders WHERE order_id = ?', (order_id,), fetch_one=True, commit=False)[0]
+
+
+def _insert(tx, order_id):
+    tx.defer('INSERT INTO pending_orders (order_id, discord_id, price) VALUES (?, ?, ?)', (order_id, '1', 1000))
+
+
+def test_after_commit_hooks_run_once_the_unit_is_committed(db):
+    fired = []
+
+    def unit(tx):
+        _insert(tx, 'ORD_OK')
+        tx.after_commit(lambda: fired.append(_count(db, 'ORD_OK')))
+        return 'done'
+
+    assert db.write_transaction(unit) == 'done'
+    assert fired == [1]  # hook melihat baris yang sudah di-commit
+
+
+def test_after_commit_hooks_are_dropped_when_the_unit_fails(db):
+    fired = []
+
+    def unit(tx):
+        _insert(tx, 'ORD_FAIL')
+        tx.after_commit(fired.append, 'scheduled')
+        tx.execute('UPDATE pending_orders SET price = 0 WHERE order_id = ?', ('ORD_FAIL',))
+        raise Rejected()
+
+    with pytest.raises(Rejected):
+        db.write_transaction(unit)
+    assert fired == []
+    assert _count(db, 'ORD_FAIL') == 0
+
+
+def test_after_commit_hooks_are_dropped_by_rollback_inside_the_unit(db):
+    fired = []
+
+    def unit(tx):
+        tx.execute('INSERT INTO pending_orders (order_id, discord_id, price) VALUES (?, ?, ?)', ('ORD_RB', '1', 1))
+        tx.after_commit(fired.append, 'scheduled')
+        tx.rollback()
+        return False
+
+    assert asyncio.run(db.awrite_transaction(unit)) is False
+    assert fired == []
+    assert _count(db, 'ORD_RB') == 0
+
+
+def test_deferred_transaction_runs_hooks_after_commit(db):
+    fired = []
+    with db.transaction() as tx:
+        _insert(tx, 'ORD_DEFER')
+        tx.after_commit(fired.append, 'scheduled')
+        assert fired == []
+    assert fired == ['scheduled']
+
+    with pytest.raises(Rejected):
+        with db.transaction() as tx:
+            _insert(tx, 'ORD_DEFER_FAIL')
+            tx.after_commit(fired.append, 'phantom')
+            raise Rejected()
+    assert fired == ['scheduled']
+    assert _count(db, 'ORD_DEFER_FAIL') == 0
@@ -0,0 +1,164 @@
+import asyncio
+import threading
+
+import pytest
+
+from outbox import Outbox
+from webhook_ingest import WebhookIngest, midtrans_signature, NOTIFICATION_KIND
+
+SERVER_KEY = 'test-server-key'
+
+
+def _notification(order_id='ORD_1', transaction_status='settlement', status_code='200'):
+    data = {'order_id': order_id, 'transaction_status': transaction_status,
+            'status_code': status_code, 'gross_amount': '150000.00'}
+    data['signature_key'] = midtrans_signature(order_id, status_code, data['gross_amount'], SERVER_KEY)
+    return data
+
+
+def _outbox_rows(db):
+    return db.execute('SELECT kind, status, attempts, last_error FROM outbox ORDER BY id', fetch_all=True, commit=False)
+
+
+def _dedup_count(db):
+    return db.execute('SELECT COUNT(*) FROM webhook_dedup', fetch_one=True, commit=False)[0]
+
+
+@pytest.fixture
+def ingest(db):
+    return WebhookIngest(Outbox(), SERVER_KEY)
+
+
+def test_valid_notification_is_committed_to_the_outbox(db, ingest):
+    assert ingest.accept(_notification()) == ({'status': 'ok'}, 200)
+    assert [row[:3] for row in _outbox_rows(db)] == [(NOTIFICATION_KIND, 'pending', 0)]
+    assert _dedup_count(db) == 1
+
+
+@pytest.mark.parametrize('data, reason', [
+    (None, 'invalid JSON body'),
+    ({'order_id': 'ORD_1', 'transaction_status': 'settlement'}, 'missing status_code, gross_amount'),
+    (dict(_notification(), signature_key='forged'), 'invalid signature'),
+])
+def test_invalid_notification_is_rejected_without_writing(db, ingest, data, reason):
+    assert ingest.accept(data) == ({'status': 'rejected', 'reason': reason}, 400)
+    assert _outbox_rows(db) == []
+    assert ingest.stats()['rejected'] == 1
+
+
+def test_resent_notification_is_answered_from_the_hot_set(db, ingest):
+    ingest.accept(_notification())
+    assert ingest.accept(_notification()) == ({'status': 'ok', 'duplicate': True}, 200)
+    stats = ingest.stats()
+    assert (stats['accepted'], stats['dedup_hot'], stats['dedup_db']) == (1, 1, 0)
+    assert len(_outbox_rows(db)) == 1
+
+
+def test_duplicate_from_another_replica_is_stopped_by_the_primary_key(db, ingest):
+    ingest.accept(_notification())
+    replica = WebhookIngest(Outbox(), SERVER_KEY)  # hot set kosong: replica lain / setelah restart
+    assert replica.accept(_notification()) == ({'status': 'ok', 'duplicate': True}, 200)
+    assert asyncio.run(replica.aaccept(_notification())) == ({'status': 'ok', 'duplicate': True}, 200)
+    assert replica.stats()['dedup_db'] == 1 and replica.stats()['dedup_hot'] == 1
+    assert len(_outbox_rows(db)) == 1
+    assert _dedup_count(db) == 1
+
+
+def test_new_status_for_the_same_order_is_a_new_notification(db, ingest):
+    ingest.accept(_notification(transaction_status='pending', status_code='201'))
+    assert asyncio.run(ingest.aaccept(_notification())) == ({'status': 'ok'}, 200)
+    assert len(_outbox_rows(db)) == 2
+
+
+def test_concurrent_duplicates_record_exactly_one_row(db):
+    replicas = [WebhookIngest(Outbox(), SERVER_KEY) for _ in range(8)]
+    barrier = threading.Barrier(len(replicas))
+    results = []
+
+    def deliver(replica):
+        barrier.wait()
+        results.append(replica.accept(_notification()))
+
+    threads = [threading.Thread(target=deliver, args=(replica,)) for replica in replicas]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(status == 200 for _, status in results)
+    assert sum(1 for body, _ in results if not body.get('duplicate')) == 1
+    assert len(_outbox_rows(db)) == 1
+
+
+def _enqueue(db, outbox, kind, count=1):
+    with db.transaction() as tx:
+        for i in range(count):
+            outbox.enqueue(tx, kind, {'n': i})
+
+
+def test_outbox_rows_are_handled_once_and_marked_done(db):
+    outbox = Outbox()
+    seen = []
+
+    async def handler(payload):
+        seen.append(payload['n'])
+
+    outbox.register('job', handler)
+    _enqueue(db, outbox, 'job', count=3)
+    assert asyncio.run(outbox.drain_once()) == 3
+    assert asyncio.run(outbox.drain_once()) == 0  # sudah done, tidak diklaim lagi
+    assert sorted(seen) == [0, 1, 2]
+    assert [row[1] for row in _outbox_rows(db)] == ['done'] * 3
+
+
+def test_concurrent_workers_never_claim_the_same_row(db):
+    outbox, other = Outbox(batch_size=5), Outbox(batch_size=5)
+    seen = []
+
+    async def handler(payload):
+        await asyncio.sleep(0)
+        seen.append(payload['n'])
+
+    for worker in (outbox, other):
+        worker.register('job', handler)
+    _enqueue(db, outbox, 'job', count=20)
+
+    async def drain():
+        total = 0
+        while True:
+            claimed = sum(await asyncio.gather(outbox.drain_once(), other.drain_once()))
+            if not claimed:
+                return total
+            total += claimed
+
+    assert asyncio.run(drain()) == 20
+    assert sorted(seen) == list(range(20))
+
+
+def test_failed_row_is_retried_then_dead(db):
+    outbox = Outbox(max_attempts=2)
+    calls = []
+
+    async def handler(payload):
+        calls.append(payload)
+        raise RuntimeError('smtp down')
+
+    outbox.register('job', handler)
+    _enqueue(db, outbox, 'job')
+    assert asyncio.run(outbox.drain_once()) == 1
+    status, attempts, error = _outbox_rows(db)[0][1:]
+    assert (status, attempts, error) == ('pending', 1, 'RuntimeError: smtp down')
+    assert asyncio.run(outbox.drain_once()) == 0  # backoff: belum jatuh tempo
+
+    db.execute('UPDATE outbox SET next_attempt_at = 0')
+    assert asyncio.run(outbox.drain_once()) == 1
+    assert _outbox_rows(db)[0][1:3] == ('dead', 2)
+    assert (outbox.retried, outbox.dead, len(calls)) == (1, 1, 2)
+
+
+def test_rolled_back_transaction_leaves_no_outbox_row(db):
+    outbox = Outbox()
+    with pytest.raises(RuntimeError):
+        with db.transaction() as tx:
+            outbox.enqueue(tx, 'job', {'n': 1})
+            raise RuntimeError('checkout failed')
+    assert _outbox_rows(db) == []
@@ -0,0 +1,54 @@
+import asyncio
+import socket
+
+import aiohttp
+
+from outbox import Outbox
+from webhook_ingest import WebhookIngest, midtrans_signature
+from webhook_server import WebhookServer, local_url
+
+SERVER_KEY = 'test-server-key'
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def test_local_url_maps_wildcard_binds_to_loopback():
+    assert local_url('/', '0.0.0.0', 5000) == 'http://127.0.0.1:5000/'
+    assert local_url('/webhook/midtrans', '::', 8080) == 'http://[::1]:8080/webhook/midtrans'
+    assert local_url('/', '10.0.0.2', 5001) == 'http://10.0.0.2:5001/'
+
+
+def test_server_acks_and_deduplicates_on_the_running_loop(db):
+    ingest = WebhookIngest(Outbox(), SERVER_KEY)
+    port = _free_port()
+    data = {'order_id': 'ORD_1', 'transaction_status': 'settlement', 'status_code': '200', 'gross_amount': '150000.00'}
+    data['signature_key'] = midtrans_signature('ORD_1', '200', '150000.00', SERVER_KEY)
+
+    async def scenario():
+        server = WebhookServer(ingest, '<h1>home</h1>', '127.0.0.1', port)
+        await server.start()
+        await server.start()  # on_ready bisa terpanggil lagi
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.get(local_url('/', '127.0.0.1', port)) as response:
+                    home = (response.status, await response.text())
+                answers = []
+                for body in (data, data, {'order_id': 'ORD_1'}):
+                    async with session.post(local_url('/webhook/midtrans', '127.0.0.1', port), json=body) as response:
+                        answers.append((response.status, await response.json()))
+                async with session.post(local_url('/webhook/midtrans', '127.0.0.1', port), data='not json') as response:
+                    answers.append((response.status, await response.json()))
+        finally:
+            await server.stop()
+        return home, answers
+
+    home, answers = asyncio.run(scenario())
+    assert home == (200, '<h1>home</h1>')
+    assert answers[0] == (200, {'status': 'ok'})
+    assert answers[1] == (200, {'status': 'ok', 'duplicate': True})
+    assert [status for status, _ in answers[2:]] == [400, 400]
+    assert db.execute('SELECT COUNT(*) FROM outbox', fetch_one=True, commit=False)[0] == 1
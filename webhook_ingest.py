@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Webhook Ingest - /webhook/midtrans hanya validasi, simpan notifikasi ke outbox, lalu balas 200
+Aktivasi (pending order → subscription → role/DM/email) dijalankan worker outbox di leader,
+jadi waktu ack = satu INSERT yang di-commit, bukan Discord + SMTP + beberapa query.
+Idempoten per (order_id, transaction_status, status_code): kirim ulang Midtrans dijawab 200 dari hot set
+in-memory, atau dari PK tabel webhook_dedup (replica lain / setelah restart), tanpa baris outbox baru.
+
+Usage: python3 webhook_ingest.py bench [--requests 2000] [--threads 8]
+"""
+import os
+import sys
+import time
+import hashlib
+import sqlite3
+import argparse
+import threading
+from collections import deque, OrderedDict
+
+import psycopg2
+
+from db_handler import Database
+
+WEBHOOK_ACK_TARGET_MS = float(os.getenv('WEBHOOK_ACK_TARGET_MS', '50'))  # target p99 waktu ack
+WEBHOOK_LATENCY_WINDOW = int(os.getenv('WEBHOOK_LATENCY_WINDOW', '2048'))  # sampel terakhir untuk p50/p99
+WEBHOOK_VERIFY_SIGNATURE = os.getenv('WEBHOOK_VERIFY_SIGNATURE', '1') == '1'  # cek signature_key Midtrans
+WEBHOOK_DEDUP_HOT_SIZE = int(os.getenv('WEBHOOK_DEDUP_HOT_SIZE', '10000'))  # kunci terakhir yang diingat in-memory
+WEBHOOK_DEDUP_RETENTION_DAYS = float(os.getenv('WEBHOOK_DEDUP_RETENTION_DAYS', '30'))  # baris webhook_dedup dihapus setelah ini
+
+NOTIFICATION_KIND = 'midtrans_notification'  # kind baris outbox yang diproses handler aktivasi
+REQUIRED_FIELDS = ('order_id', 'transaction_status', 'status_code', 'gross_amount')
+DEDUP_INSERT_SQL = 'INSERT INTO webhook_dedup (order_id, transaction_status, status_code, received_at) VALUES (?, ?, ?, ?)'
+
+
+def midtrans_signature(order_id, status_code, gross_amount, server_key):
+    """SHA512(order_id + status_code + gross_amount + server key) - sama dengan signature_key dari Midtrans"""
+    return hashlib.sha512(f"{order_id}{status_code}{gross_amount}{server_key}".encode()).hexdigest()
+
+
+class LatencyWindow:
+    """Exact percentiles over the last `size` samples (thread-safe)"""
+
+    def __init__(self, size=WEBHOOK_LATENCY_WINDOW, target_ms=WEBHOOK_ACK_TARGET_MS):
+        self.target_ms = target_ms
+        self._samples = deque(maxlen=max(1, size))
+        self._lock = threading.Lock()
+        self.count = 0
+        self.over_target = 0
+        self.max_ms = 0.0
+
+    def record(self, ms):
+        with self._lock:
+            self._samples.append(ms)
+            self.count += 1
+            self.max_ms = max(self.max_ms, ms)
+            if ms > self.target_ms:
+                self.over_target += 1
+
+    def stats(self):
+        with self._lock:
+            samples = sorted(self._samples)
+        pick = lambda pct: round(samples[min(len(samples) - 1, int(len(samples) * pct / 100))], 2) if samples else 0.0
+        return {
+            'count': self.count,
+            'p50_ms': pick(50),
+            'p99_ms': pick(99),
+            'max_ms': round(self.max_ms, 2),
+            'target_ms': self.target_ms,
+            'over_target': self.over_target,
+        }
+
+
+def dedup_key(data):
+    return str(data['order_id']), str(data['transaction_status']), str(data['status_code'])
+
+
+class HotSet:
+    """Bounded LRU set of recently seen keys (thread-safe)"""
+
+    def __init__(self, size=WEBHOOK_DEDUP_HOT_SIZE):
+        self.size = max(1, size)
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            if key in self._keys:
+                self._keys.move_to_end(key)
+                return True
+            return False
+
+    def add(self, key):
+        with self._lock:
+            self._keys[key] = None
+            self._keys.move_to_end(key)
+            if len(self._keys) > self.size:
+                self._keys.popitem(last=False)
+
+    def __len__(self):
+        return len(self._keys)
+
+
+class WebhookIngest:
+    """accept(data) / await aaccept(data) → (body, http status); notifikasi valid di-commit sebagai baris outbox sebelum 200"""
+
+    def __init__(self, outbox, server_key, verify_signature=WEBHOOK_VERIFY_SIGNATURE):
+        self.outbox = outbox
+        self.server_key = server_key
+        self.verify_signature = verify_signature and bool(server_key)
+        self.latency = LatencyWindow()
+        self.seen = HotSet()
+        self.accepted = 0
+        self.dedup_hot = 0  # duplikat dijawab dari memory (tanpa query)
+        self.dedup_db = 0  # duplikat ditolak PK webhook_dedup
+        self.rejected = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def _count(self, field):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def validate(self, data):
+        """Error message, or None when the notification is well-formed (and signed by our server key)"""
+        if not isinstance(data, dict):
+            return 'invalid JSON body'
+        missing = [field for field in REQUIRED_FIELDS if not data.get(field)]
+        if missing:
+            return f"missing {', '.join(missing)}"
+        if self.verify_signature:
+            expected = midtrans_signature(data['order_id'], data['status_code'], data['gross_amount'], self.server_key)
+            if data.get('signature_key') != expected:
+                return 'invalid signature'
+        return None
+
+    def record(self, data):
+        """Durably store the notification - returns after commit, False kalau kunci sudah pernah dicatat"""
+        order_id, transaction_status, status_code = dedup_key(data)
+        try:
+            # Satu transaksi: baris dedup + baris outbox; PK bentrok → keduanya batal
+            with Database.transaction() as tx:
+                tx.defer(DEDUP_INSERT_SQL, (order_id, transaction_status, status_code, time.time()))
+                self.outbox.enqueue(tx, NOTIFICATION_KIND, data)
+        except (sqlite3.IntegrityError, psycopg2.IntegrityError):
+            return False
+        self.outbox.wakeup()
+        return True
+
+    def purge(self):
+        """Hapus kunci dedup lama - blocking (didaftarkan ke outbox.register_cleanup)"""
+        cutoff = time.time() - WEBHOOK_DEDUP_RETENTION_DAYS * 86400
+        Database.execute('DELETE FROM webhook_dedup WHERE received_at < ?', (cutoff,))
+
+    async def arecord(self, data):
+        """record() for the event loop - di SQLite langsung ke writer thread, tanpa thread executor"""
+        order_id, transaction_status, status_code = dedup_key(data)
+        try:
+            async with Database.atransaction() as tx:
+                tx.defer(DEDUP_INSERT_SQL, (order_id, transaction_status, status_code, time.time()))
+                self.outbox.enqueue(tx, NOTIFICATION_KIND, data)
+        except (sqlite3.IntegrityError, psycopg2.IntegrityError):
+            return False
+        self.outbox.wakeup()
+        return True
+
+    def _screen(self, data, started):
+        """Response for invalid / hot-set duplicate notifications, None kalau harus dicatat"""
+        error = self.validate(data)
+        if error:
+            self._count('rejected')
+            print(f"⚠️ Webhook rejected: {error}")
+            return {'status': 'rejected', 'reason': error}, 400
+        key = dedup_key(data)
+        if key in self.seen:
+            # Kirim ulang yang baru saja kita terima - tanpa query sama sekali
+            self._count('dedup_hot')
+            print(f"♻️ Duplicate webhook {key} ignored (hot set)")
+            return self._ack(started, data, duplicate=True)
+        return None
+
+    def _recorded(self, data, recorded, started):
+        key = dedup_key(data)
+        self.seen.add(key)
+        if not recorded:
+            self._count('dedup_db')
+            print(f"♻️ Duplicate webhook {key} ignored (already recorded)")
+            return self._ack(started, data, duplicate=True)
+        self._count('accepted')
+        return self._ack(started, data)
+
+    def _record_failed(self, data, exc):
+        # 5xx → Midtrans mengirim ulang notifikasi nanti
+        self._count('errors')
+        print(f"❌ Webhook record failed for {data.get('order_id')}: {exc}")
+        return {'status': 'error'}, 500
+
+    def accept(self, data, started=None):
+        """Blocking (Flask thread) - returns (body, http status)"""
+        started = time.perf_counter() if started is None else started
+        response = self._screen(data, started)
+        if response is not None:
+            return response
+        try:
+            recorded = self.record(data)
+        except Exception as e:
+            return self._record_failed(data, e)
+        return self._recorded(data, recorded, started)
+
+    async def aaccept(self, data, started=None):
+        """accept() for servers running on the event loop"""
+        started = time.perf_counter() if started is None else started
+        response = self._screen(data, started)
+        if response is not None:
+            return response
+        try:
+            recorded = await self.arecord(data)
+        except Exception as e:
+            return self._record_failed(data, e)
+        return self._recorded(data, recorded, started)
+
+    def _ack(self, started, data, duplicate=False):
+        ms = (time.perf_counter() - started) * 1000
+        self.latency.record(ms)
+        if ms > self.latency.target_ms:
+            print(f"🐢 Webhook ack {ms:.1f} ms > target {self.latency.target_ms:.0f} ms ({data['order_id']})")
+        return ({'status': 'ok', 'duplicate': True} if duplicate else {'status': 'ok'}), 200
+
+    def stats(self):
+        return dict(self.latency.stats(), accepted=self.accepted, rejected=self.rejected, errors=self.errors,
+                    deduplicated=self.dedup_hot + self.dedup_db, dedup_hot=self.dedup_hot, dedup_db=self.dedup_db,
+                    hot_keys=len(self.seen))
+
+
+# ============ BENCHMARK ============
+def _bench(args):
+    """Ack latency dari accept() di thread paralel (seperti Flask threaded) ke database lokal"""
+    from migrations import run_migrations
+    from outbox import Outbox
+
+    run_migrations()
+    server_key = 'bench-server-key'
+    ingest = WebhookIngest(Outbox(), server_key)
+    run_id = int(time.time())
+
+    def notification(i):
+        data = {'order_id': f'BENCH_{run_id}_{i}', 'transaction_status': 'settlement',
+                'status_code': '200', 'gross_amount': '150000.00'}
+        data['signature_key'] = midtrans_signature(data['order_id'], data['status_code'], data['gross_amount'], server_key)
+        return data
+
+    def worker(offset):
+        for i in range(offset, args.requests, args.threads):
+            ingest.accept(notification(i))
+
+    try:
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker, args=(t,)) for t in range(args.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        # Baris bench tidak boleh tertinggal untuk worker outbox, juga kalau bench gagal / di-Ctrl+C
+        Database.execute("DELETE FROM outbox WHERE kind = ? AND payload LIKE ?", (NOTIFICATION_KIND, f'%BENCH_{run_id}_%'))
+        Database.execute('DELETE FROM webhook_dedup WHERE order_id LIKE ?', (f'BENCH_{run_id}_%',))
+
+    stats = ingest.stats()
+    print(f"\n📊 {stats['accepted']} notifications in {elapsed:.2f}s ({stats['accepted'] / elapsed:.0f}/s, {args.threads} threads)")
+    print(f"   ack p50 {stats['p50_ms']} ms, p99 {stats['p99_ms']} ms, max {stats['max_ms']} ms "
+          f"(target {stats['target_ms']:.0f} ms, {stats['over_target']} over)")
+    return 0 if stats['p99_ms'] <= stats['target_ms'] else 1
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Webhook ingest tools')
+    sub = parser.add_subparsers(dest='command', required=True)
+    bench = sub.add_parser('bench', help='measure ack latency p50/p99 against the local database')
+    bench.add_argument('--requests', type=int, default=2000)
+    bench.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+    sys.exit(_bench(args))
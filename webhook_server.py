@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Webhook Server (aiohttp) - / dan /webhook/midtrans sebagai coroutine di event loop bot
+Dipilih dengan WEBHOOK_SERVER=aiohttp; default tetap Flask di thread terpisah.
+Di mode ini notifikasi dicatat lewat WebhookIngest.aaccept (writer thread SQLite / executor DB),
+jadi tidak ada thread HTTP yang harus melompat balik ke loop discord.py.
+
+Usage: python3 webhook_server.py bench [--mode both|flask|aiohttp] [--requests 2000] [--concurrency 32]
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import threading
+
+from aiohttp import web
+
+WEBHOOK_SERVER = os.getenv('WEBHOOK_SERVER', 'flask').lower()  # 'flask' (thread) atau 'aiohttp' (loop bot)
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '5000'))
+
+
+def local_url(path='/', host=WEBHOOK_HOST, port=WEBHOOK_PORT):
+    """URL to reach our own webhook server from this process (wildcard bind → loopback)"""
+    if host in ('', '0.0.0.0'):
+        host = '127.0.0.1'
+    elif host == '::':
+        host = '::1'
+    if ':' in host:
+        host = f'[{host}]'
+    return f'http://{host}:{port}{path}'
+
+
+class WebhookServer:
+    """aiohttp app serving the home page and the Midtrans webhook on the running loop"""
+
+    def __init__(self, ingest, home_html, host=WEBHOOK_HOST, port=WEBHOOK_PORT):
+        self.ingest = ingest
+        self.home_html = home_html
+        self.host = host
+        self.port = port
+        self._runner = None
+        self.app = web.Application()
+        self.app.router.add_get('/', self._home)
+        self.app.router.add_post('/webhook/midtrans', self._midtrans)
+
+    async def start(self):
+        """Idempotent - on_ready bisa terpanggil berkali-kali"""
+        if self._runner is not None:
+            return
+        runner = web.AppRunner(self.app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, self.host, self.port).start()
+        self._runner = runner
+
+    async def stop(self):
+        runner, self._runner = self._runner, None
+        if runner is not None:
+            await runner.cleanup()
+
+    async def _home(self, request):
+        return web.Response(text=self.home_html, content_type='text/html')
+
+    async def _midtrans(self, request):
+        started = time.perf_counter()
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+        if isinstance(data, dict):
+            print(f"🔔 Webhook received: Order {data.get('order_id')} - Status {data.get('transaction_status')}")
+        body, status = await self.ingest.aaccept(data, started)
+        return web.json_response(body, status=status)
+
+
+# ============ BENCHMARK ============
+# Server dan client di proses yang sama (client di loop sendiri), database lokal yang sama untuk kedua mode.
+
+def _start_flask(ingest, port):
+    from flask import Flask, request
+    from werkzeug.serving import make_server
+
+    app = Flask('webhook_bench')
+
+    @app.route('/webhook/midtrans', methods=['POST'])
+    def midtrans_webhook():
+        started = time.perf_counter()
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):  # sama dengan route di main.py
+            print(f"🔔 Webhook received: Order {data.get('order_id')} - Status {data.get('transaction_status')}")
+        return ingest.accept(data, started)
+
+    server = make_server('127.0.0.1', port, app, threaded=True)  # sama dengan app.run(threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server.shutdown
+
+
+def _start_aiohttp(ingest, port):
+    loop = asyncio.new_event_loop()
+    server = WebhookServer(ingest, '', '127.0.0.1', port)
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    asyncio.run_coroutine_threadsafe(server.start(), loop).result()
+
+    def stop():
+        asyncio.run_coroutine_threadsafe(server.stop(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+    return stop
+
+
+async def _fire(url, notifications, concurrency):
+    import aiohttp
+
+    latencies = []
+    failures = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency)) as session:
+        async def post(data):
+            nonlocal failures
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    async with session.post(url, data=json.dumps(data),
+                                            headers={'Content-Type': 'application/json'}) as response:
+                        await response.read()
+                        if response.status != 200:
+                            failures += 1
+                except aiohttp.ClientError:
+                    failures += 1
+                latencies.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(post(data) for data in notifications))
+    return time.perf_counter() - started, sorted(latencies), failures
+
+
+def _bench_modes(args, modes, server_key, run_id, results):
+    from outbox import Outbox
+    from webhook_ingest import WebhookIngest, midtrans_signature
+
+    for mode in modes:
+        ingest = WebhookIngest(Outbox(), server_key)
+        notifications = []
+        for i in range(args.requests):
+            data = {'order_id': f'BENCH_{run_id}_{mode}_{i}', 'transaction_status': 'settlement',
+                    'status_code': '200', 'gross_amount': '150000.00'}
+            data['signature_key'] = midtrans_signature(data['order_id'], data['status_code'], data['gross_amount'], server_key)
+            notifications.append(data)
+
+        stop = (_start_flask if mode == 'flask' else _start_aiohttp)(ingest, args.port)
+        try:
+            elapsed, latencies, failures = asyncio.run(
+                _fire(f'http://127.0.0.1:{args.port}/webhook/midtrans', notifications, args.concurrency))
+        finally:
+            stop()
+        pick = lambda pct: round(latencies[min(len(latencies) - 1, int(len(latencies) * pct / 100))], 2)
+        ack = ingest.stats()
+        results[mode] = len(notifications) / elapsed
+        print(f"\n📊 {mode}: {len(notifications)} requests in {elapsed:.2f}s → {results[mode]:.0f} req/s "
+              f"({args.concurrency} concurrent, {failures} failed)")
+        print(f"   client latency p50 {pick(50)} ms, p99 {pick(99)} ms - server ack p50 {ack['p50_ms']} ms, p99 {ack['p99_ms']} ms")
+
+
+def _bench(args):
+    from db_handler import Database
+    from migrations import run_migrations
+    from webhook_ingest import NOTIFICATION_KIND
+
+    run_migrations()
+    server_key = 'bench-server-key'
+    run_id = int(time.time())
+    modes = ['flask', 'aiohttp'] if args.mode == 'both' else [args.mode]
+    results = {}
+    try:
+        _bench_modes(args, modes, server_key, run_id, results)
+    finally:
+        # Baris bench tidak boleh tertinggal untuk worker outbox, juga kalau bench gagal / di-Ctrl+C
+        Database.execute('DELETE FROM outbox WHERE kind = ? AND payload LIKE ?', (NOTIFICATION_KIND, f'%BENCH_{run_id}_%'))
+        Database.execute('DELETE FROM webhook_dedup WHERE order_id LIKE ?', (f'BENCH_{run_id}_%',))
+    if len(results) == 2:
+        print(f"\n⚡ aiohttp / flask throughput: {results['aiohttp'] / results['flask']:.2f}x")
+    return 0
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Webhook server tools')
+    sub = parser.add_subparsers(dest='command', required=True)
+    bench = sub.add_parser('bench', help='compare webhook throughput of the Flask and aiohttp modes')
+    bench.add_argument('--mode', choices=('both', 'flask', 'aiohttp'), default='both')
+    bench.add_argument('--requests', type=int, default=2000)
+    bench.add_argument('--concurrency', type=int, default=32)
+    bench.add_argument('--port', type=int, default=5099)
+    args = parser.parse_args()
+    sys.exit(_bench(args))